@@ -18,6 +18,12 @@ class Config(object):
             "ui.window_w": 640,
             "ui.window_h": 700,
             "ui.gcode_2d": False,
+            "ui.follow_interval": 1000,  # milliseconds
+            "ui.renderer": "auto",  # or "shader" or "legacy"
+            "cache.directory": None,  # defaults to ~/.cache/tatlin
+            "cache.max_size": 512,  # megabytes, 0 turns the cache off
+            "cache.hash": False,
+            "gcode.coalesce_tolerance": 0.0,  # millimeters, 0 turns it off
         }
 
         self.fname = fname
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import numpy
+
+from OpenGL.arrays.vbo import VBO
+
+from tatlin.lib import profiling
+
+
+class GrowableBuffer(object):
+    """
+    Vertex buffer object for data that grows at the end.
+
+    The data is kept in an array with room to spare. Appended and changed
+    rows are copied into the existing buffer with glBufferSubData, and the
+    whole array is only uploaded again when it runs out of room. The buffer
+    is created on the first bind, so no GL context is needed before that.
+    """
+
+    # room to reserve when the buffer grows, relative to its size
+    growth = 0.5
+
+    def __init__(self, data, usage="GL_STATIC_DRAW"):
+        # the initial data is used as is, without room to spare
+        self.array = numpy.ascontiguousarray(data)
+        self.count = len(self.array)
+        self.usage = usage
+        self.vbo = None
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def data(self):
+        return self.array[: self.count]
+
+    @property
+    def pending(self):
+        """
+        True if the next bind copies data into the buffer.
+        """
+        return (
+            self.vbo is None or not self.vbo.copied or bool(self.vbo._copy_segments)
+        )
+
+    def append(self, data):
+        self.write(self.count, data)
+
+    def write(self, start, data):
+        """
+        Replace rows from start on with data, discarding any rows after it.
+        """
+        data = numpy.asarray(data, self.array.dtype)
+        end = start + len(data)
+        if end > len(self.array) or not self.array.flags.writeable:
+            # arrays mapped from the cache are read-only and copied on write
+            capacity = max(end, int(len(self.array) * (1 + self.growth)))
+            self._reallocate(capacity, start)
+            self.array[start:end] = data
+        elif self.vbo is not None and end > start:
+            self.vbo[start:end] = data
+        else:
+            self.array[start:end] = data
+        self.count = end
+
+    def reserve(self, capacity):
+        """
+        Make room for capacity rows, so that data appended up to that size is
+        copied into the buffer without allocating it again.
+        """
+        if capacity > len(self.array):
+            self._reallocate(capacity, self.count)
+
+    def _reallocate(self, capacity, count):
+        array = numpy.zeros((capacity,) + self.array.shape[1:], self.array.dtype)
+        array[:count] = self.array[:count]
+        self.array = array
+        if self.vbo is not None:
+            # allocate a bigger buffer on the next bind
+            self.vbo.set_array(array)
+
+    def bind(self):
+        if self.vbo is None:
+            self.vbo = VBO(self.array, self.usage)
+        if not self.vbo.copied:
+            size = self.array.nbytes
+        else:
+            size = sum(segment[1] for segment in self.vbo._copy_segments)
+        if not size:
+            self.vbo.bind()
+            return
+
+        # the data, or the changed parts of it, are copied on this bind
+        with profiling.stage("gl.upload"):
+            self.vbo.bind()
+        profiling.count("uploaded_bytes", size)
+
+    def unbind(self):
+        self.vbo.unbind()
+
+    def delete(self):
+        if self.vbo is not None:
+            self.vbo.delete()
+            self.vbo = None
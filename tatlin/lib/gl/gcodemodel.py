@@ -16,19 +16,175 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 
-import math
 import numpy
 import logging
 import time
 
+from collections import OrderedDict
+
 from OpenGL.GL import *  # type:ignore
 from OpenGL.GLE import *  # type:ignore
-from OpenGL.arrays.vbo import VBO
-
+from .boundingbox import BoundingBox
+from .buffers import GrowableBuffer
 from .model import Model
+from .shaders import VertexArray, view_matrices
 
-from tatlin.lib import vector
+from tatlin.lib import profiling
+from tatlin.lib.model.gcode.coalesce import segment_distances
 from tatlin.lib.model.gcode.parser import Movement
+from tatlin.lib.model.gcode.table import MovementAttributes, MovementTable
+
+
+class LayerChunks(object):
+    """
+    Layers of line strips split into chunks of at most size lines, and the
+    boxes enclosing the lines of every chunk, for drawing only the chunks
+    in view.
+
+    Consecutive vertices of a toolpath are close together, so the boxes of
+    chunks are small next to those of their layers. A chunk ends at the
+    first vertex of the next chunk of its layer, so that the line joining
+    them is drawn with it.
+    """
+
+    # signs of x, y and z in the planes bounding the view volume
+    signs = numpy.repeat(numpy.identity(3), 2, axis=1) * numpy.tile([1, -1], 3)
+
+    def __init__(self, vertices, layer_stops, size, first_layer=0, below=None):
+        """
+        Split the layers from first_layer on, after the chunks of the layers
+        below it kept from the LayerChunks below.
+        """
+        stops = numpy.asarray(layer_stops[first_layer:], numpy.int64)
+        lengths = numpy.diff(stops)
+        # chunks of size lines, rounded up, and none for empty layers
+        counts = numpy.maximum(-(-(lengths - 1) // size), lengths > 0)
+        layers = numpy.repeat(numpy.arange(len(lengths)), counts)
+        nums = numpy.arange(len(layers)) - numpy.repeat(
+            numpy.cumsum(counts) - counts, counts
+        )
+        starts = stops[layers] + nums * size
+        ends = numpy.minimum(starts + size + 1, stops[layers + 1])
+
+        if len(starts):
+            # boxes enclose the vertices up to the start of the next chunk,
+            # and the last vertex drawn with the chunk
+            last = vertices[ends - 1]
+            lower = numpy.minimum(numpy.minimum.reduceat(vertices, starts), last)
+            upper = numpy.maximum(numpy.maximum.reduceat(vertices, starts), last)
+        else:
+            lower = upper = numpy.empty((0, 3), vertices.dtype)
+
+        layers += first_layer
+        if below is not None:
+            kept = numpy.searchsorted(below.layers, first_layer)
+            layers = numpy.concatenate((below.layers[:kept], layers))
+            starts = numpy.concatenate((below.starts[:kept], starts))
+            ends = numpy.concatenate((below.ends[:kept], ends))
+            lower = numpy.concatenate((below.lower[:kept], lower))
+            upper = numpy.concatenate((below.upper[:kept], upper))
+
+        self.layers = layers
+        self.starts = starts
+        self.ends = ends
+        self.lower = lower
+        self.upper = upper
+
+    def __len__(self):
+        return len(self.starts)
+
+    def bounds(self, first_layer, end_layer):
+        """
+        Return the lower and upper corners of a box enclosing layers
+        first_layer to end_layer (exclusive), or None if they are empty.
+        """
+        first, end = numpy.searchsorted(self.layers, [first_layer, end_layer])
+        if first == end:
+            return None
+        return self.lower[first:end].min(axis=0), self.upper[first:end].max(axis=0)
+
+    def visible(self, view, offset=(0.0, 0.0, 0.0), scale=(1.0, 1.0, 1.0)):
+        """
+        Return a mask of the chunks with boxes at least partly inside the
+        view volume, for vertices scaled and offset before the view matrix,
+        as returned by view_matrices, is applied to them.
+
+        A box is out of view if it is all outside one of the planes bounding
+        the view volume, -w <= x, y, z <= w in clip coordinates, which is
+        when the corner farthest inside the plane is outside of it.
+        """
+        view = numpy.asarray(view, numpy.float64)
+        # the planes as w + x >= 0, w - x >= 0 and so on
+        planes = view[:, 3:] + numpy.dot(view[:, :3], self.signs)
+        # boxes in the coordinates the view is applied to
+        scale = numpy.asarray(scale, numpy.float32)
+        offset = numpy.asarray(offset, numpy.float32)
+        centers = (self.lower + self.upper) / 2 * scale + offset
+        extents = (self.upper - self.lower) / 2 * scale
+        distances = (
+            numpy.dot(centers, planes[:3])
+            + planes[3]
+            + numpy.dot(extents, numpy.abs(planes[:3]))
+        )
+        return (distances >= 0).all(axis=1)
+
+    def cull(self, firsts, counts, visible):
+        """
+        Return the first vertices and the vertex counts of ranges of whole
+        layers, with the chunks not visible left out, in the same order.
+        Visible chunks next to each other in a range are drawn together.
+        """
+        # the chunks of every range, in order
+        first_chunks = numpy.searchsorted(self.starts, firsts)
+        num_chunks = numpy.searchsorted(self.starts, firsts + counts) - first_chunks
+        ranges = numpy.repeat(numpy.arange(len(firsts)), num_chunks)
+        chunks = (
+            numpy.arange(len(ranges))
+            - numpy.repeat(numpy.cumsum(num_chunks) - num_chunks, num_chunks)
+            + numpy.repeat(first_chunks, num_chunks)
+        )
+        shown = visible[chunks]
+        chunks, ranges = chunks[shown], ranges[shown]
+
+        joined = numpy.zeros(len(chunks), bool)
+        joined[1:] = (chunks[1:] == chunks[:-1] + 1) & (ranges[1:] == ranges[:-1])
+        heads = numpy.flatnonzero(~joined)
+        tails = numpy.append(heads[1:], len(chunks)) - 1
+        firsts = self.starts[chunks[heads]]
+        counts = self.ends[chunks[tails]] - firsts
+        return firsts.astype(numpy.int32), counts.astype(numpy.int32)
+
+
+class DetailLevel(object):
+    """
+    Line strips of a GcodeModel with some of their vertices dropped, in
+    vertex buffers of their own, and the stops of layers in them.
+
+    No vertex dropped is more than detail_error away from the lines drawn in
+    its place.
+    """
+
+    def __init__(self, vertices, kinds, layer_stops, detail_error, chunk_size):
+        self.vertex_buffer = GrowableBuffer(vertices)
+        self.vertex_kind_buffer = GrowableBuffer(kinds)
+        self.movement_array = VertexArray(
+            [
+                (0, self.vertex_buffer, 3, GL_FLOAT),
+                (1, self.vertex_kind_buffer, 1, GL_SHORT),
+            ]
+        )
+        self.layer_stops = layer_stops
+        self.detail_error = detail_error
+        self.chunks = LayerChunks(vertices, layer_stops, chunk_size)
+
+    @property
+    def vertex_count(self):
+        return len(self.vertex_buffer)
+
+    def delete(self):
+        self.movement_array.delete()
+        self.vertex_buffer.delete()
+        self.vertex_kind_buffer.delete()
 
 
 class GcodeModel(Model):
@@ -36,6 +192,33 @@ class GcodeModel(Model):
     Model for displaying Gcode data.
     """
 
+    # kinds of movements; every vertex keeps the kind of its movement, and
+    # its color is looked up in the palette by it when drawing, so colors
+    # change without touching the vertices
+    TRAVEL = 0
+    EXTRUSION = 1
+    LOOP = 2
+    PERIMETER = 3
+    OUTER_PERIMETER = 4
+    # not a kind of movement, but the color of layer markers
+    MARKER = 5
+
+    # colors of the kinds, padded to a power of two rows for the texture
+    default_palette = numpy.require(
+        [
+            [0.6, 0.6, 0.6, 0.6],  # gray
+            [1.0, 0.0, 0.0, 0.6],  # red
+            [1.0, 0.875, 0.0, 0.6],  # yellow
+            [0.0, 1.0, 0.0, 0.6],  # green
+            [0.0, 0.875, 0.875, 0.6],  # cyan
+            [0.6, 0.6, 0.6, 0.6],  # gray
+            [0.0, 0.0, 0.0, 0.0],
+            [0.0, 0.0, 0.0, 0.0],
+        ],
+        "f",
+    )
+    hidden_color = (0.0, 0.0, 0.0, 0.0)
+
     # vertices for arrow to display the direction of movement
     arrow = numpy.require(
         [
@@ -65,223 +248,651 @@ class GcodeModel(Model):
         "f",
     )
 
+    # arrows and layer markers are only drawn for the top layer drawn, so they
+    # are generated for a layer when it is drawn and kept in vertex buffers for
+    # this many layers; the layers around the top layer drawn are prepared
+    # ahead as it moves
+    arrow_cache_size = 8
+    arrow_prefetch = 2
+
+    # coarser levels of detail of the line strips are made when they are
+    # first needed, each keeping about one in detail_step vertices of the
+    # level before it; a level is drawn when no vertex it drops is more than
+    # detail_pixels away from the lines drawn, or interaction_pixels while
+    # the view is moving, and while the view is moving, levels with more
+    # than interaction_vertices vertices are not drawn if there is a coarser
+    # one
+    detail_levels = 4
+    detail_step = 4
+    detail_error = 0.0  # of the model itself
+    detail_pixels = 0.5
+    interaction_pixels = 4.0
+    interaction_vertices = 2 << 20
+
+    # layers are split into chunks of at most this many vertices, and those
+    # out of view are not drawn
+    chunk_size = 1024
+
+    # vertices are offset and scaled like the legacy renderer does with the
+    # modelview matrix, and colored from the palette by their kinds
+    vertex_shader = """
+        #version 330 core
+
+        uniform mat4 view;
+        uniform vec3 offset;
+        uniform vec3 scale;
+        uniform vec4 palette[8];
+
+        layout(location = 0) in vec3 position;
+        layout(location = 1) in int kind;
+
+        out vec4 color;
+
+        void main()
+        {
+            gl_Position = view * vec4(position * scale + offset, 1.0);
+            color = palette[kind];
+        }
+    """
+    fragment_shader = """
+        #version 330 core
+
+        in vec4 color;
+
+        out vec4 frag_color;
+
+        void main()
+        {
+            frag_color = color;
+        }
+    """
+
     def load_data(self, model_data, callback=None):
+        """
+        Load a MovementTable, or a list of layers of Movement objects.
+        """
         t_start = time.time()
 
         # Initialize properties before they're used
         self.travels_enabled = True
-        
-        vertex_list = []
-        color_list = []
-        self.layer_stops = [0]
-        self.layer_heights = []
-        arrow_list = []
-        layer_markers_list = []
-        self.layer_marker_stops = [0]
-        
-        # Store model data to allow regenerating colors
-        self.model_data = model_data
-
-        num_layers = len(model_data)
-        callback_every = max(1, int(math.floor(num_layers / 100)))
-
-        # the first movement designates the starting point
-        start = prev = model_data[0][0]
-        del model_data[0][0]
-        
-        cutting_count = 0
-        travel_count = 0
-        
-        for layer_idx, layer in enumerate(model_data):
-            first = layer[0]
-            for movement in layer:
-                vertex_list.append(prev.v)
-                vertex_list.append(movement.v)
-                arrow = self.arrow
-                # position the arrow with respect to movement
-                arrow = vector.rotate(arrow, movement.angle(prev.v), 0.0, 0.0, 1.0)
-                arrow_list.extend(arrow)
-                vertex_color = self.movement_color(movement)
-                color_list.append(vertex_color)
-                prev = movement
-                
-                # Count movement types for debugging
-                extruder_on = movement.flags & Movement.FLAG_EXTRUDER_ON or movement.delta_e > 0
-                z_position = movement.v[2]
-                at_work_height = abs(z_position) < 0.01
-                is_cutting = extruder_on or at_work_height
-                if is_cutting:
-                    cutting_count += 1
-                else:
-                    travel_count += 1
-
-            self.layer_stops.append(len(vertex_list))
-            self.layer_heights.append(first.v[2])
-
-            # add the layer entry marker
-            if layer_idx > 0 and len(model_data[layer_idx - 1]) > 0:
-                layer_markers_list.extend(
-                    self.layer_entry_marker + model_data[layer_idx - 1][-1].v
-                )
-            elif layer_idx == 0 and len(layer) > 0:
-                layer_markers_list.extend(self.layer_entry_marker + layer[0].v)
 
-            # add the layer exit marker
-            if len(layer) > 1:
-                layer_markers_list.extend(self.layer_exit_marker + layer[-1].v)
+        if not isinstance(model_data, MovementTable):
+            model_data = MovementTable.from_layers(model_data)
+
+        # the first movement designates the starting point, every following
+        # movement is a line from the previous point; the points end up in the
+        # vertex buffer, and only the attributes of the movements are kept
+        self.start_point = model_data.vertices[0].copy()
+        self.movements = MovementAttributes.from_table(model_data, 1)
+        vertices, kinds, stops = self._movement_arrays(
+            model_data, 1, self.start_point
+        )
+        with profiling.stage("model.layers"):
+            self._update_layers(model_data, stops)
+        self._create_buffers(vertices, kinds)
+        if callback:
+            callback(self.max_layers, self.max_layers)
+
+        t_end = time.time()
+        profiling.count("vertices", self.vertex_count)
+        profiling.count("layers", self.max_layers)
+
+        logging.info("Initialized Gcode model in %.2f seconds" % (t_end - t_start))
+        logging.info("Vertex count: %d" % self.vertex_count)
+
+    def load_cached(self, arrays):
+        """
+        Load arrays returned by cache_arrays, without computing anything.
+        """
+        self.travels_enabled = True
+        self.start_point = arrays["start_point"]
+        self.movements = MovementAttributes(
+            arrays["delta_e"], arrays["z"], arrays["flags"]
+        )
+        self.layer_stops = arrays["layer_stops"].tolist()
+        self.layer_heights = arrays["layer_heights"].tolist()
+        self._create_buffers(arrays["vertices"], arrays["kinds"].astype(numpy.int16))
+        logging.info("Vertex count: %d" % self.vertex_count)
 
-            self.layer_marker_stops.append(len(layer_markers_list))
+    def cache_arrays(self):
+        """
+        Return the arrays needed to load the model again with load_cached.
+        """
+        return {
+            "start_point": self.start_point,
+            "delta_e": self.movements.delta_e,
+            "z": self.movements.z,
+            "flags": self.movements.flags,
+            "vertices": self.vertices,
+            "kinds": self.kinds.astype(numpy.uint8),
+            "layer_stops": numpy.array(self.layer_stops, numpy.int64),
+            "layer_heights": numpy.array(self.layer_heights, numpy.float32),
+        }
 
-            if callback and layer_idx % callback_every == 0:
-                callback(layer_idx + 1, num_layers)
+    def _create_buffers(self, vertices, kinds):
+        self.vertex_buffer = GrowableBuffer(vertices)
+        self.vertex_kind_buffer = GrowableBuffer(kinds)
+        self.movement_array = VertexArray(
+            [
+                (0, self.vertex_buffer, 3, GL_FLOAT),
+                (1, self.vertex_kind_buffer, 1, GL_SHORT),
+            ]
+        )
 
-        self.vertices = numpy.array(vertex_list, "f")
-        self.colors = numpy.array(color_list, "f")
-        self.arrows = numpy.array(arrow_list, "f")
-        self.layer_markers = numpy.array(layer_markers_list, "f")
+        self.palette = self.default_palette.copy()
+        self.palette_texture = None
+        self.program_palette = None
+        self.update_colors()
 
-        # by translating the arrow vertices outside of the loop, we achieve a
-        # significant performance gain thanks to numpy. it would be really nice
-        # if we could rotate in a similar fashion...
-        self.arrows = self.arrows + self.vertices[1::2].repeat(3, 0)
+        # buffers of arrows by layer, least recently drawn first, and evicted
+        # buffers to delete in the GL context
+        self.arrow_buffers = OrderedDict()
+        self.stale_buffers = []
 
-        # for every pair of vertices of the model, there are 3 vertices for the arrow
-        assert len(self.arrows) == (
-            (len(self.vertices) // 2) * 3
-        ), "The 2:3 ratio of model vertices to arrow vertices does not hold."
+        # coarser levels of detail made so far
+        self.details = []
+        with profiling.stage("model.chunks"):
+            self.chunks = LayerChunks(vertices, self.layer_stops, self.chunk_size)
 
         self.max_layers = len(self.layer_stops) - 1
-        self.num_layers_to_draw = self.max_layers
         self.arrows_enabled = True
+        self.num_layers_to_draw = self.max_layers
         self.initialized = False
-        self.vertex_count = len(self.vertices)
 
-        t_end = time.time()
+    def append_data(self, model_data):
+        """
+        Append movements parsed from the end of a growing file, as returned
+        by GcodeParser.parse_continued. Its first layer continues the last
+        layer of the model.
 
-        logging.info("Initialized Gcode model in %.2f seconds" % (t_end - t_start))
-        logging.info("Vertex count: %d" % self.vertex_count)
-        logging.info(f"Movement types: {cutting_count} cutting moves, {travel_count} travel moves")
+        Only the new data is copied into the vertex buffers.
+        """
+        if model_data.num_layers < 1:
+            return
+
+        last_layer = self.max_layers - 1
+        offset = self.vertex_count
+        previous = self.vertices[-1] if offset else self.start_point
+        # the first layer of the data continues the last layer of the model,
+        # and its last run of movements if it has any
+        previous_kind = None
+        if last_layer >= 0 and self.layer_stops[-1] > self.layer_stops[-2]:
+            previous_kind = self.kinds[-1]
+        self.movements.extend(model_data)
+
+        vertices, kinds, stops = self._movement_arrays(
+            model_data, 0, previous, previous_kind
+        )
+        self.vertex_buffer.append(vertices)
+        self.vertex_kind_buffer.append(kinds)
+        self.layer_stops[-1:] = [stop + offset for stop in stops[1:]]
+        if model_data.num_layers > 1:
+            self.layer_heights.extend(self._table_layer_heights(model_data, 0)[1:])
+        # only the chunks of the last layer and the new ones change
+        first_layer = max(last_layer, 0)
+        self.chunks = LayerChunks(
+            self.vertices, self.layer_stops, self.chunk_size, first_layer, self.chunks
+        )
+
+        # arrows of the last layer are redone with its new movements
+        self._clear_arrows(max(last_layer, 0))
+        self._clear_details()
+
+        # keep showing all layers if all of them were shown
+        show_all = self.num_layers_to_draw == self.max_layers
+        self.max_layers = len(self.layer_stops) - 1
+        if show_all:
+            self.num_layers_to_draw = self.max_layers
+
+        self.invalidate_bounding_box()
+
+    def reserve(self, vertex_count):
+        """
+        Make room in the vertex buffers for the model to grow to vertex_count
+        vertices without allocating them again.
+        """
+        self.vertex_buffer.reserve(vertex_count)
+        self.vertex_kind_buffer.reserve(vertex_count)
+
+    def layers_bounding_box(self, first_layer, end_layer):
+        """
+        Return a box enclosing layers first_layer to end_layer (exclusive),
+        from the boxes of their chunks, or None if they are empty.
+        """
+        bounds = self.chunks.bounds(first_layer, end_layer)
+        if bounds is None:
+            return None
+        lower_corner, upper_corner = bounds
+        return BoundingBox(upper_corner, lower_corner)
+
+    def _calculate_bounding_box(self):
+        box = self.layers_bounding_box(0, self.max_layers)
+        if box is None:
+            return super(GcodeModel, self)._calculate_bounding_box()
+        return box
+
+    @property
+    def vertices(self):
+        return self.vertex_buffer.data
+
+    @property
+    def kinds(self):
+        return self.vertex_kind_buffer.data
+
+    @property
+    def colors(self):
+        return self.palette[self.kinds]
+
+    @property
+    def vertex_count(self):
+        return len(self.vertex_buffer)
+
+    def _movement_arrays(self, table, start, previous, previous_kind=None):
+        """
+        Return line strip vertices, their kinds and the stops of layers in
+        them, for movements of a MovementTable from row start on, the first of
+        them from the previous point.
+
+        Every movement adds the point it ends at. Layers, and runs of
+        movements of one kind, first add the point they start at, so that
+        layers can be drawn by themselves and both ends of a line have the
+        same kind. The line joining two runs then has zero length, and
+        nothing is drawn for it. Unless previous_kind is None, the first
+        layer continues a run of movements of that kind.
+        """
+        points = table.vertices[start:]
+        with profiling.stage("model.colors"):
+            kinds = self.movement_kinds(table, start)
+
+        with profiling.stage("model.vertices"):
+            stops = numpy.maximum(table.layer_stops - start, 0)
+            breaks = numpy.empty(len(kinds), bool)
+            breaks[1:] = kinds[1:] != kinds[:-1]
+            breaks[:1] = previous_kind is None or kinds[:1] != previous_kind
+            layer_starts = stops[:-1] if previous_kind is None else stops[1:-1]
+            breaks[layer_starts[layer_starts < len(kinds)]] = True
+
+            # vertices of a movement come after those of the movements before
+            # it and of the breaks up to and including its own
+            num_breaks = numpy.cumsum(breaks)
+            ends = numpy.arange(len(kinds)) + num_breaks
+            vertices = numpy.empty((len(kinds) + int(breaks.sum()), 3), "f")
+            vertices[ends] = points
+            rows = numpy.flatnonzero(breaks)
+            vertices[ends[rows] - 1] = points[numpy.maximum(rows - 1, 0)]
+            if len(kinds) and breaks[0]:
+                vertices[0] = previous
+
+            vertex_kinds = numpy.empty(len(vertices), numpy.int16)
+            vertex_kinds[ends] = kinds
+            vertex_kinds[ends[rows] - 1] = kinds[rows]
+
+            stops = stops + numpy.concatenate(([0], num_breaks))[stops]
+        return vertices, vertex_kinds, stops.tolist()
+
+    def _vertex_kinds(self, kinds, repeat):
+        """
+        Return kinds of movements repeated for each of their vertices, as
+        texture coordinates.
+        """
+        return numpy.repeat(kinds.astype(numpy.int16), repeat)
+
+    @property
+    def num_layers_to_draw(self):
+        return self._num_layers_to_draw
+
+    @num_layers_to_draw.setter
+    def num_layers_to_draw(self, number):
+        self._num_layers_to_draw = number
+        if self.arrows_enabled:
+            self._prefetch_arrows(number - 1)
+
+    def layer_arrows(self, layer_idx):
+        """
+        Return the vertices and kinds of the arrows of a layer, and the
+        vertices of its layer markers.
+        """
+        start = self.layer_stops[layer_idx]
+        end = self.layer_stops[layer_idx + 1]
+        with profiling.stage("model.arrows"):
+            vertices = self.vertices[start:end]
+            kinds = self.kinds[start:end]
+            # lines of movements join vertices of the same kind, and the lines
+            # joining runs of movements of different kinds
+            ends = numpy.flatnonzero(kinds[1:] == kinds[:-1]) + 1
+            arrows = self._arrows(vertices[ends - 1], vertices[ends])
+            kinds = self._vertex_kinds(kinds[ends], 3)
+            layer_markers = self._layer_markers(layer_idx, layer_idx + 1)
+        return arrows, kinds, layer_markers
+
+    def _layer_arrow_buffers(self, layer_idx):
+        """
+        Return the buffers of layer_arrows for a layer, generating them if
+        they are not cached.
+        """
+        buffers = self.arrow_buffers.pop(layer_idx, None)
+        if buffers is None:
+            buffers = [GrowableBuffer(data) for data in self.layer_arrows(layer_idx)]
+        self.arrow_buffers[layer_idx] = buffers
+
+        while len(self.arrow_buffers) > self.arrow_cache_size:
+            _, evicted = self.arrow_buffers.popitem(last=False)
+            self.stale_buffers.extend(evicted)
+        return buffers
+
+    def _layer_arrow_arrays(self, layer_idx):
+        """
+        Return the buffers of a layer, followed by vertex arrays of its
+        arrows and layer markers for drawing them with shaders.
+        """
+        buffers = self._layer_arrow_buffers(layer_idx)
+        if len(buffers) == 3:
+            # kept with the buffers, and evicted along with them
+            arrow_buffer, kind_buffer, marker_buffer = buffers
+            buffers.append(
+                VertexArray(
+                    [(0, arrow_buffer, 3, GL_FLOAT), (1, kind_buffer, 1, GL_SHORT)]
+                )
+            )
+            buffers.append(VertexArray([(0, marker_buffer, 3, GL_FLOAT)]))
+        return buffers
+
+    def _prefetch_arrows(self, layer_idx):
+        """
+        Generate the arrows of a layer and of the layers around it, unless
+        they are cached.
+        """
+        first = max(layer_idx - self.arrow_prefetch, 0)
+        last = min(layer_idx + self.arrow_prefetch, self.max_layers - 1)
+        for idx in range(first, last + 1):
+            if idx != layer_idx and idx not in self.arrow_buffers:
+                self._layer_arrow_buffers(idx)
+        # the layer itself is used last, so that it is evicted last
+        if 0 <= layer_idx < self.max_layers:
+            self._layer_arrow_buffers(layer_idx)
+
+    def _clear_arrows(self, first_layer=0):
+        """
+        Drop the cached arrows of layers from first_layer on.
+        """
+        for idx in [idx for idx in self.arrow_buffers if idx >= first_layer]:
+            self.stale_buffers.extend(self.arrow_buffers.pop(idx))
 
-    def movement_color(self, move):
+    def detail_level(self, pixel_scale=None, interacting=False):
         """
-        Return the color to use for particular type of movement.
+        Return the coarsest level of detail to draw at pixel_scale pixels per
+        millimeter, 0 being the model itself. Levels are made as they are
+        first needed.
         """
-        extruder_on = move.flags & Movement.FLAG_EXTRUDER_ON or move.delta_e > 0
-        
+        if not pixel_scale:
+            return 0
+
+        pixels = self.interaction_pixels if interacting else self.detail_pixels
+        level = 0
+        for idx in range(1, self.detail_levels + 1):
+            detail = self._detail(idx)
+            if detail is None:
+                break
+            if detail.detail_error * pixel_scale <= pixels or (
+                interacting
+                and self._detail(level).vertex_count > self.interaction_vertices
+            ):
+                level = idx
+            else:
+                break
+        return level
+
+    def _detail(self, level):
+        """
+        Return a level of detail, made from the one below it if it is not
+        yet, or None if there is no such level.
+        """
+        if level == 0:
+            return self
+        if len(self.details) < level - 1 or level > self.detail_levels:
+            return None
+        if len(self.details) == level - 1:
+            below = self._detail(level - 1)
+            with profiling.stage("model.details"):
+                detail = self._coarser_detail(below)
+            # levels stop at the first one that would drop too few vertices
+            self.details.append(detail)
+            if detail is not None:
+                logging.info(
+                    "Made level of detail %d with %d vertices, within %.3f mm"
+                    % (level, detail.vertex_count, detail.detail_error)
+                )
+        return self.details[level - 1]
+
+    def _coarser_detail(self, detail):
+        """
+        Return a DetailLevel keeping about one in detail_step vertices of a
+        level of detail, or None if it would keep more than three quarters
+        of them.
+
+        Vertices at both ends of layers and of runs of movements of a kind
+        are always kept, so that layers and colors stay the same.
+        """
+        vertices = detail.vertex_buffer.data
+        kinds = detail.vertex_kind_buffer.data
+        count = len(vertices)
+        stops = numpy.asarray(detail.layer_stops, numpy.int64)
+
+        kept = numpy.zeros(count, bool)
+        kept[:: self.detail_step] = True
+        joins = numpy.flatnonzero(kinds[1:] != kinds[:-1])
+        kept[joins] = True
+        kept[joins + 1] = True
+        kept[stops[stops < count]] = True
+        kept[stops[stops > 0] - 1] = True
+        keep = numpy.flatnonzero(kept)
+        if len(keep) > count * 0.75:
+            return None
+
+        # dropped vertices are between two vertices kept in the same layer,
+        # and are at most as far from the lines drawn as from the line
+        # between those, plus the error of the level below
+        dropped = numpy.flatnonzero(~kept)
+        after = numpy.searchsorted(keep, dropped)
+        distances = segment_distances(
+            vertices[dropped], vertices[keep[after - 1]], vertices[keep[after]]
+        )
+        return DetailLevel(
+            vertices[keep],
+            kinds[keep],
+            numpy.searchsorted(keep, stops).tolist(),
+            detail.detail_error + float(distances.max(initial=0.0)),
+            self.chunk_size,
+        )
+
+    def _clear_details(self):
+        """
+        Drop the levels of detail made so far, once the vertices change.
+        """
+        self.stale_buffers.extend(
+            detail for detail in self.details if detail is not None
+        )
+        self.details = []
+
+    def _arrows(self, starts, ends):
+        """
+        Return the vertices of arrows at the end of every line from starts to
+        ends.
+        """
+        # rotate the arrow to the direction of every movement at once; negate x
+        # for clockwise rotation angle
+        delta = ends - starts
+        angles = numpy.arctan2(delta[:, 1], -delta[:, 0])
+        cos = numpy.cos(angles)[:, numpy.newaxis]
+        sin = numpy.sin(angles)[:, numpy.newaxis]
+
+        x, y, z = self.arrow.T
+        arrows = numpy.empty((len(angles), len(self.arrow), 3), "f")
+        arrows[:, :, 0] = x * cos + y * sin
+        arrows[:, :, 1] = y * cos - x * sin
+        arrows[:, :, 2] = z
+
+        # and move it to the end of the movement
+        arrows += ends[:, numpy.newaxis]
+        return arrows.reshape(-1, 3)
+
+    def _update_layers(self, table, stops):
+        """
+        Update layer stops and heights from the stops of layers in line strip
+        vertices and the layers of a MovementTable whose first row is the
+        starting point.
+        """
+        self.layer_stops = stops
+        self.layer_heights = self._table_layer_heights(table, 1)
+
+    def _table_layer_heights(self, table, start):
+        """
+        Return the heights of the layers of a table, those of their first
+        movements from row start on.
+        """
+        rows = numpy.maximum(table.layer_stops[:-1], start)
+        return table.z[numpy.minimum(rows, table.num_movements - 1)].tolist()
+
+    def _layer_markers(self, first_layer, end_layer):
+        """
+        Return vertices of layer entry and exit markers for layers from
+        first_layer up to end_layer.
+        """
+        stops = numpy.array(self.layer_stops, numpy.int64)
+
+        layers = numpy.arange(first_layer, end_layer)
+        starts, ends = stops[layers], stops[layers + 1]
+
+        # layers are entered where the layer below was exited, except for the
+        # first layer that starts where the machine happens to be, and is
+        # entered at the end of its first movement
+        previous = stops[numpy.maximum(layers - 1, 0)]
+        has_entry = numpy.where(layers > 0, starts > previous, ends > starts)
+        entries = numpy.where(layers > 0, starts - 1, starts + 1)[has_entry]
+        # and exited at their last point, if they have more than one movement
+        has_exit = ends - starts > 2
+        exits = ends[has_exit] - 1
+
+        # markers of a layer go together, the entry marker first
+        entry_size = len(self.layer_entry_marker)
+        exit_size = len(self.layer_exit_marker)
+        sizes = has_entry * entry_size + has_exit * exit_size
+        layer_ends = numpy.cumsum(sizes)
+        layer_starts = layer_ends - sizes
+
+        layer_markers = numpy.empty((layer_ends[-1] if len(sizes) else 0, 3), "f")
+        rows = layer_starts[has_entry, numpy.newaxis] + numpy.arange(entry_size)
+        points = self.vertices[entries][:, numpy.newaxis]
+        layer_markers[rows] = self.layer_entry_marker + points
+        rows = layer_ends[has_exit, numpy.newaxis] - numpy.arange(exit_size, 0, -1)
+        points = self.vertices[exits][:, numpy.newaxis]
+        layer_markers[rows] = self.layer_exit_marker + points
+        return layer_markers
+
+    def _cutting(self, movements, start=1):
+        """
+        Return a mask of movements from row start on that cut or extrude.
+        """
+        delta_e = movements.delta_e[start:]
+        flags = movements.flags[start:]
+        extruder_on = (flags & Movement.FLAG_EXTRUDER_ON > 0) | (delta_e > 0)
+
         # For gcode files without extruder data (CNC, pen plotters, etc.),
         # assume movements at Z=0 (or very close) are cutting/drawing,
         # and movements at higher Z are travels
-        z_position = move.v[2] if hasattr(move, 'v') else 0
-        at_work_height = abs(z_position) < 0.01  # within 0.01mm of Z=0
-        
+        at_work_height = numpy.abs(movements.z[start:]) < 0.01  # within 0.01mm of Z=0
+
         # A movement is "cutting" if extruder is on OR at work height
-        is_cutting = extruder_on or at_work_height
-        
-        outer_perimeter = (
-            move.flags & Movement.FLAG_PERIMETER
-            and move.flags & Movement.FLAG_PERIMETER_OUTER
-        )
+        return extruder_on | at_work_height
 
-        if is_cutting and outer_perimeter:
-            color = (0.0, 0.875, 0.875, 0.6)  # cyan
-        elif is_cutting and move.flags & Movement.FLAG_PERIMETER:
-            color = (0.0, 1.0, 0.0, 0.6)  # green
-        elif is_cutting and move.flags & Movement.FLAG_LOOP:
-            color = (1.0, 0.875, 0.0, 0.6)  # yellow
-        elif is_cutting:
-            color = (1.0, 0.0, 0.0, 0.6)  # red
-        else:
-            # Non-cutting travel move (higher Z position)
-            if self.travels_enabled:
-                color = (0.6, 0.6, 0.6, 0.6)  # gray - visible
-            else:
-                color = (0.0, 0.0, 0.0, 0.0)  # transparent - hidden
+    def movement_kinds(self, movements, start=1):
+        """
+        Return the kinds of movements of a MovementTable from row start on,
+        the first row of which is the starting point, or of MovementAttributes.
+        """
+        is_cutting = self._cutting(movements, start)
+        flags = movements.flags[start:]
+        perimeter = flags & Movement.FLAG_PERIMETER > 0
+        outer_perimeter = perimeter & (flags & Movement.FLAG_PERIMETER_OUTER > 0)
+        loop = flags & Movement.FLAG_LOOP > 0
+
+        kinds = numpy.full(len(flags), self.TRAVEL, numpy.uint8)
+        kinds[is_cutting] = self.EXTRUSION
+        kinds[is_cutting & loop] = self.LOOP
+        kinds[is_cutting & perimeter] = self.PERIMETER
+        kinds[is_cutting & outer_perimeter] = self.OUTER_PERIMETER
 
-        return color
+        cutting_count = int(numpy.count_nonzero(is_cutting))
+        logging.info(
+            f"Movement types: {cutting_count} cutting moves, "
+            f"{len(flags) - cutting_count} travel moves"
+        )
+        return kinds
+
+    def set_color(self, kind, color):
+        """
+        Change the color of a kind of movements.
+        """
+        self.palette[kind] = color
+        self.palette_changed = True
 
     def update_colors(self):
         """
-        Regenerate colors for all movements based on current settings.
-        This is called when travels_enabled is toggled.
+        Update the palette from the current settings. This is called when
+        travels_enabled is toggled, and only changes the palette.
         """
-        if not hasattr(self, 'model_data') or self.model_data is None or len(self.model_data) == 0:
-            return
-        
-        color_list = []
-        cutting_count = 0
-        travel_count = 0
-        
-        # Iterate through model_data the same way as in load_data
-        # Note: the first element of the first layer was already removed in load_data
-        for layer_idx, layer in enumerate(self.model_data):
-            for movement in layer:
-                vertex_color = self.movement_color(movement)
-                color_list.append(vertex_color)
-                
-                # Count movement types for debugging
-                extruder_on = movement.flags & Movement.FLAG_EXTRUDER_ON or movement.delta_e > 0
-                z_position = movement.v[2]
-                at_work_height = abs(z_position) < 0.01
-                is_cutting = extruder_on or at_work_height
-                if is_cutting:
-                    cutting_count += 1
-                else:
-                    travel_count += 1
-        
-        logging.info(f"Regenerated colors: {cutting_count} cutting moves, {travel_count} travel moves, travels_enabled={self.travels_enabled}")
-        
-        self.colors = numpy.array(color_list, "f")
-        
-        # Verify we have the right number of colors
-        total_movements = sum(len(layer) for layer in self.model_data)
-        if len(self.colors) != total_movements:
-            logging.error(f"Color count mismatch! colors={len(self.colors)}, movements={total_movements}")
-        
-        # Update the VBO if already initialized
-        if self.initialized:
-            self.vertex_color_buffer = VBO(
-                self.colors.repeat(2, 0), "GL_STATIC_DRAW"
-            )
-            if self.arrows_enabled:
-                self.arrow_color_buffer = VBO(
-                    self.colors.repeat(3, 0), "GL_STATIC_DRAW"
-                )
+        if self.travels_enabled:
+            self.set_color(self.TRAVEL, self.default_palette[self.TRAVEL])
+        else:
+            self.set_color(self.TRAVEL, self.hidden_color)
+        logging.info(f"Updated colors, travels_enabled={self.travels_enabled}")
 
     # ------------------------------------------------------------------------
     # DRAWING
     # ------------------------------------------------------------------------
 
     def init(self):
-        self.vertex_buffer = VBO(self.vertices, "GL_STATIC_DRAW")
-        self.vertex_color_buffer = VBO(
-            self.colors.repeat(2, 0), "GL_STATIC_DRAW"
-        )  # each pair of vertices shares the color
-
-        if self.arrows_enabled:
-            self.arrow_buffer = VBO(self.arrows, "GL_STATIC_DRAW")
-            self.arrow_color_buffer = VBO(
-                self.colors.repeat(3, 0), "GL_STATIC_DRAW"
-            )  # each triplet of vertices shares the color
+        # vertex buffers are uploaded when they are first bound
+        self.initialized = True
 
-        self.layer_marker_buffer = VBO(self.layer_markers, "GL_STATIC_DRAW")
+    def display(
+        self,
+        elevation=0,
+        eye_height=0,
+        mode_ortho=False,
+        mode_2d=False,
+        pixel_scale=None,
+        interacting=False,
+    ):
+        for buffer in self.stale_buffers:
+            buffer.delete()
+        self.stale_buffers = []
 
-        self.initialized = True
+        detail = self._detail(self.detail_level(pixel_scale, interacting))
+        _, view = view_matrices()
+        firsts, counts = self._visible_ranges(
+            detail, view, elevation, eye_height, mode_ortho, mode_2d
+        )
+        if self.use_shaders and self.shader_program() is not None:
+            self._display_shaded(view, mode_2d, detail, firsts, counts)
+            return
 
-    def display(self, elevation=0, eye_height=0, mode_ortho=False, mode_2d=False):
         glPushMatrix()
         try:
             offset_z = self.offset_z if not mode_2d else 0
             glTranslate(self.offset_x, self.offset_y, offset_z)
 
             glEnableClientState(GL_VERTEX_ARRAY)
-            glEnableClientState(GL_COLOR_ARRAY)
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            self._bind_palette()
 
-            self._display_movements(elevation, eye_height, mode_ortho, mode_2d)
+            self._display_movements(mode_2d, detail, firsts, counts)
 
             if self.arrows_enabled:
                 self._display_arrows()
 
-            glDisableClientState(GL_COLOR_ARRAY)
+            self._unbind_palette()
+            glDisableClientState(GL_TEXTURE_COORD_ARRAY)
 
             if self.arrows_enabled:
                 self._display_layer_markers()
@@ -290,62 +901,147 @@ class GcodeModel(Model):
         finally:
             glPopMatrix()
 
-    def _display_movements(
-        self, elevation=0, eye_height=0, mode_ortho=False, mode_2d=False
-    ):
-        self.vertex_buffer.bind()
+    def _bind_palette(self):
+        """
+        Color vertices from the palette, as a 1D texture indexed by the kinds
+        in their texture coordinates. The palette is uploaded again only when
+        it has changed.
+        """
+        if self.palette_texture is None:
+            self.palette_texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_1D, self.palette_texture)
+            glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            self.palette_changed = True
+        else:
+            glBindTexture(GL_TEXTURE_1D, self.palette_texture)
+
+        if self.palette_changed:
+            width = len(self.palette)
+            glTexImage1D(
+                GL_TEXTURE_1D, 0, GL_RGBA, width, 0, GL_RGBA, GL_FLOAT, self.palette
+            )
+            self.palette_changed = False
+
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
+        glEnable(GL_TEXTURE_1D)
+
+        # map kinds to the middle of their texels
+        glMatrixMode(GL_TEXTURE)
+        glPushMatrix()
+        glLoadIdentity()
+        glScalef(1.0 / len(self.palette), 1.0, 1.0)
+        glTranslatef(0.5, 0.0, 0.0)
+        glMatrixMode(GL_MODELVIEW)
+
+    def _unbind_palette(self):
+        glMatrixMode(GL_TEXTURE)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glDisable(GL_TEXTURE_1D)
+
+    def _display_movements(self, mode_2d, detail, firsts, counts):
+        detail.vertex_buffer.bind()
         glVertexPointer(3, GL_FLOAT, 0, None)
 
-        self.vertex_color_buffer.bind()
-        glColorPointer(4, GL_FLOAT, 0, None)
+        detail.vertex_kind_buffer.bind()
+        glTexCoordPointer(1, GL_SHORT, 0, None)
 
         if mode_2d:
             glScale(1.0, 1.0, 0.0)  # discard z coordinates
-            start = self.layer_stops[self.num_layers_to_draw - 1]
-            end = self.layer_stops[self.num_layers_to_draw]
-            glDrawArrays(GL_LINES, start, end - start)
+        if len(firsts) > 0:
+            glMultiDrawArrays(GL_LINE_STRIP, firsts, counts, len(firsts))
+
+        detail.vertex_buffer.unbind()
+        detail.vertex_kind_buffer.unbind()
+
+    def _visible_ranges(
+        self, detail, view, elevation=0, eye_height=0, mode_ortho=False, mode_2d=False
+    ):
+        """
+        Return the ranges of _movement_ranges for a level of detail, without
+        the chunks of layers out of view.
+        """
+        firsts, counts = self._movement_ranges(
+            elevation, eye_height, mode_ortho, mode_2d, detail.layer_stops
+        )
+        if len(firsts) == 0:
+            return firsts, counts
+
+        # vertices are offset, and flattened in 2d mode, before the view
+        offset = (self.offset_x, self.offset_y, 0.0 if mode_2d else self.offset_z)
+        scale = (1.0, 1.0, 0.0 if mode_2d else 1.0)
+        visible = detail.chunks.visible(view, offset, scale)
+        return detail.chunks.cull(firsts, counts, visible)
+
+    def _movement_ranges(
+        self,
+        elevation=0,
+        eye_height=0,
+        mode_ortho=False,
+        mode_2d=False,
+        layer_stops=None,
+    ):
+        """
+        Return the first vertices and the vertex counts of the ranges to
+        draw, in the order to draw them, in the line strips of the model or
+        those of a level of detail with the given layer stops.
+
+        Layers seen from below are drawn top to bottom for blending to come
+        out right. Instead of a draw call per layer, the ranges are returned
+        as arrays to pass to glMultiDrawArrays, so a frame takes the same
+        number of calls however many layers there are.
+        """
+        if layer_stops is None:
+            layer_stops = self.layer_stops
+        stops = numpy.asarray(
+            layer_stops[: self.num_layers_to_draw + 1], dtype=numpy.int32
+        )
+        num_layers = len(stops) - 1
+        if num_layers < 1:
+            return self._layer_ranges(stops, 0, 0)
 
-        elif mode_ortho:
+        if mode_2d:
+            return self._layer_ranges(stops, num_layers - 1, num_layers)
+
+        if mode_ortho:
             if elevation >= 0:
                 # draw layers in normal order, bottom to top
-                start = 0
-                end = self.layer_stops[self.num_layers_to_draw]
-                glDrawArrays(GL_LINES, start, end - start)
+                return self._layer_ranges(stops, 0, num_layers, merged=True)
 
-            else:
-                # draw layers in reverse order, top to bottom
-                stop_idx = self.num_layers_to_draw - 1
-                while stop_idx >= 0:
-                    start = self.layer_stops[stop_idx]
-                    end = self.layer_stops[stop_idx + 1]
-                    glDrawArrays(GL_LINES, start, end - start)
-                    stop_idx -= 1
-
-        else:  # 3d projection mode
-            reverse_threshold_layer = self._layer_up_to_height(
-                eye_height - self.offset_z
-            )
+            # draw layers in reverse order, top to bottom
+            return self._layer_ranges(stops, 0, num_layers, reverse=True)
 
-            if reverse_threshold_layer >= 0:
-                # draw layers up to (and including) the threshold in normal order, bottom to top
-                normal_layers_to_draw = min(
-                    self.num_layers_to_draw, reverse_threshold_layer + 1
-                )
-                start = 0
-                end = self.layer_stops[normal_layers_to_draw]
-                glDrawArrays(GL_LINES, start, end - start)
-
-            if reverse_threshold_layer + 1 < self.num_layers_to_draw:
-                # draw layers from the threshold in reverse order, top to bottom
-                stop_idx = self.num_layers_to_draw - 1
-                while stop_idx > reverse_threshold_layer:
-                    start = self.layer_stops[stop_idx]
-                    end = self.layer_stops[stop_idx + 1]
-                    glDrawArrays(GL_LINES, start, end - start)
-                    stop_idx -= 1
-
-        self.vertex_buffer.unbind()
-        self.vertex_color_buffer.unbind()
+        # 3d projection mode
+        reverse_threshold_layer = self._layer_up_to_height(eye_height - self.offset_z)
+        # draw layers up to (and including) the threshold in normal order, bottom
+        # to top, then the ones above it in reverse order, top to bottom
+        normal_layers = max(0, min(num_layers, reverse_threshold_layer + 1))
+        normal = self._layer_ranges(stops, 0, normal_layers, merged=True)
+        reverse = self._layer_ranges(stops, normal_layers, num_layers, reverse=True)
+        return (
+            numpy.concatenate([normal[0], reverse[0]]),
+            numpy.concatenate([normal[1], reverse[1]]),
+        )
+
+    @staticmethod
+    def _layer_ranges(stops, first, end, reverse=False, merged=False):
+        """
+        Return the first vertices and the vertex counts of layers first to end
+        (exclusive), merged into a single range, or a range for each layer
+        that has vertices, in reverse order if requested.
+        """
+        if merged:
+            firsts = stops[first : first + 1]
+            counts = stops[end : end + 1] - firsts
+        else:
+            firsts = stops[first:end]
+            counts = stops[first + 1 : end + 1] - firsts
+        if reverse:
+            firsts, counts = firsts[::-1], counts[::-1]
+        nonempty = counts > 0
+        return firsts[nonempty], counts[nonempty]
 
     def _layer_up_to_height(self, height):
         """Return the index of the last layer lower than height."""
@@ -356,28 +1052,159 @@ class GcodeModel(Model):
         return 0
 
     def _display_arrows(self):
-        self.arrow_buffer.bind()
-        glVertexPointer(3, GL_FLOAT, 0, None)
+        if self.num_layers_to_draw < 1:
+            return
+        arrow_buffer, kind_buffer = self._layer_arrow_buffers(
+            self.num_layers_to_draw - 1
+        )[:2]
+        if not len(arrow_buffer):
+            return
 
-        self.arrow_color_buffer.bind()
-        glColorPointer(4, GL_FLOAT, 0, None)
+        arrow_buffer.bind()
+        glVertexPointer(3, GL_FLOAT, 0, None)
 
-        start = (self.layer_stops[self.num_layers_to_draw - 1] // 2) * 3
-        end = (self.layer_stops[self.num_layers_to_draw] // 2) * 3
+        kind_buffer.bind()
+        glTexCoordPointer(1, GL_SHORT, 0, None)
 
-        glDrawArrays(GL_TRIANGLES, start, end - start)
+        glDrawArrays(GL_TRIANGLES, 0, len(arrow_buffer))
 
-        self.arrow_buffer.unbind()
-        self.arrow_color_buffer.unbind()
+        arrow_buffer.unbind()
+        kind_buffer.unbind()
 
     def _display_layer_markers(self):
-        self.layer_marker_buffer.bind()
+        if self.num_layers_to_draw < 1:
+            return
+        marker_buffer = self._layer_arrow_buffers(self.num_layers_to_draw - 1)[2]
+        if not len(marker_buffer):
+            return
+
+        marker_buffer.bind()
         glVertexPointer(3, GL_FLOAT, 0, None)
 
-        start = self.layer_marker_stops[self.num_layers_to_draw - 1]
-        end = self.layer_marker_stops[self.num_layers_to_draw]
+        glColor4f(*self.palette[self.MARKER])
+        glDrawArrays(GL_TRIANGLES, 0, len(marker_buffer))
+
+        marker_buffer.unbind()
+
+    def _display_shaded(self, view, mode_2d, detail, firsts, counts):
+        program = self.program
+        program.use()
+
+        glUniformMatrix4fv(program.location("view"), 1, GL_FALSE, view)
+        offset_z = self.offset_z if not mode_2d else 0
+        glUniform3f(program.location("offset"), self.offset_x, self.offset_y, offset_z)
+        # discard z coordinates in 2d mode
+        glUniform3f(program.location("scale"), 1.0, 1.0, 0.0 if mode_2d else 1.0)
+        if not numpy.array_equal(self.program_palette, self.palette):
+            # uniforms are kept by the program, so only changes are uploaded
+            glUniform4fv(program.location("palette"), len(self.palette), self.palette)
+            self.program_palette = self.palette.copy()
+
+        detail.movement_array.bind()
+        if len(firsts) > 0:
+            glMultiDrawArrays(GL_LINE_STRIP, firsts, counts, len(firsts))
+
+        if self.arrows_enabled and self.num_layers_to_draw > 0:
+            arrow_buffer, _, marker_buffer, arrow_array, marker_array = (
+                self._layer_arrow_arrays(self.num_layers_to_draw - 1)
+            )
+            if len(arrow_buffer):
+                arrow_array.bind()
+                glDrawArrays(GL_TRIANGLES, 0, len(arrow_buffer))
+            if len(marker_buffer):
+                # markers have no kinds, the constant kind of the attribute is used
+                marker_array.bind()
+                glVertexAttribI1i(1, self.MARKER)
+                glDrawArrays(GL_TRIANGLES, 0, len(marker_buffer))
+
+        glBindVertexArray(0)
+        program.unuse()
 
-        glColor4f(0.6, 0.6, 0.6, 0.6)
-        glDrawArrays(GL_TRIANGLES, start, end - start)
 
-        self.layer_marker_buffer.unbind()
+class LazyGcodeModel(GcodeModel):
+    """
+    Model for displaying gcode files too large to load at once.
+
+    Layers are parsed from a layer index as the number of layers to draw
+    reaches them, and only a window of layers up to the top one drawn is
+    loaded into the vertex buffers.
+    """
+
+    # number of layers loaded at a time
+    window = 16
+
+    def load_index(self, reader, callback=None):
+        """
+        Load the top layers of a file through a GcodeLayerReader.
+        """
+        self.reader = reader
+        self._window = self._window_range(reader.index.num_layers)
+        self.load_data(self._window_table(), callback)
+
+    @GcodeModel.num_layers_to_draw.setter
+    def num_layers_to_draw(self, number):
+        first, last = self._window
+        if not first <= number - 1 <= last:
+            self._load_window(number)
+        GcodeModel.num_layers_to_draw.fset(self, number)
+
+    def _window_range(self, num_layers_to_draw):
+        last = max(num_layers_to_draw - 1, 0)
+        return max(last - self.window + 1, 0), last
+
+    def _window_table(self):
+        """
+        Return a MovementTable with the layers of the window, starting from
+        the last point of the layer below.
+        """
+        first, last = self._window
+        layers = [self.reader.layer(idx) for idx in range(first, last + 1)]
+        start_point = self.reader.start_point(first)
+        head = []
+        if start_point is not None:
+            head.append(MovementTable([start_point], [0], [0], [0], [0, 1]))
+
+        table = MovementTable.concatenate(head + layers)
+        stops = numpy.cumsum([len(head)] + [layer.num_movements for layer in layers])
+        stops[0] = 0
+        table.layer_stops = stops
+        return table
+
+    def _load_window(self, num_layers_to_draw):
+        t_start = time.time()
+
+        self._window = self._window_range(num_layers_to_draw)
+        table = self._window_table()
+        self.start_point = table.vertices[0].copy()
+        self.movements = MovementAttributes.from_table(table, 1)
+        vertices, kinds, stops = self._movement_arrays(table, 1, self.start_point)
+        with profiling.stage("model.layers"):
+            self._update_layers(table, stops)
+
+        self.vertex_buffer.write(0, vertices)
+        self.vertex_kind_buffer.write(0, kinds)
+        self.chunks = LayerChunks(self.vertices, self.layer_stops, self.chunk_size)
+        self._clear_arrows()
+        self._clear_details()
+
+        t_end = time.time()
+        logging.info(
+            "Loaded layers %d to %d in %.2f seconds"
+            % (self._window[0] + 1, self._window[1] + 1, t_end - t_start)
+        )
+
+    def _update_layers(self, table, stops):
+        """
+        Update layer stops for all layers of the file, with the layers outside
+        of the window left empty.
+        """
+        super(LazyGcodeModel, self)._update_layers(table, stops)
+        first, last = self._window
+        stops = self.layer_stops
+        num_above = self.reader.index.num_layers - 1 - last
+        self.layer_stops = [0] * first + stops + [stops[-1]] * num_above
+        self.layer_heights = list(self.reader.index.heights)
+
+    def _calculate_bounding_box(self):
+        index = self.reader.index
+        return BoundingBox(index.upper, index.lower)
@@ -16,11 +16,14 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 
+import logging
+
 from OpenGL.GL import *  # type:ignore
 from OpenGL.GLE import *  # type:ignore
 import numpy
 
 from .boundingbox import BoundingBox
+from . import shaders
 
 
 class Model(object):
@@ -40,12 +43,21 @@ class Model(object):
 
     axis_letter_map = dict([(v, k) for k, v in list(letter_axis_map.items())])
 
+    # draw with a shader program instead of the fixed-function pipeline; the
+    # scene turns this on when its context supports shaders
+    use_shaders = False
+
+    # sources of the vertex and fragment shaders of the program
+    vertex_shader = None
+    fragment_shader = None
+
     def __init__(self, offset_x=0, offset_y=0, offset_z=0):
         self.vertices: numpy.ndarray
 
         self.offset_x = offset_x
         self.offset_y = offset_y
         self.offset_z = offset_z
+        self.program = None
 
         self.init_model_attributes()
 
@@ -56,6 +68,20 @@ class Model(object):
         self.invalidate_bounding_box()
         self.modified = False
 
+    def shader_program(self):
+        """
+        Return the shader program of the model, compiling it the first time.
+        If it does not compile, the model falls back to the fixed-function
+        pipeline and None is returned.
+        """
+        if self.program is None:
+            try:
+                self.program = shaders.Program(self.vertex_shader, self.fragment_shader)
+            except shaders.ShaderError as e:
+                logging.warning("Drawing without shaders: %s" % e)
+                self.use_shaders = False
+        return self.program
+
     def invalidate_bounding_box(self):
         self._bounding_box = None
 
@@ -27,6 +27,7 @@ from OpenGL.GLUT import *  # type:ignore
 from tatlin.lib.ui.basescene import BaseScene
 
 from .model import Model
+from .shaders import use_shaders
 from .views import View2D, View3D
 from .util import html_color
 
@@ -52,9 +53,16 @@ class Scene(BaseScene):
         self.cursor_y = 0
         self.grid_visible = True
 
+        # draw models with shaders when the context supports them, see
+        # shaders.RENDERERS for the choices
+        self.renderer = "auto"
+        self.shaders_enabled = False
+
         self.view_ortho = View2D()
         self.view_perspective = View3D()
         self.current_view = self.view_perspective
+        # size of the last frame drawn
+        self.viewport = None
 
     def add_model(self, model):
         self.model = model
@@ -82,12 +90,19 @@ class Scene(BaseScene):
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
+        self.shaders_enabled = use_shaders(self.renderer)
+        logging.info(
+            "Drawing models with the %s renderer"
+            % ("shader" if self.shaders_enabled else "legacy")
+        )
         self.init_actors()
 
         self.initialized = True
 
     def init_actors(self):
         for actor in self.actors:
+            if isinstance(actor, Model):
+                actor.use_shaders = self.shaders_enabled
             if not actor.initialized:
                 actor.init()
 
@@ -108,6 +123,8 @@ class Scene(BaseScene):
         except Exception as e:
             logging.error("Error resetting matrices: %s", e)
         
+        self.viewport = (w, h)
+
         # clear the color and depth buffers from any leftover junk
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)  # type:ignore
 
@@ -135,6 +152,9 @@ class Scene(BaseScene):
         self.current_view.begin(w, h)
         try:
             self.current_view.display_transform()
+            # actors may draw fewer vertices when they would be too close
+            # together on the screen to tell apart
+            pixel_scale = self.current_view.pixel_scale(w, h)
 
             if self.mode_ortho:
                 actors_to_draw = self._filter_actors()
@@ -143,6 +163,8 @@ class Scene(BaseScene):
                         elevation=-self.current_view.elevation,
                         mode_ortho=self.mode_ortho,
                         mode_2d=self.mode_2d,
+                        pixel_scale=pixel_scale,
+                        interacting=self.interacting,
                     )
             else:
                 # actors may use eye height to perform rendering optimizations; in
@@ -179,6 +201,8 @@ class Scene(BaseScene):
                         eye_height=eye_height,
                         mode_ortho=self.mode_ortho,
                         mode_2d=self.mode_2d,
+                        pixel_scale=pixel_scale,
+                        interacting=self.interacting,
                     )
         finally:
             self.current_view.end()
@@ -305,6 +329,8 @@ class Scene(BaseScene):
         self.cursor_x = x
         self.cursor_y = y
 
+        if left or middle or right:
+            self.start_interaction()
         self.invalidate()
 
     def wheel_scroll(self, direction):
@@ -316,6 +342,7 @@ class Scene(BaseScene):
         delta_y = direction * delta_y
 
         self.current_view.zoom(0, delta_y)
+        self.start_interaction()
         self.invalidate()
 
     def zoom_in(self, steps: int = 1):
@@ -377,6 +404,33 @@ class Scene(BaseScene):
         self.model.offset_y = -(upper_corner[1] + lower_corner[1]) / 2
         self.model.offset_z = -lower_corner[2]
 
+    def fit_visible_layers(self):
+        """
+        Center the view on the layers of a Gcode model that are drawn, and
+        zoom it to fit them.
+        """
+        if self.viewport is None:
+            return
+
+        end = self.model.num_layers_to_draw
+        # only the top layer drawn is shown in 2d mode
+        first = end - 1 if self.mode_2d else 0
+        bounding_box = self.model.layers_bounding_box(max(first, 0), end)
+        if bounding_box is None:
+            return
+
+        lower_corner = bounding_box.lower_corner
+        upper_corner = bounding_box.upper_corner
+        # models are drawn offset, and flattened in 2d mode
+        offset_z = self.model.offset_z if not self.mode_2d else 0
+        center = [
+            (upper_corner[0] + lower_corner[0]) / 2 + self.model.offset_x,
+            (upper_corner[1] + lower_corner[1]) / 2 + self.model.offset_y,
+            (upper_corner[2] + lower_corner[2]) / 2 + offset_z,
+        ]
+        radius = math.dist(upper_corner, lower_corner) / 2
+        self.current_view.fit(center, radius, *self.viewport)
+
     # ------------------------------------------------------------------------
     # MODEL MANIPULATION
     # ------------------------------------------------------------------------
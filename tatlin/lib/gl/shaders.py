@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Shader programs and vertex arrays for drawing models without the
+fixed-function pipeline.
+
+The programs are written against GLSL 3.30 core and use nothing the core
+profile lacks, so they also run on Mesa's software renderers. Which buffers
+feed which attributes is recorded once in a vertex array object, and
+transforms and colors are passed as uniforms, so drawing a model takes a
+few GL calls a frame instead of setting up client state, lights and
+materials every time.
+
+The rest of the scene still draws with the fixed-function pipeline, so the
+view transformations are read from its matrix stacks.
+"""
+
+import logging
+
+import numpy
+
+from OpenGL.GL import *  # type:ignore
+from OpenGL.GLE import *  # type:ignore
+
+
+# which renderer the scene uses: shaders when the context supports them, or
+# either one regardless
+RENDERERS = ("auto", "shader", "legacy")
+
+GLSL_VERSION = (3, 30)
+
+# vertex attributes of integer types are passed to shaders as integers
+INTEGER_TYPES = (GL_BYTE, GL_UNSIGNED_BYTE, GL_SHORT, GL_UNSIGNED_SHORT, GL_INT)
+
+
+class ShaderError(Exception):
+    pass
+
+
+def glsl_version():
+    """
+    Return the GLSL version of the current context as a (major, minor) tuple,
+    or None if it has none.
+    """
+    try:
+        version = glGetString(GL_SHADING_LANGUAGE_VERSION)
+    except GLError:
+        return None
+    if not version:
+        return None
+    # like b"4.50" or b"3.30 NVIDIA via Cg compiler"
+    number = version.split()[0].decode("ascii", "replace")
+    try:
+        major, minor = number.split(".")[:2]
+        return (int(major), int(minor))
+    except ValueError:
+        return None
+
+
+def shaders_supported():
+    """
+    Return true if the current context can run the programs of this module.
+    """
+    version = glsl_version()
+    return (
+        version is not None
+        and version >= GLSL_VERSION
+        and bool(glGenVertexArrays)
+        and bool(glVertexAttribIPointer)
+    )
+
+
+def use_shaders(renderer):
+    """
+    Return true if models should draw with shaders in the current context,
+    given the configured renderer.
+    """
+    if renderer not in RENDERERS:
+        logging.warning("Unknown renderer %r, using auto" % renderer)
+        renderer = "auto"
+    if renderer == "legacy":
+        return False
+
+    supported = shaders_supported()
+    if renderer == "shader" and not supported:
+        logging.warning(
+            "Shaders need GLSL %d.%d, drawing with the legacy renderer" % GLSL_VERSION
+        )
+    return supported
+
+
+def view_matrices():
+    """
+    Return the current modelview matrix and its product with the projection
+    matrix, in the column-major order glUniformMatrix4fv expects.
+    """
+    # the rows of the arrays returned are the columns of the matrices
+    projection = glGetFloatv(GL_PROJECTION_MATRIX)
+    modelview = glGetFloatv(GL_MODELVIEW_MATRIX)
+    return (
+        numpy.require(modelview, numpy.float32),
+        numpy.dot(modelview, projection).astype(numpy.float32),
+    )
+
+
+class Program(object):
+    """
+    A linked shader program and the locations of its uniforms.
+    """
+
+    def __init__(self, vertex_source, fragment_source):
+        shaders = [
+            self._compile(GL_VERTEX_SHADER, vertex_source),
+            self._compile(GL_FRAGMENT_SHADER, fragment_source),
+        ]
+        self.program = glCreateProgram()
+        for shader in shaders:
+            glAttachShader(self.program, shader)
+        glLinkProgram(self.program)
+        for shader in shaders:
+            glDetachShader(self.program, shader)
+            glDeleteShader(shader)
+
+        if not glGetProgramiv(self.program, GL_LINK_STATUS):
+            log = glGetProgramInfoLog(self.program)
+            glDeleteProgram(self.program)
+            raise ShaderError("Could not link shader program: %s" % _text(log))
+
+        self.locations = {}
+
+    @staticmethod
+    def _compile(shader_type, source):
+        shader = glCreateShader(shader_type)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+            log = glGetShaderInfoLog(shader)
+            glDeleteShader(shader)
+            raise ShaderError("Could not compile shader: %s" % _text(log))
+        return shader
+
+    def location(self, name):
+        location = self.locations.get(name)
+        if location is None:
+            location = glGetUniformLocation(self.program, name)
+            self.locations[name] = location
+        return location
+
+    def use(self):
+        glUseProgram(self.program)
+
+    def unuse(self):
+        glUseProgram(0)
+
+    def delete(self):
+        glDeleteProgram(self.program)
+
+
+def _text(log):
+    if isinstance(log, bytes):
+        return log.decode("utf-8", "replace").strip()
+    return str(log).strip()
+
+
+class VertexArray(object):
+    """
+    Vertex array object recording which buffers feed which attributes.
+
+    Attributes are given as (location, buffer, size, type) tuples of
+    GrowableBuffers. The vertex array is created on the first bind, so no GL
+    context is needed before that, and buffers with data not yet copied into
+    them are uploaded when it is bound.
+    """
+
+    def __init__(self, attributes):
+        self.attributes = list(attributes)
+        self.vao = None
+
+    def bind(self):
+        if self.vao is None:
+            self.vao = glGenVertexArrays(1)
+            glBindVertexArray(self.vao)
+            for location, buffer, size, gl_type in self.attributes:
+                buffer.bind()
+                if gl_type in INTEGER_TYPES:
+                    glVertexAttribIPointer(location, size, gl_type, 0, None)
+                else:
+                    glVertexAttribPointer(location, size, gl_type, GL_FALSE, 0, None)
+                glEnableVertexAttribArray(location)
+                buffer.unbind()
+            return
+
+        glBindVertexArray(self.vao)
+        for _, buffer, _, _ in self.attributes:
+            if buffer.pending:
+                buffer.bind()
+                buffer.unbind()
+
+    def unbind(self):
+        glBindVertexArray(0)
+
+    def delete(self):
+        if self.vao is not None:
+            glDeleteVertexArrays(1, [self.vao])
+            self.vao = None
@@ -22,9 +22,10 @@ import time
 
 from OpenGL.GL import *  # type:ignore
 from OpenGL.GLE import *  # type:ignore
-from OpenGL.arrays.vbo import VBO
 
+from .buffers import GrowableBuffer
 from .model import Model
+from .shaders import VertexArray, view_matrices
 
 from tatlin.lib import vector
 
@@ -34,6 +35,65 @@ class StlModel(Model):
     Model for displaying and manipulating STL data.
     """
 
+    # facets are lit like the legacy renderer lights them: the ambient and
+    # diffuse colors of the material follow the white current color, only
+    # the first light is specular, and the viewer is at infinity
+    vertex_shader = """
+        #version 330 core
+
+        uniform mat4 view;
+        uniform mat4 modelview;
+        uniform vec4 light_positions[2];
+
+        layout(location = 0) in vec3 position;
+        layout(location = 1) in vec3 normal;
+
+        out vec4 color;
+
+        const float ambient = 0.2 + 0.3;
+        const float diffuse = 0.3;
+        const float specular = 0.7;
+        const float shininess = 32.0;
+
+        void main()
+        {
+            gl_Position = view * vec4(position, 1.0);
+
+            vec4 eye_position = modelview * vec4(position, 1.0);
+            vec3 eye_normal = normalize(mat3(modelview) * normal);
+            float intensity = ambient;
+            for (int i = 0; i < 2; i++) {
+                vec4 light = modelview * light_positions[i];
+                vec3 direction = normalize(
+                    light.w == 0.0 ? light.xyz : light.xyz - eye_position.xyz
+                );
+                float lambert = dot(eye_normal, direction);
+                if (lambert > 0.0) {
+                    intensity += diffuse * lambert;
+                    if (i == 0) {
+                        vec3 halfway = normalize(direction + vec3(0.0, 0.0, 1.0));
+                        intensity += specular * pow(
+                            max(dot(eye_normal, halfway), 0.0), shininess
+                        );
+                    }
+                }
+            }
+            color = vec4(vec3(min(intensity, 1.0)), 1.0);
+        }
+    """
+    fragment_shader = """
+        #version 330 core
+
+        in vec4 color;
+
+        out vec4 frag_color;
+
+        void main()
+        {
+            frag_color = color;
+        }
+    """
+
     def load_data(self, model_data, callback=None):
         t_start = time.time()
 
@@ -53,6 +113,10 @@ class StlModel(Model):
         self.mat_shininess = 50.0
         self.light_position = (20.0, 20.0, 20.0)
 
+        # vertex arrays replaced by init, to delete in the GL context
+        self.vertex_array = None
+        self.stale_arrays = []
+
         self.vertex_count = len(self.vertices)
         self.initialized = False
 
@@ -92,13 +156,19 @@ class StlModel(Model):
         """
         Create vertex buffer objects (VBOs).
         """
-        self.vertex_buffer = VBO(self.vertices, "GL_STATIC_DRAW")
+        self.vertex_buffer = GrowableBuffer(self.vertices)
 
         if self.normal_data_empty():
             logging.info("STL model has no normal data")
             self.normals = self.calculate_normals()
 
-        self.normal_buffer = VBO(self.normals, "GL_STATIC_DRAW")
+        self.normal_buffer = GrowableBuffer(self.normals)
+
+        if self.vertex_array is not None:
+            self.stale_arrays.append(self.vertex_array)
+        self.vertex_array = VertexArray(
+            [(0, self.vertex_buffer, 3, GL_FLOAT), (1, self.normal_buffer, 3, GL_FLOAT)]
+        )
         self.initialized = True
 
     def draw_facets(self):
@@ -149,7 +219,31 @@ class StlModel(Model):
         finally:
             glPopMatrix()
 
+    def draw_facets_shaded(self):
+        for vertex_array in self.stale_arrays:
+            vertex_array.delete()
+        self.stale_arrays = []
+
+        program = self.program
+        program.use()
+
+        modelview, view = view_matrices()
+        glUniformMatrix4fv(program.location("view"), 1, GL_FALSE, view)
+        glUniformMatrix4fv(program.location("modelview"), 1, GL_FALSE, modelview)
+        light_positions = [self.light_position + (0.0,), (-20.0, -20.0, 20.0, 0.0)]
+        glUniform4fv(program.location("light_positions"), 2, light_positions)
+
+        self.vertex_array.bind()
+        glDrawArrays(GL_TRIANGLES, 0, len(self.vertices))
+        self.vertex_array.unbind()
+
+        program.unuse()
+
     def display(self, *args, **kwargs):
+        if self.use_shaders and self.shader_program() is not None:
+            self.draw_facets_shaded()
+            return
+
         glEnable(GL_LIGHTING)
         self.draw_facets()
         glDisable(GL_LIGHTING)
@@ -16,6 +16,8 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 
+import math
+
 from OpenGL.GL import *  # type:ignore
 from OpenGL.GLU import *  # type:ignore
 from OpenGL.GLUT import *  # type:ignore
@@ -28,6 +30,8 @@ class ViewMode(object):
 
     ZOOM_MIN = 0.1
     ZOOM_MAX = 800
+    # part of the viewport a fitted object spans
+    FIT_MARGIN = 0.9
 
     def __init__(self):
         self._stack = []
@@ -68,6 +72,31 @@ class ViewMode(object):
         """
         raise NotImplementedError("method not implemented")
 
+    def pixel_scale(self, w, h):
+        """
+        Return how many pixels a millimeter at the center of the view spans
+        on a w by h viewport.
+        """
+        raise NotImplementedError("method not implemented")
+
+    def fit(self, center, radius, w, h):
+        """
+        Look at a point of the scene, zoomed to fit a sphere of radius
+        millimeters around it in a w by h viewport.
+        """
+        if radius > 0:
+            # the scale of the view grows with its zoom factor
+            scale = self.pixel_scale(w, h) / self.zoom_factor
+            zoom = min(w, h) * self.FIT_MARGIN / (2 * radius * scale)
+            self.zoom_factor = min(max(zoom, self.ZOOM_MIN), self.ZOOM_MAX)
+        self.look_at(center)
+
+    def look_at(self, point):
+        """
+        Pan the view to put a point of the scene in the middle of it.
+        """
+        raise NotImplementedError("method not implemented")
+
     def zoom(self, delta_x, delta_y):
         if delta_y > 0:
             self.zoom_factor = min(self.zoom_factor * 1.2, self.ZOOM_MAX)
@@ -135,6 +164,16 @@ class View2D(ViewMode):
         glOrtho(-x, x, -y, y, self.NEAR, self.FAR)
         glMatrixMode(GL_MODELVIEW)
 
+    def pixel_scale(self, w, h):
+        return self.zoom_factor
+
+    def look_at(self, point):
+        # the point is rotated and zoomed before the view is panned
+        angle = math.radians(self.azimuth)
+        x, y = point[0], point[1]
+        self.x = -self.zoom_factor * (x * math.cos(angle) - y * math.sin(angle))
+        self.y = -self.zoom_factor * (x * math.sin(angle) + y * math.cos(angle))
+
     def ui_transform(self, length):
         glTranslate(length + 20.0, length + 20.0, 0.0)
         glRotate(self.azimuth, 0.0, 0.0, 1.0)
@@ -274,6 +313,26 @@ class View3D(ViewMode):
         glDisable(GL_LIGHT0)
         glDisable(GL_LIGHTING)
 
+    def pixel_scale(self, w, h):
+        if self.ortho:
+            return self.zoom_factor * self.ZOOM_ORTHO_ADJ
+        # the center of rotation is y away from the eye, in units zoomed in on
+        distance = abs(self.y) or self.NEAR
+        focal_length = h / (2 * math.tan(math.radians(self.FOVY / 2)))
+        return self.zoom_factor * focal_length / distance
+
+    def look_at(self, point):
+        # the point is rotated before the view is panned across the screen,
+        # after zooming, so panning is in millimeters
+        self.offset_x = self.offset_y = 0.0
+        azimuth = math.radians(self.azimuth)
+        elevation = math.radians(-self.elevation)
+        x, y, z = point
+        rotated_x = x * math.cos(azimuth) - y * math.sin(azimuth)
+        rotated_y = x * math.sin(azimuth) + y * math.cos(azimuth)
+        self.x = -rotated_x
+        self.z = -(rotated_y * math.sin(elevation) + z * math.cos(elevation))
+
     def ui_transform(self, length):
         glRotate(-90, 1.0, 0.0, 0.0)  # make z point up
         glTranslate(length + 20.0, 0.0, length + 20.0)
@@ -1,4 +1,4 @@
-from .baseloader import determine_filetype, ModelFileError  # pass-thru import
+from .baseloader import determine_filetype, ModelFileError, STDIN_PATH  # pass-thru import
 from .gcode.loader import GcodeModelLoader
 from .stl.loader import STLModelLoader
 
@@ -2,6 +2,10 @@ from abc import ABC, abstractmethod
 import os
 
 
+# path used to read a model from the standard input
+STDIN_PATH = "-"
+
+
 class ModelFileError(Exception):
     pass
 
@@ -57,18 +61,54 @@ class BaseModelLoader(ABC):
     @property
     def size(self):
         """
-        File size in bytes.
+        File size in bytes, or None if the size cannot be known before the
+        file has been read, like with pipes and FIFOs.
         """
-        if self._size is None:
+        if self._size is None and self.path != STDIN_PATH and os.path.isfile(self.path):
             self._size = os.path.getsize(self.path)
         return self._size
 
+    def load(self, config, scene, progress_dlg):
+        """
+        Read the model and add it to the scene. Return the model and the class
+        of the panel for it.
+        """
+        model = self.read(config, progress_dlg)
+        self.store(config, model)
+        return model, self.show(model, config, scene)
+
     @abstractmethod
-    def load(self, scene, read_cb, load_cb):
+    def read(self, config, progress_dlg, preview=None):
+        """
+        Read the file into a model and return it. This makes no GL calls, so
+        it can run on any thread.
+
+        Loaders that can show a file while reading it pass preview a model of
+        the first part of the file, then call preview(model, data) with every
+        following part for the thread showing the model to append it. The
+        model returned is only complete once that has been done.
+        """
         pass
 
+    def store(self, config, model):
+        """
+        Keep what is needed to read a complete model faster the next time,
+        like in a cache.
+        """
+        pass
+
+    @abstractmethod
+    def show(self, model, config, scene):
+        """
+        Add a model read from the file to the scene and return the class of
+        the panel for it.
+        """
+        pass
 
 def determine_filetype(fpath):
+    if fpath == STDIN_PATH:
+        return "gcode"
+
     ext = os.path.splitext(fpath)[-1].lower()
 
     if ext not in [".gcode", ".nc", ".stl"]:
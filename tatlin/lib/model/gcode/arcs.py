@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Tessellation of circular arcs (G2/G3) into line segments.
+
+The parser keeps arcs as compact records next to the movements: every
+record is a row of (movement row, offset of the center from the start point
+along the first and the second axis of the plane, kind), where kind is
+plane * 2 + clockwise and plane is 0, 1 or 2 for G17, G18 or G19. The arc
+starts at the point of the previous movement and ends at that of its own.
+"""
+
+import math
+
+import numpy
+
+from .table import MovementTable
+
+
+# first, second and normal axis of the planes selected by G17, G18 and G19
+PLANE_AXES = numpy.array([[0, 1, 2], [2, 0, 1], [1, 2, 0]])
+
+# an arc is always cut into at least 8 segments per full turn
+MAX_STEP = math.pi / 4
+
+
+def arc_kind(plane, clockwise):
+    return plane * 2 + int(clockwise)
+
+
+def tessellate(table, arcs, start_point=None, tolerance=0.01, max_segments=1024):
+    """
+    Return a MovementTable with the movements of every arc record replaced by
+    segments whose chords are at most tolerance away from the arc, so that
+    the number of segments grows with the radius of the arc. start_point is
+    where an arc in the first row starts.
+    """
+    arcs = numpy.asarray(arcs, numpy.float64).reshape(-1, 4)
+    if len(arcs) == 0:
+        return table
+
+    rows = arcs[:, 0].astype(numpy.int64)
+    kinds = arcs[:, 3].astype(numpy.int64)
+    axes = PLANE_AXES[kinds // 2]
+    clockwise = kinds % 2 == 1
+
+    vertices = table.vertices.astype(numpy.float64)
+    ends = vertices[rows]
+    starts = vertices[numpy.maximum(rows - 1, 0)]
+    if rows[0] == 0:
+        # rounded like the vertices, so that arcs do not depend on where
+        # parsing started
+        starts[0] = numpy.asarray(start_point, numpy.float32)
+
+    # coordinates in the plane of the arc, and along its normal
+    idx = numpy.arange(len(arcs))
+    start_u, start_v, start_n = (starts[idx, axes[:, i]] for i in range(3))
+    end_u, end_v, end_n = (ends[idx, axes[:, i]] for i in range(3))
+    center_u = start_u + arcs[:, 1]
+    center_v = start_v + arcs[:, 2]
+
+    start_radius = numpy.hypot(start_u - center_u, start_v - center_v)
+    end_radius = numpy.hypot(end_u - center_u, end_v - center_v)
+    start_angle = numpy.arctan2(start_v - center_v, start_u - center_u)
+    end_angle = numpy.arctan2(end_v - center_v, end_u - center_u)
+
+    # sweep in the direction of the arc, a full turn if it ends where it starts
+    travel = numpy.where(clockwise, start_angle - end_angle, end_angle - start_angle)
+    travel %= 2 * math.pi
+    travel[travel < 1e-9] = 2 * math.pi
+    sweep = numpy.where(clockwise, -travel, travel)
+
+    # a chord spanning angle a is radius * (1 - cos(a / 2)) away from the arc
+    radius = numpy.maximum(start_radius, end_radius)
+    with numpy.errstate(divide="ignore"):
+        cos_half_step = numpy.clip(1 - tolerance / radius, -1, 1)
+    step = numpy.minimum(2 * numpy.arccos(cos_half_step), MAX_STEP)
+    segments = numpy.clip(numpy.ceil(travel / step), 1, max_segments).astype(numpy.int64)
+
+    # every arc row becomes as many rows as it has segments
+    counts = numpy.ones(table.num_movements, numpy.int64)
+    counts[rows] = segments
+    firsts = numpy.cumsum(counts) - counts
+    total = int(counts.sum())
+
+    out_vertices = numpy.empty((total, 3), numpy.float32)
+    out_delta_e = numpy.empty(total, numpy.float32)
+    out_feedrate = numpy.empty(total, numpy.float32)
+    out_flags = numpy.empty(total, numpy.uint8)
+
+    lines = numpy.ones(table.num_movements, bool)
+    lines[rows] = False
+    out_vertices[firsts[lines]] = table.vertices[lines]
+    out_delta_e[firsts[lines]] = table.delta_e[lines]
+    out_feedrate[firsts[lines]] = table.feedrate[lines]
+    out_flags[firsts[lines]] = table.flags[lines]
+
+    # points along the arcs, with the radius and the height changing evenly
+    arc_idx = numpy.repeat(idx, segments)
+    num = numpy.arange(len(arc_idx)) - numpy.repeat(numpy.cumsum(segments) - segments, segments) + 1
+    fraction = num / segments[arc_idx]
+    angle = start_angle[arc_idx] + fraction * sweep[arc_idx]
+    arc_radius = start_radius[arc_idx] + fraction * (
+        end_radius[arc_idx] - start_radius[arc_idx]
+    )
+
+    points = numpy.empty((len(arc_idx), 3))
+    point_idx = numpy.arange(len(arc_idx))
+    point_axes = axes[arc_idx]
+    points[point_idx, point_axes[:, 0]] = center_u[arc_idx] + arc_radius * numpy.cos(angle)
+    points[point_idx, point_axes[:, 1]] = center_v[arc_idx] + arc_radius * numpy.sin(angle)
+    points[point_idx, point_axes[:, 2]] = start_n[arc_idx] + fraction * (
+        end_n[arc_idx] - start_n[arc_idx]
+    )
+    last = num == segments[arc_idx]
+    points[last] = ends[arc_idx[last]]
+
+    positions = firsts[rows][arc_idx] + num - 1
+    out_vertices[positions] = points
+    out_delta_e[positions] = (table.delta_e[rows] / segments)[arc_idx]
+    out_feedrate[positions] = table.feedrate[rows][arc_idx]
+    out_flags[positions] = table.flags[rows][arc_idx]
+
+    layer_stops = numpy.append(firsts, total)[table.layer_stops]
+    return MovementTable(out_vertices, out_delta_e, out_feedrate, out_flags, layer_stops)
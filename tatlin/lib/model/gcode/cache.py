@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+On-disk cache of the arrays of loaded gcode models.
+
+Every entry is a single file: an 8-byte magic, the format version and the
+length of a JSON header as little-endian 32-bit integers, the header and
+then the arrays, each aligned to 64 bytes. The header describes the key of
+the entry and the name, dtype, shape and offset of every array, so entries
+are read back by memory-mapping the file and viewing the arrays in place.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy
+
+
+MAGIC = b"TATLINGC"
+
+# bump whenever the layout of the file or the contents of the arrays change
+FORMAT_VERSION = 7
+
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGN = 64
+
+
+def default_directory():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "tatlin")
+
+
+class GcodeCache(object):
+    """
+    Cache of model arrays, stored in a directory with at most max_size bytes
+    of entries; the least recently used entries are removed first.
+
+    Entries are keyed by the real path, size and modification time of the
+    gcode file. With use_hash, they are keyed by the size and a hash of the
+    contents instead, so that copies of a file on other machines hit the same
+    entry when the directory is shared, like one on a network drive used by a
+    whole print farm. Entries are written to a temporary file and renamed into
+    place, so readers never see a partial entry.
+    """
+
+    suffix = ".gcache"
+
+    # settings the arrays depend on, which are part of every key
+    variant = None
+
+    def __init__(self, directory=None, max_size=512 << 20, use_hash=False):
+        self.directory = os.path.expanduser(directory or default_directory())
+        self.max_size = max_size
+        self.use_hash = use_hash
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create a cache from the cache.* settings, or return None if caching is
+        turned off.
+        """
+        max_size = config.read("cache.max_size", int)
+        if not max_size or max_size <= 0:
+            return None
+        directory = config.read("cache.directory")
+        return cls(
+            directory if isinstance(directory, str) else None,
+            max_size << 20,  # megabytes
+            bool(config.read("cache.hash", int)),
+        )
+
+    def key(self, path):
+        """
+        Return the key of the entry for a gcode file.
+        """
+        stat = os.stat(path)
+        if self.use_hash:
+            key = "%d:%s" % (stat.st_size, self._hash(path))
+        else:
+            key = "%s:%d:%d" % (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+        if self.variant:
+            key += ":" + self.variant
+        return key
+
+    def _hash(self, path):
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    digest.update(buf)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + self.suffix)
+
+    def load(self, path):
+        """
+        Return a dict of read-only arrays memory-mapped from the entry for a
+        gcode file, or None if there is no valid entry.
+        """
+        try:
+            key = self.key(path)
+            entry = self.entry_path(key)
+            with open(entry, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            arrays = self._read(buf, key)
+        except (ValueError, KeyError, TypeError, struct.error) as e:
+            logging.info("Ignoring invalid cache entry %s: %s" % (entry, e))
+            arrays = None
+
+        if arrays is None:
+            try:
+                buf.close()
+            except BufferError:
+                pass  # unmapped once the arrays are gone
+            self._remove(entry)
+            return None
+
+        try:
+            # mark the entry as recently used
+            os.utime(entry)
+        except OSError:
+            pass
+        logging.info("Loaded %s from cache entry %s" % (path, entry))
+        return arrays
+
+    def _read(self, buf, key):
+        magic, version, header_len = _PREAMBLE.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError("not a cache entry")
+        if version != FORMAT_VERSION:
+            return None
+
+        header = json.loads(buf[_PREAMBLE.size : _PREAMBLE.size + header_len])
+        if header["key"] != key:
+            # the hash of the key collided, or the file has changed
+            return None
+
+        arrays = {}
+        for name, dtype, shape, offset in header["arrays"]:
+            dtype = numpy.dtype(dtype)
+            count = int(numpy.prod(shape, dtype=numpy.int64))
+            if offset + count * dtype.itemsize > len(buf):
+                raise ValueError("truncated entry")
+            array = numpy.frombuffer(buf, dtype, count, offset)
+            arrays[name] = array.reshape(shape)
+        return arrays
+
+    def store(self, path, arrays):
+        """
+        Store a dict of arrays as the entry for a gcode file and evict old
+        entries if the cache has grown too large.
+        """
+        key = self.key(path)
+        arrays = {name: numpy.ascontiguousarray(a) for name, a in arrays.items()}
+
+        header_len = 0
+        while True:
+            # offsets depend on the length of the header and the other way
+            # round, so lay them out until they settle
+            offset = _align(_PREAMBLE.size + header_len)
+            layout = []
+            for name, array in arrays.items():
+                layout.append((name, array.dtype.str, array.shape, offset))
+                offset = _align(offset + array.nbytes)
+            header = json.dumps({"key": key, "arrays": layout}).encode("utf-8")
+            if len(header) <= header_len:
+                header = header.ljust(header_len)
+                break
+            header_len = len(header)
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_len))
+                f.write(header)
+                for (_, _, _, offset), array in zip(layout, arrays.values()):
+                    f.write(b"\0" * (offset - f.tell()))
+                    f.write(array)
+            os.replace(tmp_path, self.entry_path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        max_size bytes.
+        """
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(self.suffix):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue  # removed by somebody else
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            self._remove(entry)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _align(offset):
+    return -(-offset // _ALIGN) * _ALIGN
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Merging runs of short, nearly collinear movements.
+
+Vase mode prints, toolpaths made from 3D scans and CAM output can have long
+runs of tiny moves along what is almost a straight line. Consecutive
+movements of a layer with the same flags and feedrate that both extrude or
+both do not are merged whenever every point dropped stays within a tolerance
+of the movement replacing it.
+
+Points are dropped in passes over the whole table: every pass considers
+every other point still kept, so that no two neighbors go in the same pass,
+and runs of n mergeable movements take about log2(n) passes. Every kept
+point carries a bound on how far the points dropped before it are from the
+movement ending there. Dropping a point p between a and b moves those points
+at most as far as p is from the movement from a to b, so the bound of the
+merged movement is the larger bound of the two plus that distance.
+"""
+
+import numpy
+
+from .table import MovementTable
+
+
+def coalesce(table, tolerance, max_passes=64):
+    """
+    Return a MovementTable with runs of alike movements merged wherever no
+    point dropped is more than tolerance away from the movement replacing
+    it. The first movement, which can be the starting point, and the last
+    movement of every layer are kept, and merged movements extrude as much
+    as the movements they replace.
+    """
+    count = table.num_movements
+    if tolerance is None or tolerance <= 0 or count < 3:
+        return table
+
+    flags = table.flags
+    feedrate = table.feedrate
+    extruding = table.delta_e > 0
+    # the point between two movements can go if they are alike and in the
+    # same layer
+    alike = (
+        (flags[1:] == flags[:-1])
+        & (feedrate[1:] == feedrate[:-1])
+        & (extruding[1:] == extruding[:-1])
+    )
+    droppable = numpy.zeros(count, bool)
+    droppable[1:-1] = alike[1:]
+    stops = table.layer_stops
+    droppable[stops[(stops > 0) & (stops < count)] - 1] = False
+    if not droppable.any():
+        return table
+
+    points = table.vertices.astype(numpy.float64)
+    bounds = numpy.zeros(count)
+    keep = numpy.arange(count)
+    parity = 1
+    idle = 0
+    for _ in range(max_passes):
+        pos = numpy.arange(parity, len(keep) - 1, 2)
+        pos = pos[(pos > 0) & droppable[keep[pos]]]
+        parity ^= 1
+
+        before, middle, after = keep[pos - 1], keep[pos], keep[pos + 1]
+        bound = numpy.maximum(bounds[middle], bounds[after]) + segment_distances(
+            points[middle], points[before], points[after]
+        )
+        dropped = bound <= tolerance
+        if not dropped.any():
+            idle += 1
+            if idle == 2:
+                break
+            continue
+
+        idle = 0
+        bounds[after[dropped]] = bound[dropped]
+        mask = numpy.ones(len(keep), bool)
+        mask[pos[dropped]] = False
+        keep = keep[mask]
+
+    if len(keep) == count:
+        return table
+
+    delta_e = numpy.diff(numpy.cumsum(table.delta_e, dtype=numpy.float64)[keep])
+    delta_e = numpy.concatenate((table.delta_e[:1], delta_e))
+    return MovementTable(
+        table.vertices[keep],
+        delta_e,
+        feedrate[keep],
+        flags[keep],
+        numpy.searchsorted(keep, stops),
+    )
+
+
+def segment_distances(points, starts, ends):
+    """
+    Return the distances of points from line segments.
+    """
+    lines = ends - starts
+    offsets = points - starts
+    lengths = numpy.einsum("ij,ij->i", lines, lines)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        t = numpy.einsum("ij,ij->i", offsets, lines) / lengths
+    t = numpy.clip(numpy.nan_to_num(t), 0, 1)
+    return numpy.linalg.norm(offsets - t[:, numpy.newaxis] * lines, axis=1)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Gcode flavors: how the program that generated a file marks perimeters, loops
+and layers in comments, and which commands switch the extruder and units.
+
+Every flavor declares its markers once. They are compiled into a single
+pattern whose matching group picks the action to take. Slicers repeat the
+same few comments over and over, so the action of a comment is remembered
+and handling the flags of a command mostly takes one dictionary lookup of its
+comment, and one of its code if the comment has no marker. The flavor of a
+file is detected from its header.
+"""
+
+from collections import OrderedDict
+import re
+
+
+# flags of movements, also known as Movement.FLAG_*
+FLAG_PERIMETER = 1
+FLAG_PERIMETER_OUTER = 2
+FLAG_LOOP = 4
+FLAG_SURROUND_LOOP = 8
+FLAG_EXTRUDER_ON = 16
+FLAG_INCHES = 32
+
+# bytes at the start of a file that are looked at to detect its flavor
+HEADER_SIZE = 32 << 10
+# lines looked at when the file is read line by line
+HEADER_LINES = 500
+
+ALL_FLAGS = 0xFF
+PERIMETER_FLAGS = FLAG_PERIMETER | FLAG_PERIMETER_OUTER
+FEATURE_FLAGS = PERIMETER_FLAGS | FLAG_LOOP
+
+
+def action(add=0, clear=0, layer=False):
+    """
+    Return the action of a marker or command: the flags to clear, then the
+    flags to add, and whether it ends the current layer. Actions are tuples of
+    the mask of flags to keep, the flags to add and the layer boolean.
+    """
+    return (ALL_FLAGS & ~(clear | add), add, layer)
+
+
+# extruder or spindle and unit commands understood by most flavors
+COMMANDS = {
+    "M101": action(add=FLAG_EXTRUDER_ON),
+    "M3": action(add=FLAG_EXTRUDER_ON),
+    "M03": action(add=FLAG_EXTRUDER_ON),
+    "M4": action(add=FLAG_EXTRUDER_ON),
+    "M04": action(add=FLAG_EXTRUDER_ON),
+    "M103": action(clear=FLAG_EXTRUDER_ON),
+    "M5": action(clear=FLAG_EXTRUDER_ON),
+    "M05": action(clear=FLAG_EXTRUDER_ON),
+    "G20": action(add=FLAG_INCHES),
+    "G21": action(clear=FLAG_INCHES),
+}
+
+
+_UNKNOWN = object()
+
+
+class Flavor(object):
+    """
+    Comment markers and commands of a gcode flavor.
+
+    Markers are regular expressions searched for in comments, in order of
+    priority, each with an action (see action). A command whose comment has
+    no marker takes the action of its code, or the default action, which is
+    None to leave the flags alone.
+
+    Flavors that reset the flags have a default action that clears them, so
+    every line describes only itself; their markers may only add flags.
+    """
+
+    # distinct comments whose actions are remembered
+    max_cached = 4096
+
+    def __init__(self, name, markers=(), commands=COMMANDS, default=None):
+        self.name = name
+        self.markers = tuple(markers)
+        self.commands = dict(commands)
+        self.default = default
+
+        # groups are numbered from 1, in the order of the markers
+        pattern = "|".join("(%s)" % marker for marker, _ in self.markers)
+        self.marker_actions = (None,) + tuple(act for _, act in self.markers)
+        self._search = re.compile(pattern).search if self.markers else None
+        self._comment_actions = {}
+
+        # layer markers never go together with flags in a run of lines (see
+        # GcodeIndexer), so they are kept apart as well
+        layer_markers = [marker for marker, act in self.markers if act[2]]
+        self.byte_pattern = _byte_pattern(marker for marker, _ in self.markers)
+        self.layer_byte_pattern = _byte_pattern(layer_markers)
+
+    @property
+    def resets(self):
+        return self.default is not None
+
+    def marker_action(self, comment):
+        """
+        Return the action of the first marker in a comment, or None.
+        """
+        if self._search is None:
+            return None
+        match = self._search(comment)
+        if match is None:
+            return None
+        return self.marker_actions[match.lastindex]
+
+    def action(self, gcode, comment):
+        """
+        Return the action to take for a command, or None.
+        """
+        if comment:
+            action = self._comment_actions.get(comment, _UNKNOWN)
+            if action is _UNKNOWN:
+                action = self.marker_action(comment)
+                if len(self._comment_actions) >= self.max_cached:
+                    self._comment_actions.clear()
+                self._comment_actions[comment] = action
+            if action is not None:
+                return action
+        return self.commands.get(gcode, self.default)
+
+    def __repr__(self):
+        return "Flavor(%r)" % self.name
+
+
+def _byte_pattern(markers):
+    markers = list(markers)
+    if not markers:
+        return None
+    return re.compile("|".join(markers).encode("ascii"))
+
+
+# ----------------------------------------------------------------------------
+# FLAVORS
+# ----------------------------------------------------------------------------
+
+SKEINFORGE = Flavor(
+    "skeinforge",
+    [
+        (r"<loop>", action(add=FLAG_LOOP)),
+        (r"</loop>", action(clear=FLAG_LOOP)),
+        (r"<perimeter>(?=.*outer)", action(add=PERIMETER_FLAGS)),
+        (r"<perimeter>", action(add=FLAG_PERIMETER)),
+        (r"</perimeter>\)", action(clear=PERIMETER_FLAGS)),
+        (r"<surroundingLoop>", action(add=FLAG_SURROUND_LOOP)),
+        (r"</surroundingLoop>", action(clear=FLAG_SURROUND_LOOP)),
+        (r"</layer>", action(layer=True)),
+    ],
+)
+
+# Slic3r describes every line in its comment, so lines without a marker clear
+# the flags
+SLIC3R = Flavor(
+    "slic3r",
+    [
+        (r"perimeter", action(add=PERIMETER_FLAGS)),
+        (r"skirt", action(add=FLAG_LOOP)),
+        (r"</layer>", action(clear=ALL_FLAGS, layer=True)),
+    ],
+    commands={},
+    default=action(clear=ALL_FLAGS),
+)
+
+# actions of features named in comments
+OUTER_PERIMETER = action(PERIMETER_FLAGS, FEATURE_FLAGS)
+INNER_PERIMETER = action(FLAG_PERIMETER, FEATURE_FLAGS)
+SKIRT = action(FLAG_LOOP, FEATURE_FLAGS)
+OTHER_FEATURE = action(clear=FEATURE_FLAGS)  # like infill or support
+
+# PrusaSlicer and the slicers derived from it (SuperSlicer, OrcaSlicer, Bambu
+# Studio) name the feature printed from a ;TYPE: comment on, and so does Cura
+_PRUSASLICER_TYPES = [
+    (r";TYPE:(?:External perimeter|Overhang perimeter|Outer wall)", OUTER_PERIMETER),
+    (r";TYPE:(?:Perimeter|Inner wall)", INNER_PERIMETER),
+    (r";TYPE:(?:Skirt|Brim)", SKIRT),
+]
+_CURA_TYPES = [
+    (r";TYPE:WALL-OUTER", OUTER_PERIMETER),
+    (r";TYPE:WALL-INNER", INNER_PERIMETER),
+    (r";TYPE:SKIRT", SKIRT),
+]
+_OTHER_TYPE = [(r";TYPE:", OTHER_FEATURE)]
+
+PRUSASLICER = Flavor("prusaslicer", _PRUSASLICER_TYPES + _OTHER_TYPE)
+
+CURA = Flavor("cura", _CURA_TYPES + _OTHER_TYPE)
+
+SIMPLIFY3D = Flavor(
+    "simplify3d",
+    [
+        (r"; feature outer perimeter", OUTER_PERIMETER),
+        (r"; feature inner perimeter", INNER_PERIMETER),
+        (r"; feature skirt", SKIRT),
+        (r"; feature ", OTHER_FEATURE),
+    ],
+)
+
+# files for Klipper come from any of the slicers above, configured for it
+KLIPPER = Flavor("klipper", _PRUSASLICER_TYPES + _CURA_TYPES + _OTHER_TYPE)
+
+# comments of CNC programs are free text, only the spindle and units matter
+CNC = Flavor("cnc")
+
+FLAVORS = OrderedDict(
+    (flavor.name, flavor)
+    for flavor in (SKEINFORGE, SLIC3R, PRUSASLICER, CURA, SIMPLIFY3D, KLIPPER, CNC)
+)
+
+# the flavor of files that are not recognized
+DEFAULT_FLAVOR = SKEINFORGE
+
+
+def get_flavor(name):
+    try:
+        return FLAVORS[name]
+    except KeyError:
+        raise ValueError("unknown gcode flavor: %r" % name)
+
+
+# ----------------------------------------------------------------------------
+# DETECTION
+# ----------------------------------------------------------------------------
+
+# the slicer that generated a file names itself near the top, the first name
+# found wins
+_SLICERS = [
+    ("prusaslicer", rb"PrusaSlicer|SuperSlicer|OrcaSlicer|BambuStudio"),
+    ("slic3r", rb"Slic3r"),
+    ("skeinforge", rb"[Ss]keinforge"),
+    ("cura", rb"Cura_SteamEngine|;FLAVOR:"),
+    ("simplify3d", rb"Simplify3D"),
+]
+_slicer_search = re.compile(
+    b"|".join(b"(%s)" % pattern for _, pattern in _SLICERS)
+).search
+
+# otherwise, commands tell what the file is for
+_MACHINES = [
+    ("klipper", re.compile(rb"EXCLUDE_OBJECT_DEFINE|SET_PRINT_STATS_INFO")),
+    ("cnc", re.compile(rb"^[ \t]*M0?[345](?![0-9])", re.MULTILINE)),
+]
+
+
+def detect_flavor(header):
+    """
+    Return the flavor of gcode given the start of it, as bytes or a string.
+    """
+    if isinstance(header, str):
+        header = header.encode("utf-8", "replace")
+    header = bytes(header[:HEADER_SIZE])
+
+    match = _slicer_search(header)
+    if match is not None:
+        return FLAVORS[_SLICERS[match.lastindex - 1][0]]
+
+    for name, pattern in _MACHINES:
+        if pattern.search(header):
+            return FLAVORS[name]
+
+    return DEFAULT_FLAVOR
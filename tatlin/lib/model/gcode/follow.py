@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Following gcode files that are still being written.
+"""
+
+import logging
+import mmap
+import os
+
+from .parser import GcodeBulkLexer, GcodeParser
+
+
+class GcodeFollower(object):
+    """
+    Parse a gcode file that grows at the end, a piece at a time.
+
+    The parser keeps its state between reads, so every read only parses the
+    lines appended since the previous one. A line is only read once it is
+    complete; the rest of it is left for the next read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.parser = GcodeParser(GcodeBulkLexer())
+        self.position = 0  # bytes of complete lines read so far
+        self._file_id = None
+
+    def read(self, callback=None):
+        """
+        Parse the lines appended since the last read and return their
+        movements in a MovementTable, whose first layer continues the last
+        layer of the previous read.
+
+        Return None if the file has been truncated or replaced since the last
+        read, in which case it has to be loaded again from the start.
+        """
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_dev, stat.st_ino)
+            if self._file_id is None:
+                self._file_id = file_id
+            elif file_id != self._file_id or stat.st_size < self.position:
+                logging.info("%s has been truncated or replaced" % self.path)
+                return None
+
+            data = b""
+            if stat.st_size > self.position:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                end = max(buf.rfind(b"\n", self.position), buf.rfind(b"\r", self.position))
+                if end >= 0:
+                    data = memoryview(buf)[self.position : end + 1]
+
+            self.parser.load(data)
+            table = self.parser.parse_continued(callback)
+            self.position += len(data)
+            return table
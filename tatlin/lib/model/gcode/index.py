@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Random access to the layers of large gcode files.
+
+A first pass over the file only finds where layers start, together with
+the parser state at that point, so that any layer can later be parsed on
+its own.
+"""
+
+from collections import OrderedDict
+import logging
+import math
+import time
+
+import numpy
+
+from .arcs import PLANE_AXES
+from .flavors import HEADER_SIZE
+from .parser import GcodeBulkLexer, GcodeParser, GcodeParserError, Movement
+
+
+class GcodeLayerIndex(object):
+    """
+    Byte offsets of the lines at which the layers of a gcode file start,
+    with a snapshot of the parser state (see GcodeParser.get_state) right
+    before each of those lines, the height of every layer and the corners of
+    the box around all movements, which takes in the whole circle of arcs.
+
+    Layer i spans the bytes from offsets[i] up to offsets[i + 1].
+    """
+
+    def __init__(self, offsets, states, heights, lower, upper):
+        self.offsets = offsets
+        self.states = states
+        self.heights = heights
+        self.lower = lower
+        self.upper = upper
+
+    @property
+    def num_layers(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return "GcodeLayerIndex(%d layers)" % self.num_layers
+
+
+class GcodeIndexer(object):
+    """
+    Build the layer index of gcode in a buffer.
+
+    Commands that change the modal state of the parser in other ways than
+    moving, like G92, or markers and commands of the gcode flavor, go through
+    the parser one by one. Runs of lines in between are only moves, whose
+    positions, layer changes and resulting parser state are worked out with
+    array operations on the columns of the lexer, without creating any
+    movements.
+    """
+
+    move_commands = GcodeParser.move_commands
+    # commands handled by GcodeParser.command_coords other than the moves
+    # above; those of the flavor are added to them
+    state_commands = (
+        GcodeParser.arc_commands
+        + GcodeParser.plane_commands
+        + ("G28", "G90", "G91", "G92")
+    )
+
+    # shorter runs of moves go through the parser as well
+    min_run = 64
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.parser = GcodeParser(GcodeBulkLexer())
+        self.parser.load(self.data)
+
+    def build(self, callback=None):
+        """
+        Scan the gcode and return a GcodeLayerIndex.
+        """
+        t_start = time.time()
+
+        lexer = self.parser.lexer
+        self.parser.set_flavor(self.data[:HEADER_SIZE])
+        flavor = self.parser.flavor
+        self._state_commands = set(self.state_commands) | set(flavor.commands)
+        # flavors that reset the flags on every line only add flags with
+        # markers, which is worked out for runs as well (see _flags_before)
+        if flavor.resets:
+            self._marker_pattern = flavor.layer_byte_pattern
+        else:
+            self._marker_pattern = flavor.byte_pattern
+
+        self._offsets = [0]
+        self._states = [self.parser.get_state()]
+        self._heights = []
+        self._first_points = []
+        self._lower = self._upper = None
+
+        for chunk in lexer.scan_chunks():
+            # blocks are slices of the buffer that end where reading stopped
+            chunk_offset = lexer.bytes_read - len(chunk.data)
+            self._scan_chunk(chunk, chunk_offset)
+
+            if callback and lexer.size:
+                callback(lexer.bytes_read, lexer.size)
+
+        if not self._first_points:
+            raise GcodeParserError("File does not contain valid Gcode")
+
+        # like GcodeModel, take the height of the first layer from its first
+        # line, which ends at the second point
+        first_points = self._first_points
+        self._heights.insert(0, first_points[min(1, len(first_points) - 1)][2])
+        self._offsets.append(len(self.data))
+        index = GcodeLayerIndex(
+            self._offsets, self._states, self._heights, self._lower, self._upper
+        )
+
+        t_end = time.time()
+        logging.info("Indexed Gcode file in %.2f seconds" % (t_end - t_start))
+        logging.info("Layers: %d" % index.num_layers)
+        return index
+
+    def _scan_chunk(self, chunk, chunk_offset):
+        num_rows = len(chunk)
+        commands = chunk.commands
+        is_move = numpy.array([gcode in self.move_commands for gcode in commands])
+        is_state = numpy.array([gcode in self._state_commands for gcode in commands])
+
+        # rows that have to go through the parser
+        slow = is_state[chunk.command_codes]
+        slow[list(chunk.fallback)] = True
+        slow[self._marker_rows(chunk)] = True
+
+        self._is_move = is_move[chunk.command_codes]
+        pos = 0
+        for row in numpy.flatnonzero(slow).tolist() + [num_rows]:
+            if row > pos:
+                self._scan_run(chunk, chunk_offset, pos, row)
+            if row < num_rows:
+                self._parse_rows(chunk, chunk_offset, row, row + 1)
+            pos = row + 1
+
+    def _marker_rows(self, chunk):
+        """
+        Return rows with markers of the flavor in their comments.
+        """
+        if self._marker_pattern is None:
+            return numpy.zeros(0, numpy.int64)
+        positions = numpy.array(
+            [match.start() for match in self._marker_pattern.finditer(chunk.data)],
+            numpy.int64,
+        )
+
+        rows = numpy.searchsorted(chunk.line_starts, positions, side="right") - 1
+        valid = rows >= 0
+        rows, positions = rows[valid], positions[valid]
+        in_comment = (positions >= chunk.comment_starts[rows]) & (
+            positions < chunk.line_ends[rows]
+        )
+        return rows[in_comment]
+
+    def _parse_rows(self, chunk, chunk_offset, start, end):
+        parser = self.parser
+        points = []
+        for row in range(start, end):
+            state = parser.get_state()
+            src = parser.src
+            if not parser.parse_command(chunk.tokens(row)):
+                continue
+
+            dst = tuple(parser.dst)
+            points.append(dst)
+            if parser.arc is not None:
+                points.extend(_circle_bounds(src, dst, parser.arc))
+            if parser.layer_start:
+                self._add_layer(
+                    chunk_offset + int(chunk.line_starts[row]), state, dst[2]
+                )
+
+        if points:
+            self._add_points(numpy.array(points, numpy.float64))
+
+    def _add_points(self, points):
+        if len(self._first_points) < 2:
+            self._first_points.extend(points[: 2 - len(self._first_points)].tolist())
+
+        lower, upper = points.min(0), points.max(0)
+        if self._lower is not None:
+            lower = numpy.minimum(lower, self._lower)
+            upper = numpy.maximum(upper, self._upper)
+        self._lower, self._upper = lower, upper
+
+    def _add_layer(self, offset, state, height):
+        self._offsets.append(offset)
+        self._states.append(state)
+        self._heights.append(height)
+
+    def _scan_run(self, chunk, chunk_offset, start, end):
+        """
+        Scan rows start to end, which contain no commands that change the
+        modal state other than by moving.
+        """
+        parser = self.parser
+        if (
+            end - start < self.min_run
+            or parser.relative
+            or parser.flags & Movement.FLAG_INCHES
+        ):
+            self._parse_rows(chunk, chunk_offset, start, end)
+            return
+
+        # every command updates the position registers with the axes given
+        axes = parser.state_axes
+        args0 = list(parser.registers)
+        values = chunk.values[start:end]
+        present = chunk.present[start:end]
+        columns = [
+            _fill_forward(values[:, idx], present[:, idx], args0[idx])
+            for idx in range(len(axes))
+        ]
+        x, y, z, e = columns[:4]
+
+        # moves go to the registers plus the offsets; a move is a movement if
+        # it goes somewhere else than the previous point
+        moves = numpy.flatnonzero(self._is_move[start:end])
+        offset = parser.offsets
+        dst = numpy.column_stack(
+            (x[moves] + offset[0], y[moves] + offset[1], z[moves] + offset[2])
+        )
+        src0 = parser.src
+        changed = numpy.ones(len(moves), bool)
+        changed[1:] = (dst[1:] != dst[:-1]).any(1)
+        if len(moves) > 0 and src0 is not None:
+            changed[0] = (dst[0] != src0).any()
+        if changed.any():
+            self._add_points(dst[changed])
+
+        # movements that can start a layer, those with a previous point
+        candidates = moves[changed]
+        if src0 is None:
+            candidates = candidates[1:]
+
+        # a layer change is flagged when extruding at a new height and it
+        # starts a layer at the next movement, including one on the same line
+        extruding = numpy.flatnonzero(numpy.diff(e, prepend=args0[3]) > 0)
+        extruding_z = z[extruding]
+        layer_z = numpy.concatenate(([parser.current_layer_z], extruding_z[:-1]))
+        flagged = extruding[extruding_z != layer_z]
+
+        counts = numpy.searchsorted(flagged, candidates, side="right")
+        previous = numpy.concatenate(([0], counts[:-1]))
+        layer_starts = counts > previous
+        if len(candidates) > 0 and parser.new_layer:
+            layer_starts[0] = True
+
+        flavor = parser.flavor
+        for idx in numpy.flatnonzero(layer_starts).tolist():
+            row = int(candidates[idx])
+            if idx > 0:
+                new_layer = numpy.searchsorted(flagged, row) > counts[idx - 1]
+            else:
+                new_layer = parser.new_layer or numpy.searchsorted(flagged, row) > 0
+            state = (
+                tuple(float(c[row - 1]) if row > 0 else a for c, a in zip(columns, args0)),
+                tuple(parser.offsets),
+                self._src_before(moves, dst, row, src0),
+                self._flags_before(chunk, start, start + row),
+                False,
+                flavor.name,
+                self._layer_z_before(extruding, z, row),
+                bool(new_layer),
+                parser.plane,
+            )
+            height = float(dst[numpy.searchsorted(moves, row), 2])
+            self._add_layer(
+                chunk_offset + int(chunk.line_starts[start + row]), state, height
+            )
+
+        # leave the parser in the state after the last row
+        num_rows = end - start
+        state = parser.get_state()
+        parser.set_state(
+            (
+                tuple(float(c[-1]) for c in columns),
+                state[1],
+                self._src_before(moves, dst, num_rows, src0),
+                self._flags_before(chunk, start, end),
+                False,
+                flavor.name,
+                self._layer_z_before(extruding, z, num_rows),
+                bool(
+                    len(flagged) > counts[-1]
+                    if len(candidates) > 0
+                    else parser.new_layer or len(flagged) > 0
+                ),
+                parser.plane,
+            )
+        )
+
+    def _src_before(self, moves, dst, row, src0):
+        idx = numpy.searchsorted(moves, row) - 1
+        return tuple(dst[idx].tolist()) if idx >= 0 else src0
+
+    def _layer_z_before(self, extruding, z, row):
+        idx = numpy.searchsorted(extruding, row) - 1
+        return float(z[extruding[idx]]) if idx >= 0 else self.parser.current_layer_z
+
+    def _flags_before(self, chunk, start, row):
+        """
+        Return the flags of the parser before a row of a run that starts at
+        row start.
+        """
+        flags = self.parser.flags
+        flavor = self.parser.flavor
+        if not flavor.resets:
+            # markers and commands of the flavor are not part of runs
+            return flags
+
+        # every line sets the flags, but lines with markers only add to them
+        keep, added, _ = flavor.default
+        for idx in range(row - 1, start - 1, -1):
+            action = flavor.marker_action(chunk.comment(idx))
+            if action is None:
+                return flags & keep | added
+            added |= action[1]
+        return flags | added
+
+
+def _fill_forward(values, present, initial):
+    """
+    Return values with every missing value replaced by the last present one,
+    or initial before the first one.
+    """
+    idx = numpy.where(present, numpy.arange(len(present)), -1)
+    numpy.maximum.accumulate(idx, out=idx)
+    return numpy.where(idx >= 0, values[idx], initial)
+
+
+def build_index(data, callback=None):
+    """
+    Return a GcodeLayerIndex of gcode in a buffer, like a memory-mapped file.
+    """
+    return GcodeIndexer(data).build(callback)
+
+
+class GcodeLayerReader(object):
+    """
+    Parse layers of an indexed gcode buffer on demand.
+
+    The most recently read layers are kept, up to max_resident of them.
+    """
+
+    max_resident = 64
+
+    def __init__(self, data, index):
+        self.data = memoryview(data)
+        self.index = index
+        self._layers = OrderedDict()
+
+    def layer(self, idx):
+        """
+        Return a MovementTable with the movements of a layer.
+        """
+        table = self._layers.get(idx)
+        if table is not None:
+            self._layers.move_to_end(idx)
+            return table
+
+        start, end = self.index.offsets[idx], self.index.offsets[idx + 1]
+        parser = GcodeParser(GcodeBulkLexer())
+        parser.set_state(self.index.states[idx])
+        parser.load(self.data[start:end])
+        table = parser.parse_continued()
+
+        self._layers[idx] = table
+        while len(self._layers) > self.max_resident:
+            self._layers.popitem(last=False)
+        return table
+
+    def start_point(self, idx):
+        """
+        Return the point the first movement of a layer starts from, or None
+        for the first layer.
+        """
+        return self.index.states[idx][2]
+
+
+def _circle_bounds(src, dst, arc):
+    """
+    Return two corners of a box around the whole circle of an arc from src to
+    dst, which also holds the arc itself.
+    """
+    center_u, center_v, kind = arc
+    first, second, _ = PLANE_AXES[kind // 2]
+    center = list(dst)
+    center[first] = src[first] + center_u
+    center[second] = src[second] + center_v
+    radius = max(
+        math.hypot(center_u, center_v),
+        math.hypot(dst[first] - center[first], dst[second] - center[second]),
+    )
+    lower, upper = list(center), list(center)
+    for axis in (first, second):
+        lower[axis] -= radius
+        upper[axis] += radius
+    return lower, upper
@@ -16,48 +16,299 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 import logging
+import mmap
+import sys
+from concurrent.futures.process import BrokenProcessPool
 
-from tatlin.lib.gl.gcodemodel import GcodeModel
+from tatlin.lib import profiling
+from tatlin.lib.gl.gcodemodel import GcodeModel, LazyGcodeModel
 from tatlin.lib.ui.gcode import GcodePanel
 
-from ..baseloader import BaseModelLoader, ModelFileError
-from .parser import GcodeParser, GcodeParserError
+from ..baseloader import BaseModelLoader, ModelFileError, STDIN_PATH
+from . import parallel
+from .cache import GcodeCache
+from .coalesce import coalesce
+from .follow import GcodeFollower
+from .index import GcodeLayerReader, build_index
+from .parser import (
+    GcodeBulkLexer,
+    GcodeParser,
+    GcodeParserError,
+    ProfiledGcodeParser,
+)
 
 
 class GcodeModelLoader(BaseModelLoader):
-    def load(self, config, scene, progress_dlg):
-        parser = GcodeParser()
-        with open(self.path, "r") as gcodefile:
-            parser.load(gcodefile)
+    # lex regular files directly from a read-only memory mapping instead of
+    # reading them into memory
+    use_mmap = True
+
+    # load models from the on-disk cache and store them there, as configured
+    use_cache = True
+
+    # files at least this large are parsed on all CPUs; None disables it
+    parallel_min_size = 64 << 20  # bytes
+
+    # files at least this large are indexed and only the layers being looked
+    # at are parsed; None disables it
+    lazy_min_size = 1 << 30  # bytes
+
+    # keep reading lines appended to the file after it has been loaded
+    follow = False
+    follower = None
+
+    # with a preview callback, files larger than this are parsed a piece at a
+    # time, starting with a piece this large and doubling it up to
+    # max_piece_size, and every piece is shown as soon as it has been parsed
+    preview_size = 2 << 20  # bytes
+    max_piece_size = 64 << 20  # bytes
+
+    # the cache to store the model read from the file in
+    _store_cache = None
+
+    # movements are merged where they are at most this far from a straight
+    # line, see coalesce.py; None or 0 turns it off
+    coalesce_tolerance = None  # mm
+
+    def read(self, config, progress_dlg, preview=None):
+        self.coalesce_tolerance = config.read("gcode.coalesce_tolerance", float)
+        cache = self._cache(config)
+        with profiling.stage("cache.load"):
+            arrays = cache.load(self.path) if cache is not None else None
+        if arrays is not None:
+            progress_dlg.stage("Loading cached model...")
+            model = GcodeModel()
+            model.load_cached(arrays)
+            return model
+
+        self._store_cache = cache
+        return self._load_model(progress_dlg, preview)
+
+    def store(self, config, model):
+        cache = self._store_cache
+        if cache is None:
+            return
+        self._store_cache = None
+        try:
+            cache.store(self.path, model.cache_arrays())
+        except OSError as e:
+            logging.warning("Could not cache %s: %s" % (self.path, e))
+
+    def show(self, model, config, scene):
+        scene.add_model(model)
+        scene.mode_2d = bool(config.read("ui.gcode_2d", int))
+
+        offset_x = config.read("machine.platform_offset_x", float)
+        offset_y = config.read("machine.platform_offset_y", float)
+        offset_z = config.read("machine.platform_offset_z", float)
+
+        if offset_x is None and offset_y is None and offset_z is None:
+            scene.view_model_center()
+            logging.info("Platform offsets not set, showing model in the center")
+        else:
+            model.offset_x = offset_x if offset_x is not None else 0
+            model.offset_y = offset_y if offset_y is not None else 0
+            model.offset_z = offset_z if offset_z is not None else 0
+            logging.info(
+                "Using platform offsets: (%s, %s, %s)"
+                % (model.offset_x, model.offset_y, model.offset_z)
+            )
+        return GcodePanel
+
+    def _load_model(self, progress_dlg, preview=None):
+        # the file is read exactly once, so pipes and FIFOs work as well
+        load_profile = profiling.active()
+        if load_profile is not None:
+            parser = ProfiledGcodeParser(GcodeBulkLexer(), load_profile)
+        else:
+            parser = GcodeParser(GcodeBulkLexer())
+        with self._open() as gcodefile:
+            gcode = self._map(gcodefile)
             try:
+                if self._lazy() and isinstance(gcode, mmap.mmap):
+                    return self._load_lazy(gcode, progress_dlg)
+
                 progress_dlg.stage("Reading file...")
-                data = parser.parse(progress_dlg.step)
+                if preview is not None and self._streamed(gcode):
+                    return self._load_streamed(parser, gcode, progress_dlg, preview)
+
+                parser.load(gcode)
+                data = self._coalesce(self._parse(parser, progress_dlg))
+
+                if self._size is None:
+                    self._size = parser.lexer.bytes_read
 
                 progress_dlg.stage("Loading file...")
                 model = GcodeModel()
                 model.load_data(data, progress_dlg.step)
+                return model
+            except GcodeParserError as e:
+                # rethrow as generic file error
+                raise ModelFileError(f"Parsing error: {e}")
 
-                scene.add_model(model)
-                scene.mode_2d = bool(config.read("ui.gcode_2d", int))
+    def _load_streamed(self, parser, gcode, progress_dlg, preview):
+        """
+        Parse mapped gcode a piece at a time. Pass preview a model of the
+        first piece with room for the whole file, then every following piece
+        along with the model to append it to.
 
-                offset_x = config.read("machine.platform_offset_x", float)
-                offset_y = config.read("machine.platform_offset_y", float)
-                offset_z = config.read("machine.platform_offset_z", float)
+        Return the model, which has all of the file in it once the pieces
+        passed to preview have been appended.
+        """
+        size = len(gcode)
+        model = None
+        start = 0
+        piece_size = self.preview_size
+        while start < size:
+            end = size
+            if start + piece_size < size:
+                end = _line_end(gcode, start + piece_size)
+                if end <= start:
+                    # no line ends in the piece
+                    end = size
 
-                if offset_x is None and offset_y is None and offset_z is None:
-                    scene.view_model_center()
-                    logging.info(
-                        "Platform offsets not set, showing model in the center"
-                    )
-                else:
-                    model.offset_x = offset_x if offset_x is not None else 0
-                    model.offset_y = offset_y if offset_y is not None else 0
-                    model.offset_z = offset_z if offset_z is not None else 0
-                    logging.info(
-                        "Using platform offsets: (%s, %s, %s)"
-                        % (model.offset_x, model.offset_y, model.offset_z)
+            parser.load(memoryview(gcode)[start:end])
+            data = parser.parse_continued(
+                lambda count, limit, start=start: progress_dlg.step(
+                    start + count, size
+                )
+            )
+            data = self._coalesce(data)
+            if model is not None:
+                preview(model, data)
+            elif data.num_movements > 0:
+                model = GcodeModel()
+                model.load_data(data)
+                # vertices take about as many bytes everywhere in a file, so
+                # the buffers rarely grow again
+                model.reserve(int(model.vertex_count * size / end * 1.1))
+                preview(model)
+
+            start = end
+            piece_size = min(piece_size * 2, self.max_piece_size)
+
+        if model is None:
+            raise GcodeParserError("File does not contain valid Gcode")
+        return model
+
+    def _streamed(self, gcode):
+        return (
+            isinstance(gcode, mmap.mmap)
+            and not self.follow
+            and not self._parallel()
+            and len(gcode) > self.preview_size
+        )
+
+    def _load_lazy(self, data, progress_dlg):
+        progress_dlg.stage("Indexing layers...")
+        with profiling.stage("parse.index"):
+            reader = GcodeLayerReader(data, build_index(data, progress_dlg.step))
+        profiling.count("bytes", len(data))
+
+        progress_dlg.stage("Loading file...")
+        model = LazyGcodeModel()
+        model.load_index(reader, progress_dlg.step)
+        return model
+
+    def _lazy(self):
+        return (
+            self.lazy_min_size is not None
+            and self.use_mmap
+            and not self.follow
+            and (self.size or 0) >= self.lazy_min_size
+        )
+
+    def _coalesce(self, data):
+        if not self.coalesce_tolerance:
+            return data
+        with profiling.stage("model.coalesce"):
+            coalesced = coalesce(data, self.coalesce_tolerance)
+        removed = data.num_movements - coalesced.num_movements
+        profiling.count("coalesced", removed)
+        logging.info(
+            "Merged %d of %d movements within %s mm"
+            % (removed, data.num_movements, self.coalesce_tolerance)
+        )
+        return coalesced
+
+    def _cache(self, config):
+        """
+        Return the cache to load the model from, or None if the model has to
+        be loaded from the file.
+        """
+        if not self.use_cache or self.path == STDIN_PATH or not self.size:
+            return None
+        if self._lazy():
+            # only a few layers of the model are ever loaded
+            return None
+        if self.follow:
+            # a followed file keeps changing and needs the parser state
+            return None
+        cache = GcodeCache.from_config(config)
+        if cache is not None and self.coalesce_tolerance:
+            cache.variant = "coalesce=%r" % self.coalesce_tolerance
+        return cache
+
+    def _parse(self, parser, progress_dlg):
+        if self.follow and self.path != STDIN_PATH:
+            # only complete lines are read, the rest is left to follow-up
+            # reads of the same parser
+            self.follower = GcodeFollower(self.path)
+            data = self.follower.read(progress_dlg.step)
+            if data.num_layers < 1:
+                raise GcodeParserError("File does not contain valid Gcode")
+            return data
+
+        if self._parallel():
+            try:
+                with profiling.stage("parse.parallel"):
+                    data = parallel.GcodeParallelParser(self.path).parse(
+                        progress_dlg.step
                     )
-                return model, GcodePanel
-            except GcodeParserError as e:
-                # rethrow as generic file error
-                raise ModelFileError(f"Parsing error: {e}")
+                profiling.count("bytes", self.size)
+                profiling.count("movements", data.num_movements)
+                return data
+            except (OSError, BrokenProcessPool) as e:
+                logging.warning(
+                    "Parallel parsing failed, parsing in a single process: %s" % e
+                )
+        return parser.parse(progress_dlg.step)
+
+    def _parallel(self):
+        return (
+            self.parallel_min_size is not None
+            and self.path != STDIN_PATH
+            and not self.follow
+            and (self.size or 0) >= self.parallel_min_size
+            and parallel.is_available()
+        )
+
+    def _open(self):
+        if self.path == STDIN_PATH:
+            # don't close the standard input when done reading
+            return open(sys.stdin.fileno(), "rb", closefd=False)
+        return open(self.path, "rb")
+
+    def _map(self, gcodefile):
+        """
+        Return a memory mapping of the file if possible, otherwise the file
+        object itself.
+        """
+        if not self.use_mmap or not self.size:
+            return gcodefile
+
+        try:
+            # the mapping stays valid after the file is closed and is unmapped
+            # once the lexer drops all references to it
+            return mmap.mmap(gcodefile.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logging.info("Could not map %s into memory: %s" % (self.path, e))
+            return gcodefile
+
+
+def _line_end(data, end):
+    """
+    Return the position just past the last line break in data before end, or
+    0 if there is none.
+    """
+    return max(data.rfind(b"\n", 0, end), data.rfind(b"\r", 0, end)) + 1
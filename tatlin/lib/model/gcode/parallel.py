@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Gcode parsing on several processes.
+
+The file is cut at line boundaries into pieces that are lexed and parsed by a
+pool of worker processes, each of them starting from the default parser
+state. Worker results are handed back through shared memory blocks.
+
+The main process then walks the pieces in order and reconciles the modal
+state across piece boundaries. A worker records snapshots of its parser
+state at regular checkpoints; the main process re-parses the beginning of a
+piece from the true state only until its state matches a worker snapshot,
+and takes the rest of the worker results from there. Position offsets set
+with G92 never converge, but they only shift coordinates, so they are added
+to the worker results instead.
+"""
+
+import array
+import logging
+import math
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+try:
+    from multiprocessing import get_context, resource_tracker, shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+from .parser import GcodeBulkLexer, GcodeParser, GcodeParserError, Movement
+from .arcs import tessellate
+from .flavors import HEADER_SIZE, detect_flavor
+from .table import MovementTable
+
+
+def cpu_count():
+    """
+    Return the number of CPUs the process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def is_available():
+    return shared_memory is not None and cpu_count() > 1
+
+
+# memory mapping of the file in a worker process
+_buffer = None
+
+
+def _init_worker(path):
+    global _buffer
+    with open(path, "rb") as f:
+        _buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _piece_parser(buf, start, end, flavor=None, state=None, block_size=None):
+    lexer = GcodeBulkLexer()
+    if block_size is not None:
+        lexer.block_size = block_size
+    lexer.load(memoryview(buf)[start:end])
+    parser = GcodeParser(lexer, flavor)
+    if state is not None:
+        parser.set_state(state)
+    return parser
+
+
+def _parse_piece(start, end, flavor, checkpoint_every):
+    """
+    Parse a piece of the file from the default state of a parser of the
+    flavor of the file. Return the names and layouts of the shared memory
+    blocks holding the results, and the state checkpoints.
+    """
+    parser = _piece_parser(_buffer, start, end, flavor)
+
+    coords = array.array("d")
+    flags = array.array("B")
+    layer_starts = array.array("q")
+    arcs = array.array("d")
+    checkpoints = []
+    rows = 0
+    for row, command in enumerate(parser._commands()):
+        if row % checkpoint_every == 0:
+            checkpoints.append((row, len(flags), len(layer_starts), parser.get_state()))
+        rows = row + 1
+
+        if parser.parse_command(command):
+            if parser.layer_start:
+                layer_starts.append(len(flags))
+            if parser.arc is not None:
+                arcs.append(len(flags))
+                arcs.extend(parser.arc)
+            coords.extend(parser.dst)
+            coords.append(parser.delta_e)
+            coords.append(parser.feedrate)
+            flags.append(parser.flags)
+    checkpoints.append((rows, len(flags), len(layer_starts), parser.get_state()))
+
+    columns = (
+        numpy.frombuffer(coords, numpy.float64).reshape(-1, 5),
+        numpy.frombuffer(flags, numpy.uint8),
+        numpy.frombuffer(layer_starts, numpy.int64),
+        numpy.frombuffer(arcs, numpy.float64).reshape(-1, 4),
+    )
+    return _share(columns), checkpoints
+
+
+def _share(columns):
+    """
+    Copy arrays into a new shared memory block and return the name of the
+    block and the layout of the arrays in it.
+    """
+    size = sum(column.nbytes for column in columns)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    layout = []
+    offset = 0
+    for column in columns:
+        view = numpy.ndarray(column.shape, column.dtype, shm.buf, offset)
+        view[...] = column
+        del view
+        layout.append((column.shape, column.dtype.str, offset))
+        offset += column.nbytes
+    shm.close()
+    return shm.name, layout
+
+
+def _take(name, layout):
+    """
+    Copy arrays out of a shared memory block and free the block.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return [
+            numpy.ndarray(shape, dtype, shm.buf, offset).copy()
+            for shape, dtype, offset in layout
+        ]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _line_start(buf, pos):
+    """
+    Return the start of the first line that begins at or after pos.
+    """
+    if pos <= 0:
+        return 0
+    ends = [buf.find(eol, pos - 1) for eol in (b"\n", b"\r")]
+    ends = [end for end in ends if end >= 0]
+    return min(ends) + 1 if ends else len(buf)
+
+
+def _same_state(a, b):
+    """
+    Return true if parsing would continue the same way from both states, apart
+    from the position offsets.
+    """
+    args_a, offset_a, src_a = a[:3]
+    args_b, offset_b, src_b = b[:3]
+    if args_a != args_b or a[3:] != b[3:]:
+        return False
+    if src_a is None or src_b is None:
+        return src_a is src_b
+    # positions relative to different offsets may differ by rounding
+    return all(
+        math.isclose(sa - oa, sb - ob, rel_tol=1e-12, abs_tol=1e-12)
+        for sa, oa, sb, ob in zip(src_a, offset_a, src_b, offset_b)
+    )
+
+
+def _shift_state(state, shift, scale):
+    args, offset, src = state[:3]
+    offset = tuple(o + s for o, s in zip(offset, shift + (0,)))
+    if src is not None:
+        src = tuple(c + s * scale for c, s in zip(src, shift))
+    return (args, offset, src) + state[3:]
+
+
+class GcodeParallelParser(object):
+    """
+    Parse a gcode file on a pool of worker processes.
+
+    The result is the same as that of GcodeParser.parse, up to floating point
+    rounding of coordinates following a G92 in the middle of a piece.
+    """
+
+    checkpoint_every = 1024  # rows
+    min_piece_size = 4 << 20  # bytes
+    reparse_block_size = 1 << 16  # bytes
+
+    def __init__(self, path, workers=None, pieces=None):
+        self.path = path
+        self.workers = workers or cpu_count()
+        self.pieces = pieces
+
+    def split(self, buf):
+        """
+        Return a list of (start, end) pairs cutting the buffer into pieces at
+        line boundaries.
+        """
+        size = len(buf)
+        pieces = self.pieces or max(
+            1, min(self.workers * 2, size // self.min_piece_size)
+        )
+        bounds = sorted(
+            set(_line_start(buf, size * idx // pieces) for idx in range(pieces))
+        )
+        return list(zip(bounds, bounds[1:] + [size]))
+
+    def parse(self, callback=None):
+        t_start = time.time()
+
+        with open(self.path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        pieces = self.split(buf)
+        # the flavor is detected from the start of the file, which workers
+        # parsing the middle of it don't see
+        flavor = detect_flavor(buf[:HEADER_SIZE]).name
+        logging.info(
+            "Parsing Gcode in %d pieces on %d processes" % (len(pieces), self.workers)
+        )
+
+        # workers share the resource tracker of this process, which then sees
+        # the shared memory blocks they create as released once they are read
+        resource_tracker.ensure_running()
+
+        results = []
+        with ProcessPoolExecutor(
+            self.workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.path,),
+        ) as executor:
+            futures = [
+                executor.submit(_parse_piece, start, end, flavor, self.checkpoint_every)
+                for start, end in pieces
+            ]
+            try:
+                state = GcodeParser(flavor=flavor).get_state()
+                for (start, end), future in zip(pieces, futures):
+                    shared, checkpoints = future.result()
+                    columns = _take(*shared)
+                    piece, state = self._reconcile(
+                        buf, start, end, state, columns, checkpoints
+                    )
+                    results.append(piece)
+
+                    if callback:
+                        callback(end, len(buf))
+            finally:
+                for future in futures:
+                    future.cancel()
+                for future in futures[len(results) :]:
+                    if future.done() and not future.cancelled():
+                        if future.exception() is None:
+                            _take(*future.result()[0])
+
+        table = self._table(results)
+
+        t_end = time.time()
+        logging.info("Parsed Gcode file in %.2f seconds" % (t_end - t_start))
+
+        if table.num_layers < 1:
+            raise GcodeParserError("File does not contain valid Gcode")
+
+        logging.info("Layers: %d" % table.num_layers)
+
+        return table
+
+    def _reconcile(self, buf, start, end, state, columns, checkpoints):
+        """
+        Fix up worker results for a piece given the true parser state at its
+        start. Return the fixed results and the true state at the end of the
+        piece.
+        """
+        coords, flags, layer_starts, arcs = columns
+        checkpoints = iter(checkpoints)
+        row, move_idx, layer_idx, piece_state = next(checkpoints)
+
+        moves = []
+        parsed_arcs = []
+        if not _same_state(state, piece_state):
+            # parse from the true state until it meets a worker snapshot,
+            # which usually happens within the first few checkpoints
+            parser = _piece_parser(
+                buf, start, end, state=state, block_size=self.reparse_block_size
+            )
+            commands = enumerate(parser._commands())
+            row, move_idx, layer_idx, piece_state = next(checkpoints)
+            converged = False
+            for command_row, command in commands:
+                if command_row == row:
+                    if _same_state(parser.get_state(), piece_state):
+                        converged = True
+                        break
+                    row, move_idx, layer_idx, piece_state = next(checkpoints)
+
+                if parser.parse_command(command):
+                    if parser.arc is not None:
+                        parsed_arcs.append((len(moves),) + parser.arc)
+                    moves.append(parser.movement())
+
+            state = parser.get_state()
+            if not converged:
+                piece = self._piece_columns(
+                    moves, parsed_arcs, 0, coords[:0], flags[:0], [], arcs[:0]
+                )
+                return piece, state
+
+        # the rest of the worker results only need the offsets added
+        shift = tuple(a - b for a, b in zip(state[1][:3], piece_state[1][:3]))
+        coords = coords[move_idx:]
+        flags = flags[move_idx:]
+        inches = (flags & Movement.FLAG_INCHES) > 0
+        scale = numpy.where(inches, GcodeParser.mm_in_inch, 1.0)
+        coords[:, :3] += numpy.outer(scale, shift)
+        layer_starts = layer_starts[layer_idx:] - move_idx
+        # arc records only hold positions relative to their start point
+        arcs = arcs[arcs[:, 0] >= move_idx]
+        arcs[:, 0] -= move_idx
+
+        exit_state = list(checkpoints)[-1][3]
+        exit_scale = GcodeParser.mm_in_inch if exit_state[3] & Movement.FLAG_INCHES else 1
+        state = _shift_state(exit_state, shift, exit_scale)
+
+        piece = self._piece_columns(
+            moves, parsed_arcs, len(moves), coords, flags, layer_starts, arcs
+        )
+        return piece, state
+
+    def _piece_columns(
+        self, moves, parsed_arcs, offset, coords, flags, layer_starts, arcs
+    ):
+        """
+        Join re-parsed movements and worker results into columns.
+        """
+        arcs = arcs.copy()
+        arcs[:, 0] += offset
+        parsed_coords = numpy.array(
+            [tuple(dst) + (delta_e, feedrate) for dst, delta_e, feedrate, _, _ in moves],
+            numpy.float64,
+        ).reshape(-1, 5)
+        parsed_flags = numpy.array([move[3] for move in moves], numpy.uint8)
+        parsed_starts = numpy.array(
+            [idx for idx, move in enumerate(moves) if move[4]], numpy.int64
+        )
+        return (
+            numpy.concatenate((parsed_coords, coords)),
+            numpy.concatenate((parsed_flags, flags)),
+            numpy.concatenate(
+                (parsed_starts, numpy.asarray(layer_starts, numpy.int64) + offset)
+            ),
+            numpy.concatenate((numpy.array(parsed_arcs).reshape(-1, 4), arcs)),
+        )
+
+    def _table(self, results):
+        coords = numpy.concatenate([piece[0] for piece in results])
+        flags = numpy.concatenate([piece[1] for piece in results])
+        offsets = numpy.cumsum([0] + [len(piece[1]) for piece in results])
+        layer_starts = numpy.concatenate(
+            [piece[2] + offset for piece, offset in zip(results, offsets)]
+        )
+        layer_stops = numpy.concatenate(([0], layer_starts, [len(flags)]))
+        if len(flags) == 0:
+            layer_stops = layer_stops[:1]
+        arcs = numpy.concatenate(
+            [
+                piece[3] + (offset, 0, 0, 0)
+                for piece, offset in zip(results, offsets)
+            ]
+        )
+        table = MovementTable(
+            coords[:, :3], coords[:, 3], coords[:, 4], flags, layer_stops
+        )
+        return tessellate(table, arcs, tolerance=GcodeParser.arc_tolerance)
@@ -19,10 +19,23 @@ Gcode parser.
 """
 
 
+import mmap
+import os
 import time
 import logging
 import math
 import array
+import itertools
+
+import numpy
+
+from . import flavors
+from .arcs import PLANE_AXES, arc_kind, tessellate
+from .flavors import DEFAULT_FLAVOR, detect_flavor, get_flavor
+from .table import MovementTable
+
+
+ENCODING = "utf-8"
 
 
 class GcodeParserError(Exception):
@@ -60,10 +73,14 @@ class GcodeLexer(object):
 
             self.getlines = _getlines
         else:
-            for line in gcode:
-                self.line_count += 1
+            # counting lines requires reading the file twice, which is not
+            # possible with pipes; the line count is only used for progress
+            # reporting anyway
+            if gcode.seekable():
+                for line in gcode:
+                    self.line_count += 1
 
-            gcode.seek(0)
+                gcode.seek(0)
 
             def _getlines():
                 for line in gcode:
@@ -130,18 +147,347 @@ class GcodeLexer(object):
         return tokens == ("", ArgsDict(), "")
 
 
+def _byte_table(chars):
+    """
+    Return a 256-entry lookup table that is true for the given characters.
+    """
+    table = numpy.zeros(256, bool)
+    table[[ord(c) for c in chars]] = True
+    return table
+
+
+def _gather(buf, starts, lengths, width):
+    """
+    Copy variable-length byte spans into a fixed-width bytes array. Spans are
+    padded with null bytes, which numpy strips from fixed-width strings.
+    """
+    idx = starts[:, None] + numpy.arange(width)
+    mask = numpy.arange(width) < lengths[:, None]
+    padded = numpy.where(mask, buf[numpy.minimum(idx, len(buf) - 1)], 0)
+    return numpy.ascontiguousarray(padded, numpy.uint8).view("S%d" % width).ravel()
+
+
+class GcodeChunk(object):
+    """
+    Tokens of a block of complete gcode lines, stored in columns.
+
+    Only non-blank lines are represented. For every line (row) the chunk holds
+    the command code, the values of the axis words with a mask telling which
+    of them were given on the line, and the span of the comment. Lines that
+    cannot be represented by columns alone keep their tokens in `fallback`.
+    """
+
+    def __init__(self, data, axes):
+        self.data = data
+        self.axes = axes
+        self.line_starts = numpy.zeros(0, numpy.int64)
+        self.line_ends = numpy.zeros(0, numpy.int64)
+        self.comment_starts = numpy.zeros(0, numpy.int64)
+        self.commands = []
+        self.command_codes = numpy.zeros(0, numpy.int32)
+        self.values = numpy.zeros((0, len(axes)))
+        self.present = numpy.zeros((0, len(axes)), bool)
+        self.fallback = {}
+
+    def __len__(self):
+        return len(self.line_starts)
+
+    def _decode(self, start, end):
+        return bytes(self.data[start:end]).decode(ENCODING, "replace")
+
+    def line(self, row):
+        return self._decode(self.line_starts[row], self.line_ends[row])
+
+    def command(self, row):
+        return self.commands[self.command_codes[row]]
+
+    def comment(self, row):
+        return self._decode(self.comment_starts[row], self.line_ends[row])
+
+    def comments(self):
+        """
+        Return a list of comments for all rows, with empty strings for rows
+        without a comment.
+        """
+        data = self.data
+        return [
+            bytes(data[start:end]).decode(ENCODING, "replace") if start < end else ""
+            for start, end in zip(
+                self.comment_starts.tolist(), self.line_ends.tolist()
+            )
+        ]
+
+    def tokens(self, row):
+        """
+        Return the tokens of a row exactly as GcodeLexer.scan_line would.
+        """
+        if row in self.fallback:
+            return self.fallback[row]
+        return GcodeLexer().scan_line(self.line(row))
+
+
+class GcodeBulkLexer(GcodeLexer):
+    """
+    Load gcode in large blocks and split each block into columns of tokens.
+
+    The tokenization rules are the same as in GcodeLexer.scan_line, but
+    instead of splitting and converting one line at a time, all lines of a
+    block are processed with array operations.
+    """
+
+    # words kept in columns: position registers, then arc center offsets and
+    # radius
+    axes = "XYZEFIJKR"
+    block_size = 1 << 20  # bytes
+
+    # longer words are left to the line-by-line fallback
+    max_command_len = 16
+    max_value_len = 32
+
+    # ASCII characters that str.split() considers whitespace
+    _is_space = _byte_table("\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f ")
+    _is_numeric = _byte_table("0123456789.+-eE")
+
+    def __init__(self):
+        super(GcodeBulkLexer, self).__init__()
+        self.size = 0
+        self.bytes_read = 0
+
+        self._axis_index = numpy.full(256, -1, numpy.int8)
+        for idx, axis in enumerate(self.axes):
+            self._axis_index[ord(axis)] = idx
+
+    def load(self, gcode):
+        """
+        Prepare to read gcode from a string, a buffer or a file object.
+
+        Buffers, including memory-mapped files, are never copied: blocks are
+        memoryview slices of the buffer cut at line boundaries.
+        """
+        if isinstance(gcode, str):
+            gcode = gcode.encode(ENCODING)
+
+        if isinstance(gcode, (bytes, bytearray, memoryview, mmap.mmap)):
+            data = memoryview(gcode)
+            self.size = len(data)
+
+            def _getblocks():  # type: ignore
+                buf = numpy.frombuffer(data, numpy.uint8)
+                start = 0
+                while start < len(buf):
+                    end = self._block_end(buf, start)
+                    self.bytes_read = end
+                    yield data[start:end]
+                    start = end
+
+        else:
+            try:
+                self.size = os.fstat(gcode.fileno()).st_size
+            except (AttributeError, OSError, ValueError):
+                self.size = 0
+
+            def _getblocks():
+                tail = b""
+                while True:
+                    block = gcode.read(self.block_size)
+                    if not block:
+                        break
+                    if isinstance(block, str):
+                        block = block.encode(ENCODING)
+                    self.bytes_read += len(block)
+
+                    # carry the incomplete last line over to the next block
+                    block = tail + block
+                    cut = max(block.rfind(b"\n"), block.rfind(b"\r")) + 1
+                    block, tail = block[:cut], block[cut:]
+                    if block:
+                        yield block
+
+                if tail:
+                    yield tail
+
+        self.getblocks = _getblocks
+
+    def _block_end(self, buf, start):
+        """
+        Return the end of the block that starts at start: the position right
+        after the last line break within block_size bytes, or after the first
+        one if the line is longer than that.
+        """
+        end = start + self.block_size
+        if end >= len(buf):
+            return len(buf)
+
+        window = buf[start:end]
+        breaks = numpy.flatnonzero((window == ord("\n")) | (window == ord("\r")))
+        if len(breaks) > 0:
+            return start + int(breaks[-1]) + 1
+
+        rest = buf[end:]
+        breaks = numpy.flatnonzero((rest == ord("\n")) | (rest == ord("\r")))
+        return end + int(breaks[0]) + 1 if len(breaks) > 0 else len(buf)
+
+    def scan(self):
+        """
+        Return a generator for commands split into tokens.
+        """
+        self.line_no = 0
+        for chunk in self.scan_chunks():
+            for row in range(len(chunk)):
+                self.line_no += 1
+                yield chunk.tokens(row)
+
+    def scan_chunks(self):
+        """
+        Return a generator for chunks of lines split into columns of tokens.
+        """
+        self.bytes_read = 0
+        self.line_count = 0
+        for block in self.getblocks():
+            chunk = self.scan_block(block)
+            self.line_count += len(chunk)
+            if len(chunk) > 0:
+                yield chunk
+
+    def scan_block(self, block):
+        """
+        Split a block of complete lines into a chunk of columns.
+        """
+        buf = numpy.frombuffer(block, numpy.uint8)
+        size = len(buf)
+        chunk = GcodeChunk(block, self.axes)
+
+        eol = (buf == ord("\n")) | (buf == ord("\r"))
+        eol_idx = numpy.flatnonzero(eol)
+        starts = numpy.concatenate(([0], eol_idx + 1))
+        ends = numpy.append(eol_idx, size)
+
+        # comments start at the first semicolon or open parenthesis
+        marks = numpy.flatnonzero((buf == ord(";")) | (buf == ord("(")))
+        first_mark = numpy.append(marks, size)[numpy.searchsorted(marks, starts)]
+        comment_starts = numpy.minimum(first_mark, ends)
+
+        # bytes before the comment make up the command part of the line
+        edge = numpy.zeros(size + 1, numpy.int8)
+        edge[starts] += 1
+        edge[comment_starts] -= 1
+        in_command = numpy.cumsum(edge[:-1], dtype=numpy.int8).astype(bool)
+
+        solid = in_command & ~self._is_space[buf]
+        word_starts = numpy.flatnonzero(solid & ~numpy.append(False, solid[:-1]))
+        word_ends = numpy.flatnonzero(solid & ~numpy.append(solid[1:], False)) + 1
+        word_lines = numpy.searchsorted(starts, word_starts, side="right") - 1
+
+        is_first = numpy.ones(len(word_starts), bool)
+        is_first[1:] = word_lines[1:] != word_lines[:-1]
+
+        nonblank = comment_starts < ends
+        nonblank[word_lines] = True
+        lines = numpy.flatnonzero(nonblank)
+        row_of_line = numpy.cumsum(nonblank) - 1
+
+        chunk.line_starts = starts[lines]
+        chunk.line_ends = ends[lines]
+        chunk.comment_starts = comment_starts[lines]
+        num_rows = len(lines)
+
+        # lines that have to be tokenized one by one
+        fallback = numpy.zeros(len(starts), bool)
+        non_ascii = numpy.flatnonzero(in_command & (buf >= 0x80))
+        fallback[numpy.searchsorted(starts, non_ascii, side="right") - 1] = True
+
+        # commands
+        cmd_starts = word_starts[is_first]
+        cmd_lengths = word_ends[is_first] - cmd_starts
+        too_long = cmd_lengths > self.max_command_len
+        fallback[word_lines[is_first][too_long]] = True
+
+        names = numpy.zeros(num_rows, "S%d" % self.max_command_len)
+        width = int(min(cmd_lengths.max(initial=1), self.max_command_len))
+        names[row_of_line[word_lines[is_first]]] = _gather(
+            buf, cmd_starts, numpy.minimum(cmd_lengths, width), width
+        )
+        names, codes = numpy.unique(names, return_inverse=True)
+        chunk.commands = [name.decode("ascii") for name in names]
+        chunk.command_codes = codes.astype(numpy.int32).ravel()
+
+        # arguments
+        arg_starts = word_starts[~is_first]
+        arg_ends = word_ends[~is_first]
+        arg_lines = word_lines[~is_first]
+        letters = buf[arg_starts]
+        lengths = arg_ends - arg_starts - 1  # without the letter
+
+        values = numpy.full(len(arg_starts), numpy.nan)
+        valued = numpy.flatnonzero(lengths > 0)
+        too_long = lengths[valued] > self.max_value_len
+        fallback[arg_lines[valued[too_long]]] = True
+        valued = valued[~too_long]
+
+        if len(valued) > 0:
+            width = int(lengths[valued].max())
+            words = _gather(buf, arg_starts[valued] + 1, lengths[valued], width)
+            chars = words.view(numpy.uint8).reshape(-1, width)
+            simple = (self._is_numeric[chars] | (chars == 0)).all(1)
+
+            # anything unusual, like "inf" or a word that is not a number at
+            # all, is left to the fallback
+            fallback[arg_lines[valued[~simple]]] = True
+            valued, words = valued[simple], words[simple]
+            try:
+                values[valued] = words.astype(numpy.float64)
+            except ValueError:
+                for idx, word in zip(valued.tolist(), words.tolist()):
+                    try:
+                        values[idx] = float(word)
+                    except ValueError:
+                        fallback[arg_lines[idx]] = True
+
+        axis_idx = self._axis_index[letters]
+        is_axis = axis_idx >= 0
+        rows = row_of_line[arg_lines[is_axis]][::-1]
+        cols = axis_idx[is_axis][::-1]
+        axis_values = values[is_axis][::-1]
+
+        # words are assigned in reverse so that the first occurrence of a
+        # letter on a line wins, same as in GcodeLexer.scan_line
+        chunk.values = numpy.full((num_rows, len(self.axes)), numpy.nan)
+        chunk.present = numpy.zeros((num_rows, len(self.axes)), bool)
+        chunk.values[rows, cols] = axis_values
+        chunk.present[rows, cols] = ~numpy.isnan(axis_values)
+
+        for line in numpy.flatnonzero(fallback & nonblank).tolist():
+            self._fallback_row(chunk, row_of_line[line])
+
+        return chunk
+
+    def _fallback_row(self, chunk, row):
+        tokens = self.scan_line(chunk.line(row))
+        gcode, args, comment = tokens
+        chunk.fallback[row] = tokens
+
+        if gcode not in chunk.commands:
+            chunk.commands.append(gcode)
+        chunk.command_codes[row] = chunk.commands.index(gcode)
+
+        for idx, axis in enumerate(self.axes):
+            value = args[axis]
+            chunk.present[row, idx] = value is not None
+            chunk.values[row, idx] = value if value is not None else numpy.nan
+
+
 class Movement(object):
     """
     Movement represents travel between two points and machine state during
     travel.
     """
 
-    FLAG_PERIMETER = 1
-    FLAG_PERIMETER_OUTER = 2
-    FLAG_LOOP = 4
-    FLAG_SURROUND_LOOP = 8
-    FLAG_EXTRUDER_ON = 16
-    FLAG_INCHES = 32
+    FLAG_PERIMETER = flavors.FLAG_PERIMETER
+    FLAG_PERIMETER_OUTER = flavors.FLAG_PERIMETER_OUTER
+    FLAG_LOOP = flavors.FLAG_LOOP
+    FLAG_SURROUND_LOOP = flavors.FLAG_SURROUND_LOOP
+    FLAG_EXTRUDER_ON = flavors.FLAG_EXTRUDER_ON
+    FLAG_INCHES = flavors.FLAG_INCHES
 
     # tell the python interpreter to only allocate memory for the following attributes
     __slots__ = ["v", "delta_e", "feedrate", "flags"]
@@ -174,196 +520,488 @@ class Movement(object):
 
 
 class GcodeParser(object):
-    marker_layer = "</layer>"
-    marker_perimeter_start = "<perimeter>"
-    marker_perimeter_end = "</perimeter>)"
-    marker_loop_start = "<loop>"
-    marker_loop_end = "</loop>"
-    marker_surrounding_loop_start = "<surroundingLoop>"
-    marker_surrounding_loop_end = "</surroundingLoop>"
+    """
+    Parse gcode of a flavor (see flavors.py), which is detected from the
+    start of the gcode unless it is given by name.
+
+    The modal state lives in preallocated registers that are updated in
+    place: the position registers in `registers`, in the order of
+    state_axes, their offsets in `offsets`, and the last point in `point`,
+    which is only valid once `has_point` is set. Parsing a command that only
+    moves allocates nothing once the flavor has seen its comment.
+    """
 
-    def __init__(self):
-        self.lexer = GcodeLexer()
+    mm_in_inch = 25.4
+
+    # axes of the position registers, those with an offset come first
+    state_axes = ("X", "Y", "Z", "E", "F")
 
-        self.args = ArgsDict({"X": 0, "Y": 0, "Z": 0, "F": 0, "E": 0})
-        self.offset = {"X": 0, "Y": 0, "Z": 0, "E": 0}
-        self.src = None
+    move_commands = ("G0", "G00", "G1", "G01")
+    arc_commands = ("G2", "G02", "G3", "G03")
+    plane_commands = ("G17", "G18", "G19")
+
+    # longest distance between an arc and the segments it is drawn with
+    arc_tolerance = 0.01  # mm
+
+    def __init__(self, lexer=None, flavor=None):
+        self.lexer = lexer if lexer is not None else GcodeLexer()
+
+        self.registers = [0.0] * len(self.state_axes)
+        self.offsets = [0.0] * 4  # X, Y, Z and E
+        self.point = [0.0, 0.0, 0.0]
+        self.has_point = False
         self.flags = 0
-        self.set_flags = self.set_flags_skeinforge
+        self.flavor = get_flavor(flavor) if flavor is not None else DEFAULT_FLAVOR
+        self.auto_flavor = flavor is None
         self.relative = False
+        self.current_layer_z = 0
+        self.new_layer = False
+        self.plane = 0  # index into plane_commands
+
+        # the last movement, see parse_command
+        self.dst = [0.0, 0.0, 0.0]
+        self.delta_e = 0.0
+        self.feedrate = 0.0
+        self.layer_start = False
+        self.arc = None
+
+    @property
+    def src(self):
+        """
+        The last point as a tuple, or None before the first one.
+        """
+        return tuple(self.point) if self.has_point else None
 
     def load(self, src):
         self.lexer.load(src)
 
     def parse(self, callback=None):
+        """
+        Parse the loaded gcode and return a MovementTable.
+        """
         t_start = time.time()
 
-        layers = []
-        movements = []
+        table = self.parse_continued(callback)
+
+        t_end = time.time()
+        logging.info("Parsed Gcode file in %.2f seconds" % (t_end - t_start))
+
+        if table.num_layers < 1:
+            raise GcodeParserError("File does not contain valid Gcode")
+
+        logging.info("Layers: %d" % table.num_layers)
+
+        return table
+
+    def parse_continued(self, callback=None):
+        """
+        Parse the loaded gcode starting from the current parser state, which
+        is left where the previous parse ended. This way a file can be parsed
+        a piece at a time.
+
+        Return a MovementTable, possibly an empty one. Its first layer
+        continues the last layer of the previous parse, so it is empty if the
+        very first movement starts a new layer.
+        """
+        vertices = array.array("f")
+        delta_e = array.array("f")
+        feedrate = array.array("f")
+        flags = array.array("B")
+        layer_stops = array.array("q", [0])
+        arcs = array.array("d")
+        start_point = self.src
         line_count = self.lexer.line_count
         command_idx = None
         callback_every = max(1, int(math.floor(line_count / 100)))
-        mm_in_inch = 25.4
-        new_layer = False
-        current_layer_z = 0
-
-        for command_idx, command in enumerate(self.lexer.scan()):
-            gcode, newargs, comment = command
-
-            if "Slic3r" in comment:
-                # switch mode to slic3r
-                self.set_flags = self.set_flags_slic3r
-
-            args = self.update_args(self.args, newargs)
-            dst = self.command_coords(gcode, args, newargs)
-            delta_e = args["E"] - self.args["E"]
-            self.set_flags(command)
-
-            if self.marker_layer in comment:
-                new_layer = True
-            if delta_e > 0 and args["Z"] != current_layer_z:
-                current_layer_z = args["Z"]
-                new_layer = True
-
-            # create a new movement if the gcode contains a valid coordinate
-            if dst is not None and self.src != dst:
-                if self.src is not None and new_layer:
-                    layers.append(movements)
-                    movements = []
-                    new_layer = False
-
-                if self.flags & Movement.FLAG_INCHES:
-                    dst = (
-                        dst[0] * mm_in_inch,
-                        dst[1] * mm_in_inch,
-                        dst[2] * mm_in_inch,
-                    )
-
-                move = Movement(array.array("f", dst), delta_e, args["F"], self.flags)
-                movements.append(move)
-
-            # if gcode contains a valid coordinate, update the previous point
-            # with the new coordinate
-            if dst is not None:
-                self.src = dst
-            self.args = args
-
-            if callback and command_idx % callback_every == 0:
+
+        # the bulk lexer reports progress by itself as it consumes the input
+        line_callback = (
+            callback and line_count > 0 and not isinstance(self.lexer, GcodeBulkLexer)
+        )
+
+        dst = self.dst
+        for command_idx, command in enumerate(self._commands(callback)):
+            if self.parse_command(command):
+                if self.layer_start:
+                    layer_stops.append(len(flags))
+                if self.arc is not None:
+                    arcs.append(len(flags))
+                    arcs.extend(self.arc)
+                vertices.append(dst[0])
+                vertices.append(dst[1])
+                vertices.append(dst[2])
+                delta_e.append(self.delta_e)
+                feedrate.append(self.feedrate)
+                flags.append(self.flags)
+
+            if line_callback and command_idx % callback_every == 0:
                 callback(command_idx + 1, line_count)
 
         # don't forget leftover movements
-        if len(movements) > 0:
-            layers.append(movements)
+        if len(flags) > layer_stops[-1]:
+            layer_stops.append(len(flags))
 
-        if callback and command_idx is not None:
+        if line_callback and command_idx is not None:
             callback(command_idx + 1, line_count)
 
-        t_end = time.time()
-        logging.info("Parsed Gcode file in %.2f seconds" % (t_end - t_start))
+        table = MovementTable(vertices, delta_e, feedrate, flags, layer_stops)
+        return tessellate(table, arcs, start_point, self.arc_tolerance)
 
-        if len(layers) < 1:
-            raise GcodeParserError("File does not contain valid Gcode")
+    def parse_command(self, command):
+        """
+        Update the parser state with a single command and return true if it
+        creates a movement.
+
+        The movement is left in the attributes dst, delta_e, feedrate, flags
+        and layer_start, which tells whether the movement starts a new layer,
+        until the next command overwrites them (see movement). If the movement
+        is an arc, the arc attribute holds the rest of its arc record (see
+        arcs.py), otherwise it is None.
+        """
+        gcode, newargs, comment = command
+        registers = self.registers
 
-        logging.info("Layers: %d" % len(layers))
+        if gcode == "G92":
+            self.set_position(newargs)
+            has_dst = False
+            delta_e = 0.0
+        else:
+            e = registers[3]
+            self.update_registers(newargs)
+            has_dst = self.command_dst(gcode, newargs)
+            delta_e = registers[3] - e
+        self.set_flags(command)
+
+        if delta_e > 0 and registers[2] != self.current_layer_z:
+            self.current_layer_z = registers[2]
+            self.new_layer = True
+
+        self.arc = None
+        if not has_dst:
+            return False
+
+        dst = self.dst
+        point = self.point
+        has_point = self.has_point
+        # an arc from a point back to itself is a full circle
+        is_arc = has_point and gcode in self.arc_commands
+        # create a new movement if the command goes somewhere else
+        moved = (
+            not has_point
+            or is_arc
+            or dst[0] != point[0]
+            or dst[1] != point[1]
+            or dst[2] != point[2]
+        )
+        if moved:
+            self.layer_start = has_point and self.new_layer
+            if self.layer_start:
+                self.new_layer = False
 
-        return layers
+            if self.flags & Movement.FLAG_INCHES:
+                dst[0] *= self.mm_in_inch
+                dst[1] *= self.mm_in_inch
+                dst[2] *= self.mm_in_inch
 
-    def update_args(self, oldargs, newargs):
-        args = oldargs.copy()
+            if is_arc:
+                self.arc = self.arc_center(gcode, newargs, dst)
 
-        for axis in list(newargs.keys()):
-            if axis in args and newargs[axis] is not None:
-                if self.relative:
-                    args[axis] += newargs[axis]
-                else:
-                    args[axis] = newargs[axis]
+            self.delta_e = delta_e
+            self.feedrate = registers[4]
 
-        return args
+        point[0] = dst[0]
+        point[1] = dst[1]
+        point[2] = dst[2]
+        self.has_point = True
+        return moved
+
+    def movement(self):
+        """
+        Return the last movement as a tuple of the destination point, extruded
+        amount, feedrate, flags and the layer start boolean.
+        """
+        return (
+            tuple(self.dst),
+            self.delta_e,
+            self.feedrate,
+            self.flags,
+            self.layer_start,
+        )
 
-    def command_coords(self, gcode, args, newargs):
-        if gcode in ("G0", "G00", "G1", "G01"):  # move
-            coords = (
-                self.offset["X"] + args["X"],
-                self.offset["Y"] + args["Y"],
-                self.offset["Z"] + args["Z"],
+    def arc_center(self, gcode, newargs, dst):
+        """
+        Return the center of an arc from the previous point to dst relative to
+        the previous point, in the axes of the current plane, and the kind of
+        the arc. The center is either given by I, J and K or by the radius R.
+        """
+        first, second, _ = PLANE_AXES[self.plane]
+        scale = self.mm_in_inch if self.flags & Movement.FLAG_INCHES else 1
+        clockwise = gcode in ("G2", "G02")
+
+        if newargs["R"] is not None:
+            # the center lies on the perpendicular bisector of the chord; a
+            # negative radius picks the longer of the two possible arcs
+            radius = newargs["R"] * scale
+            du = dst[first] - self.point[first]
+            dv = dst[second] - self.point[second]
+            chord = math.hypot(du, dv)
+            if chord == 0:
+                center = (0, 0)
+            else:
+                height = math.sqrt(max(radius**2 - (chord / 2) ** 2, 0))
+                side = -1 if clockwise != (radius < 0) else 1
+                center = (
+                    du / 2 - side * height * dv / chord,
+                    dv / 2 + side * height * du / chord,
+                )
+        else:
+            offsets = (newargs["I"], newargs["J"], newargs["K"])
+            center = (
+                (offsets[first] or 0) * scale,
+                (offsets[second] or 0) * scale,
             )
-            return coords
+
+        return center + (arc_kind(self.plane, clockwise),)
+
+    def get_state(self):
+        """
+        Return a snapshot of the modal state of the parser.
+        """
+        return (
+            tuple(self.registers),
+            tuple(self.offsets),
+            self.src,
+            self.flags,
+            self.relative,
+            self.flavor.name,
+            self.current_layer_z,
+            self.new_layer,
+            self.plane,
+        )
+
+    def set_state(self, state):
+        """
+        Restore the modal state from a snapshot returned by get_state.
+        """
+        (
+            registers,
+            offsets,
+            src,
+            self.flags,
+            self.relative,
+            flavor,
+            self.current_layer_z,
+            self.new_layer,
+            self.plane,
+        ) = state
+        self.registers[:] = registers
+        self.offsets[:] = offsets
+        self.has_point = src is not None
+        if src is not None:
+            self.point[:] = src
+        self.flavor = get_flavor(flavor)
+        self.auto_flavor = False
+
+    def set_flavor(self, header):
+        """
+        Set the flavor to the one detected from the start of the gcode, unless
+        it has been set already.
+        """
+        if self.auto_flavor:
+            self.flavor = detect_flavor(header)
+            self.auto_flavor = False
+            logging.info("Gcode flavor: %s" % self.flavor.name)
+
+    def _commands(self, callback=None):
+        """
+        Return a generator for commands split into tokens.
+
+        With the bulk lexer, commands are assembled from the chunk columns
+        without looking at the text of the lines.
+        """
+        if not isinstance(self.lexer, GcodeBulkLexer):
+            commands = self.lexer.scan()
+            if self.auto_flavor:
+                header = list(itertools.islice(commands, flavors.HEADER_LINES))
+                if header:
+                    lines = ("%s %s" % (gcode, comment) for gcode, _, comment in header)
+                    self.set_flavor("\n".join(lines))
+                commands = itertools.chain(header, commands)
+            yield from commands
+            return
+
+        axes = self.lexer.axes
+        # axis names for every combination of axes present on a line
+        patterns = [
+            tuple(axis for idx, axis in enumerate(axes) if mask & (1 << idx))
+            for mask in range(1 << len(axes))
+        ]
+        weights = 1 << numpy.arange(len(axes))
+
+        for chunk in self.lexer.scan_chunks():
+            if self.auto_flavor:
+                self.set_flavor(chunk.data[: flavors.HEADER_SIZE])
+            commands = chunk.commands
+            comments = chunk.comments()
+            fallback = chunk.fallback
+            masks = (chunk.present @ weights).tolist()
+            values = chunk.values[chunk.present].tolist()
+            rows = zip(chunk.command_codes.tolist(), masks)
+            start = 0
+            for row, (code, mask) in enumerate(rows):
+                keys = patterns[mask]
+                end = start + len(keys)
+                gcode = commands[code]
+                if gcode == "G92" or row in fallback:
+                    # set position depends on all arguments, not just the axes
+                    yield chunk.tokens(row)
+                else:
+                    yield (gcode, ArgsDict(zip(keys, values[start:end])), comments[row])
+                start = end
+
+            if callback and self.lexer.size:
+                callback(self.lexer.bytes_read, self.lexer.size)
+
+    def update_registers(self, newargs):
+        """
+        Set the position registers to the axis words of a command, or add the
+        words to them in relative mode.
+        """
+        registers = self.registers
+        relative = self.relative
+        # unrolled, since a loop would allocate an iterator for every command
+        value = newargs.get("X")
+        if value is not None:
+            registers[0] = registers[0] + value if relative else value
+        value = newargs.get("Y")
+        if value is not None:
+            registers[1] = registers[1] + value if relative else value
+        value = newargs.get("Z")
+        if value is not None:
+            registers[2] = registers[2] + value if relative else value
+        value = newargs.get("E")
+        if value is not None:
+            registers[3] = registers[3] + value if relative else value
+        value = newargs.get("F")
+        if value is not None:
+            registers[4] = registers[4] + value if relative else value
+
+    def command_dst(self, gcode, newargs):
+        """
+        Update the modal state with a command other than G92. Return true if
+        the command goes somewhere, with the destination left in dst.
+        """
+        registers = self.registers
+        offsets = self.offsets
+        dst = self.dst
+        if gcode in self.move_commands or gcode in self.arc_commands:  # move
+            dst[0] = offsets[0] + registers[0]
+            dst[1] = offsets[1] + registers[1]
+            dst[2] = offsets[2] + registers[2]
+            return True
         elif gcode == "G28":  # move to origin
             if newargs["X"] is None and newargs["Y"] is None and newargs["Z"] is None:
                 # if no coordinates specified, move all axes to origin
-                return (self.offset["X"], self.offset["Y"], self.offset["Z"])
+                dst[0], dst[1], dst[2] = offsets[0], offsets[1], offsets[2]
             else:
                 # if any coordinates are specified, reset just the axes
                 # specified; the actual coordinate values are ignored
-                x = self.offset["X"] if newargs["X"] is not None else args["X"]
-                y = self.offset["Y"] if newargs["Y"] is not None else args["Y"]
-                z = self.offset["Z"] if newargs["Z"] is not None else args["Z"]
-                return (x, y, z)
+                dst[0] = offsets[0] if newargs["X"] is not None else registers[0]
+                dst[1] = offsets[1] if newargs["Y"] is not None else registers[1]
+                dst[2] = offsets[2] if newargs["Z"] is not None else registers[2]
+            return True
+        elif gcode in self.plane_commands:  # select plane for arcs
+            self.plane = self.plane_commands.index(gcode)
         elif gcode == "G90":  # set to absolute positioning
             self.relative = False
         elif gcode == "G91":  # set to relative positioning
             self.relative = True
-        elif gcode == "G92":  # set position
-            # G92 without coordinates resets all axes to zero
-            if len(newargs) < 1:
-                newargs = ArgsDict({"X": 0, "Y": 0, "Z": 0, "E": 0})
 
-            for axis in list(newargs.keys()):
-                if axis in self.offset:
-                    self.offset[axis] += self.args[axis] - newargs[axis]
-                    self.args[axis] = newargs[axis]
+        return False
 
-        return None
-
-    def set_flags_skeinforge(self, command):
+    def set_position(self, newargs):
         """
-        Set internal parser state based on command arguments assuming the file
-        has been generated by Skeinforge.
+        Set the position registers to the words of a G92 command, moving their
+        offsets so that the machine stays where it is.
         """
-        gcode, args, comment = command
-
-        if self.marker_loop_start in comment:
-            self.flags |= Movement.FLAG_LOOP
-
-        elif self.marker_loop_end in comment:
-            self.flags &= ~Movement.FLAG_LOOP
-
-        elif self.marker_perimeter_start in comment:
-            self.flags |= Movement.FLAG_PERIMETER
-            if "outer" in comment:
-                self.flags |= Movement.FLAG_PERIMETER_OUTER
-
-        elif self.marker_perimeter_end in comment:
-            self.flags &= ~(Movement.FLAG_PERIMETER | Movement.FLAG_PERIMETER_OUTER)
-
-        elif self.marker_surrounding_loop_start in comment:
-            self.flags |= Movement.FLAG_SURROUND_LOOP
-
-        elif self.marker_surrounding_loop_end in comment:
-            self.flags &= ~Movement.FLAG_SURROUND_LOOP
-
-        elif gcode in ("M101", "M3", "M03", "M4", "M04"):  # turn on extruder/spindle
-            self.flags |= Movement.FLAG_EXTRUDER_ON
-
-        elif gcode in ("M103", "M5", "M05"):  # turn off extruder/spindle
-            self.flags &= ~Movement.FLAG_EXTRUDER_ON
-
-        elif gcode == "G20":
-            self.flags |= Movement.FLAG_INCHES
-
-        elif gcode == "G21":
-            self.flags &= ~Movement.FLAG_INCHES
-
-    def set_flags_slic3r(self, command):
+        # G92 without coordinates resets all axes to zero
+        if len(newargs) < 1:
+            newargs = ArgsDict({"X": 0, "Y": 0, "Z": 0, "E": 0})
+
+        registers = self.registers
+        offsets = self.offsets
+        for idx, axis in enumerate(self.state_axes[:4]):
+            value = newargs[axis]
+            if value is not None:
+                offsets[idx] += registers[idx] - value
+                registers[idx] = value
+
+    def set_flags(self, command):
         """
-        Set internal parser state based on command arguments assuming the file
-        has been generated by Slic3r.
+        Update the flags, and the layer change, with the action the flavor
+        takes for a command.
         """
-        gcode, args, comment = command
+        action = self.flavor.action(command[0], command[2])
+        if action is not None:
+            keep, add, layer = action
+            self.flags = self.flags & keep | add
+            if layer:
+                self.new_layer = True
 
-        if "perimeter" in comment:
-            self.flags |= Movement.FLAG_PERIMETER | Movement.FLAG_PERIMETER_OUTER
-        elif "skirt" in comment:
-            self.flags |= Movement.FLAG_LOOP
-        else:
-            self.flags = 0
+
+class ProfiledGcodeParser(GcodeParser):
+    """
+    GcodeParser that records the time spent lexing, updating arguments,
+    handling flags and creating movements into a LoadProfile (see
+    tatlin.lib.profiling). Timing every command slows parsing down, so the
+    plain GcodeParser is used unless loading is being profiled.
+    """
+
+    def __init__(self, lexer=None, load_profile=None):
+        super(ProfiledGcodeParser, self).__init__(lexer)
+        self.profile = load_profile
+        self._times = {"lex": 0.0, "args": 0.0, "flags": 0.0}
+
+    def parse_continued(self, callback=None):
+        for stage in self._times:
+            self._times[stage] = 0.0
+        self._num_commands = 0
+        bytes_before = getattr(self.lexer, "bytes_read", 0)
+
+        t_start = time.perf_counter()
+        table = super(ProfiledGcodeParser, self).parse_continued(callback)
+        total = time.perf_counter() - t_start
+
+        profile = self.profile
+        num_commands = self._num_commands
+        for stage, seconds in self._times.items():
+            profile.add_time("parse." + stage, seconds, num_commands)
+        # whatever is left is spent creating movements out of the commands
+        profile.add_time("parse.movements", total - sum(self._times.values()))
+
+        profile.count("lines", num_commands)
+        profile.count("bytes", getattr(self.lexer, "bytes_read", 0) - bytes_before)
+        profile.count("movements", table.num_movements)
+        return table
+
+    def _commands(self, callback=None):
+        commands = super(ProfiledGcodeParser, self)._commands(callback)
+        perf_counter = time.perf_counter
+        while True:
+            t_start = perf_counter()
+            command = next(commands, None)
+            self._times["lex"] += perf_counter() - t_start
+            if command is None:
+                return
+            self._num_commands += 1
+            yield command
+
+    def update_registers(self, newargs):
+        t_start = time.perf_counter()
+        super(ProfiledGcodeParser, self).update_registers(newargs)
+        self._times["args"] += time.perf_counter() - t_start
+
+    def set_flags(self, command):
+        t_start = time.perf_counter()
+        super(ProfiledGcodeParser, self).set_flags(command)
+        self._times["flags"] += time.perf_counter() - t_start
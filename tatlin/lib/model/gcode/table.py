@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Columnar storage for parsed gcode movements.
+"""
+
+import array
+
+import numpy
+
+
+class MovementTable(object):
+    """
+    Movements of a gcode file stored in columns.
+
+    Every movement is a row: its destination point in `vertices`, the amount
+    of extruded material in `delta_e`, the feedrate and the flags. Layers are
+    consecutive runs of rows; layer i spans rows layer_stops[i] up to
+    layer_stops[i + 1].
+
+    For code that still works with Movement objects, the table behaves like
+    the list of layers of movements that GcodeParser.parse used to return.
+    """
+
+    # room to reserve when the table grows, relative to its size
+    growth = 0.5
+
+    def __init__(self, vertices, delta_e, feedrate, flags, layer_stops):
+        self._vertices = numpy.ascontiguousarray(vertices, numpy.float32).reshape(-1, 3)
+        self._delta_e = numpy.ascontiguousarray(delta_e, numpy.float32)
+        self._feedrate = numpy.ascontiguousarray(feedrate, numpy.float32)
+        self._flags = numpy.ascontiguousarray(flags, numpy.uint8)
+        self._count = len(self._vertices)
+        self.layer_stops = numpy.ascontiguousarray(layer_stops, numpy.int64)
+
+    @property
+    def vertices(self):
+        return self._vertices[: self._count]
+
+    @property
+    def delta_e(self):
+        return self._delta_e[: self._count]
+
+    @property
+    def feedrate(self):
+        return self._feedrate[: self._count]
+
+    @property
+    def flags(self):
+        return self._flags[: self._count]
+
+    def extend(self, other):
+        """
+        Append the movements of another table, like one returned by
+        GcodeParser.parse_continued. The first layer of the other table
+        continues the last layer of this one.
+
+        Columns are allocated with room to spare, so appending a few
+        movements at a time does not copy the whole table every time.
+        """
+        if other.num_layers < 1:
+            return
+
+        start = self._count
+        end = start + other.num_movements
+        for name in ("_vertices", "_delta_e", "_feedrate", "_flags"):
+            setattr(self, name, _reserve(getattr(self, name), start, end, self.growth))
+
+        self._vertices[start:end] = other.vertices
+        self._delta_e[start:end] = other.delta_e
+        self._feedrate[start:end] = other.feedrate
+        self._flags[start:end] = other.flags
+        self._count = end
+
+        stops = other.layer_stops[1:] + start
+        if self.num_layers < 1:
+            self.layer_stops = numpy.concatenate(([0], stops))
+        else:
+            self.layer_stops = numpy.concatenate((self.layer_stops[:-1], stops))
+
+    @classmethod
+    def from_layers(cls, layers):
+        """
+        Create a table from a list of layers of Movement objects.
+        """
+        movements = [move for layer in layers for move in layer]
+        return cls(
+            [tuple(move.v) for move in movements],
+            [move.delta_e for move in movements],
+            [move.feedrate for move in movements],
+            [move.flags for move in movements],
+            numpy.cumsum([0] + [len(layer) for layer in layers]),
+        )
+
+    @classmethod
+    def concatenate(cls, tables):
+        """
+        Join tables into one, keeping the layers of every table separate.
+        """
+        tables = list(tables)
+        offsets = numpy.cumsum([0] + [table.num_movements for table in tables])
+        stops = [table.layer_stops[1:] + offset for table, offset in zip(tables, offsets)]
+        return cls(
+            numpy.concatenate([table.vertices for table in tables]),
+            numpy.concatenate([table.delta_e for table in tables]),
+            numpy.concatenate([table.feedrate for table in tables]),
+            numpy.concatenate([table.flags for table in tables]),
+            numpy.concatenate([[0]] + stops),
+        )
+
+    @property
+    def x(self):
+        return self.vertices[:, 0]
+
+    @property
+    def y(self):
+        return self.vertices[:, 1]
+
+    @property
+    def z(self):
+        return self.vertices[:, 2]
+
+    @property
+    def num_movements(self):
+        return self._count
+
+    @property
+    def num_layers(self):
+        return len(self.layer_stops) - 1
+
+    def layer_slice(self, idx):
+        """
+        Return the slice of rows that make up a layer.
+        """
+        return slice(int(self.layer_stops[idx]), int(self.layer_stops[idx + 1]))
+
+    def movement(self, idx):
+        """
+        Return a row as a Movement object.
+        """
+        from .parser import Movement
+
+        return Movement(
+            array.array("f", self.vertices[idx].tolist()),
+            float(self.delta_e[idx]),
+            float(self.feedrate[idx]),
+            int(self.flags[idx]),
+        )
+
+    def __len__(self):
+        return self.num_layers
+
+    def __getitem__(self, idx):
+        """
+        Return a layer as a list of Movement objects.
+        """
+        if idx < 0:
+            idx += self.num_layers
+        if not 0 <= idx < self.num_layers:
+            raise IndexError("layer index out of range")
+        layer = self.layer_slice(idx)
+        return [self.movement(row) for row in range(layer.start, layer.stop)]
+
+    def __repr__(self):
+        return "MovementTable(%d movements, %d layers)" % (
+            self.num_movements,
+            self.num_layers,
+        )
+
+
+class MovementAttributes(object):
+    """
+    What tells movements apart, stored in columns: the amount of extruded
+    material, the height and the flags of every movement.
+
+    This is what a model keeps of a MovementTable once the points are in its
+    vertex buffers, so that the table itself can be released.
+    """
+
+    # room to reserve when the columns grow, relative to their size
+    growth = 0.5
+
+    def __init__(self, delta_e, z, flags):
+        self._delta_e = numpy.asarray(delta_e, numpy.float32)
+        self._z = numpy.asarray(z, numpy.float32)
+        self._flags = numpy.asarray(flags, numpy.uint8)
+        self._count = len(self._flags)
+
+    @classmethod
+    def from_table(cls, table, start=0):
+        """
+        Return the attributes of the movements of a table from row start on.
+        They share the delta_e and flags columns of the table, but not the
+        vertices.
+        """
+        return cls(table.delta_e[start:], table.z[start:].copy(), table.flags[start:])
+
+    @property
+    def delta_e(self):
+        return self._delta_e[: self._count]
+
+    @property
+    def z(self):
+        return self._z[: self._count]
+
+    @property
+    def flags(self):
+        return self._flags[: self._count]
+
+    @property
+    def num_movements(self):
+        return self._count
+
+    def extend(self, table, start=0):
+        """
+        Append the attributes of the movements of a table from row start on.
+        """
+        other = MovementAttributes(
+            table.delta_e[start:], table.z[start:], table.flags[start:]
+        )
+        begin = self._count
+        end = begin + other.num_movements
+        for name in ("_delta_e", "_z", "_flags"):
+            column = _reserve(getattr(self, name), begin, end, self.growth)
+            column[begin:end] = getattr(other, name)
+            setattr(self, name, column)
+        self._count = end
+
+    def __repr__(self):
+        return "MovementAttributes(%d movements)" % self.num_movements
+
+
+def _reserve(column, count, end, growth):
+    """
+    Return a column with room for end rows, the column itself if it has room
+    and can be written to, otherwise a copy of its first count rows.
+    """
+    if end <= len(column) and column.flags.writeable:
+        return column
+    capacity = max(end, int(len(column) * (1 + growth)))
+    grown = numpy.empty((capacity,) + column.shape[1:], column.dtype)
+    grown[:count] = column[:count]
+    return grown
@@ -23,7 +23,7 @@ from .parser import StlParseError, StlParser
 
 
 class STLModelLoader(BaseModelLoader):
-    def load(self, config, scene, progress_dlg):
+    def read(self, config, progress_dlg, preview=None):
         with open(self.path, "rb") as stlfile:
             parser = StlParser(stlfile)
             parser.load(stlfile)
@@ -34,11 +34,12 @@ class STLModelLoader(BaseModelLoader):
                 progress_dlg.stage("Loading model...")
                 model = StlModel()
                 model.load_data(data, progress_dlg.step)
-
-                scene.add_model(model)
-                scene.mode_2d = False
-
-                return model, StlPanel
+                return model
             except StlParseError as e:
                 # rethrow as generic file error
                 raise ModelFileError(f"Parsing error: {e}")
+
+    def show(self, model, config, scene):
+        scene.add_model(model)
+        scene.mode_2d = False
+        return StlPanel
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Loading models on a worker thread.
+
+Reading a file into a model makes no GL calls, so it can run off the main
+thread while the UI keeps responding. Everything the worker has to tell the
+main thread, progress included, is passed through a call_after function like
+wx.CallAfter, and the models are only drawn, and their buffers uploaded, on
+the main thread.
+"""
+
+import logging
+import threading
+import time
+
+from .baseloader import ModelFileError
+
+
+class LoadCanceled(Exception):
+    pass
+
+
+class WorkerProgress(object):
+    """
+    Progress of a worker passed on to a progress dialog on the main thread.
+
+    Steps are passed on at most every interval seconds, and once the worker
+    has been canceled, reporting progress raises LoadCanceled, which stops the
+    loader at its next step.
+    """
+
+    interval = 0.1  # seconds
+
+    def __init__(self, progress_dlg, call_after, canceled):
+        self.progress_dlg = progress_dlg
+        self.call_after = call_after
+        self.canceled = canceled
+        self._last_step = None
+
+    def stage(self, message):
+        self._check_canceled()
+        self._last_step = None
+        self.call_after(self.progress_dlg.stage, message)
+
+    def step(self, count, limit):
+        self._check_canceled()
+        now = time.monotonic()
+        if (
+            self._last_step is None
+            or now - self._last_step >= self.interval
+            or count >= limit
+        ):
+            self._last_step = now
+            self.call_after(self.progress_dlg.step, count, limit)
+
+    def _check_canceled(self):
+        if self.canceled.is_set():
+            raise LoadCanceled()
+
+
+class LoadWorker(object):
+    """
+    Read a file into a model with a model loader on a worker thread.
+
+    The callbacks are called on the main thread through call_after. If the
+    loader can show the file while reading it, on_preview is called with a
+    model of the first part of the file, then with the model and every
+    following part to append to it. Then on_done is called with the complete
+    model, or on_error with the exception that stopped the loader. None of
+    them is called once the worker has been canceled.
+    """
+
+    def __init__(
+        self,
+        loader,
+        config,
+        progress_dlg,
+        call_after,
+        on_preview=None,
+        on_done=None,
+        on_error=None,
+    ):
+        self.loader = loader
+        self.config = config
+        self.progress_dlg = progress_dlg
+        self.call_after = call_after
+        self.on_preview = on_preview
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self.model = None
+        self.error = None
+        self._canceled = threading.Event()
+        self._thread = None
+        # set once the last call passed to call_after has been made
+        self._delivered = threading.Event()
+        self._delivered.set()
+
+    @property
+    def canceled(self):
+        return self._canceled.is_set()
+
+    def start(self):
+        # a worker left running does not keep the app from quitting
+        self._thread = threading.Thread(
+            target=self.run, name="LoadWorker", daemon=True
+        )
+        self._thread.start()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def cancel(self):
+        """
+        Stop loading the next time the loader reports progress. On the main
+        thread, no callback is called after this returns.
+        """
+        self._canceled.set()
+
+    def run(self):
+        """
+        Read the file on the calling thread.
+        """
+        progress = WorkerProgress(self.progress_dlg, self.call_after, self._canceled)
+        preview = self._preview if self.on_preview is not None else None
+        try:
+            model = self.loader.read(self.config, progress, preview)
+            # the main thread may still be appending to a previewed model
+            self._delivered.wait()
+            if self.canceled:
+                raise LoadCanceled()
+            self.loader.store(self.config, model)
+        except LoadCanceled:
+            logging.info("Canceled loading %s" % self.loader.path)
+            return
+        except (IOError, ModelFileError) as e:
+            self.error = e
+            self._call(self.on_error, e)
+            return
+        except Exception as e:
+            logging.exception("Could not load %s" % self.loader.path)
+            self.error = e
+            self._call(self.on_error, e)
+            return
+
+        self.model = model
+        self._call(self.on_done, model)
+
+    def _preview(self, model, data=None):
+        self._call(self.on_preview, model, data)
+
+    def _call(self, callback, *args):
+        if callback is not None and not self.canceled:
+            delivered = threading.Event()
+            self._delivered = delivered
+            self.call_after(self._deliver, delivered, callback, *args)
+
+    def _deliver(self, delivered, callback, *args):
+        try:
+            # the worker may have been canceled after the call was queued
+            if not self.canceled:
+                callback(*args)
+        finally:
+            delivered.set()
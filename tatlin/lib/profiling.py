@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Time and counters of the stages of loading a model.
+
+Profiling is off unless a LoadProfile is active, in which case the code
+loading models records where the time goes into it:
+
+    with profiling.profile() as prof:
+        model, _ = loader.load(config, scene, progress_dlg)
+    print(prof.as_dict())
+
+Stages are named like "parse.lex" or "model.colors", the part before the
+dot telling which part of the program the stage belongs to.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+import json
+import time
+
+
+_active = None
+
+
+class LoadProfile(object):
+    """
+    Time spent in named stages, how many times each stage was entered, and
+    named counters like the number of lines or bytes read.
+    """
+
+    def __init__(self):
+        self.info = OrderedDict()  # what was loaded, like the file name
+        self.times = OrderedDict()
+        self.calls = OrderedDict()
+        self.counters = OrderedDict()
+        self.t_start = time.perf_counter()
+        self.t_end = None
+
+    @contextmanager
+    def stage(self, name):
+        t_start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - t_start)
+
+    def add_time(self, name, seconds, calls=1):
+        self.times[name] = self.times.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def stop(self):
+        if self.t_end is None:
+            self.t_end = time.perf_counter()
+
+    @property
+    def total_time(self):
+        end = self.t_end if self.t_end is not None else time.perf_counter()
+        return end - self.t_start
+
+    def rate(self, counter, stage_prefix="parse."):
+        """
+        Return how many of a counter were processed per second of the stages
+        whose names start with stage_prefix, or None if no time was spent in
+        them.
+        """
+        seconds = sum(
+            t for name, t in self.times.items() if name.startswith(stage_prefix)
+        )
+        if counter not in self.counters or seconds <= 0:
+            return None
+        return self.counters[counter] / seconds
+
+    def as_dict(self):
+        return OrderedDict(
+            [
+                ("info", OrderedDict(self.info)),
+                ("total_seconds", self.total_time),
+                (
+                    "stages",
+                    OrderedDict(
+                        (name, {"seconds": seconds, "calls": self.calls[name]})
+                        for name, seconds in self.times.items()
+                    ),
+                ),
+                ("counters", OrderedDict(self.counters)),
+                ("lines_per_second", self.rate("lines")),
+                ("bytes_per_second", self.rate("bytes")),
+            ]
+        )
+
+    def dump(self, f):
+        json.dump(self.as_dict(), f, indent=2)
+        f.write("\n")
+
+
+def active():
+    """
+    Return the active LoadProfile, or None if nothing is being profiled.
+    """
+    return _active
+
+
+def stage(name):
+    """
+    Return a context manager timing a stage of the active profile, if any.
+    """
+    if _active is None:
+        return nullcontext()
+    return _active.stage(name)
+
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
+
+
+@contextmanager
+def profile(load_profile=None):
+    """
+    Make a LoadProfile active for the duration of the block and yield it.
+    """
+    global _active
+    previous = _active
+    _active = load_profile if load_profile is not None else LoadProfile()
+    try:
+        yield _active
+    finally:
+        _active.stop()
+        _active = previous
@@ -20,6 +20,9 @@ from wx import glcanvas
 
 
 class BaseScene(glcanvas.GLCanvas):
+    # milliseconds after the view last moved to draw it at full detail again
+    refine_delay = 250
+
     def __init__(self, parent):
         try:  # the new way
             super(BaseScene, self).__init__(parent, self._get_display_attributes())
@@ -31,6 +34,11 @@ class BaseScene(glcanvas.GLCanvas):
         self.initialized = False
         self.context = glcanvas.GLContext(self)
 
+        # models can be drawn at a coarser level of detail while the view is
+        # being moved around
+        self.interacting = False
+        self._refine_timer = None
+
         self.Bind(wx.EVT_ERASE_BACKGROUND, self._on_erase_background)
         self.Bind(wx.EVT_SIZE, self._on_size)
         self.Bind(wx.EVT_PAINT, self._on_paint)
@@ -94,6 +102,22 @@ class BaseScene(glcanvas.GLCanvas):
     def invalidate(self):
         self.Refresh(False)
 
+    def start_interaction(self):
+        """
+        Mark the view as moving, until it has not moved for refine_delay,
+        when it is drawn again.
+        """
+        self.interacting = True
+        if self._refine_timer is None:
+            self._refine_timer = wx.CallLater(self.refine_delay, self._refine)
+        else:
+            self._refine_timer.Restart(self.refine_delay)
+
+    def _refine(self):
+        self.interacting = False
+        if self and not self.IsBeingDeleted():
+            self.invalidate()
+
     def _on_erase_background(self, event):
         pass  # Do nothing, to avoid flashing on MSW. Doesn't seem to be working, though :(
 
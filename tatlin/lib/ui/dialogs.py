@@ -120,9 +120,18 @@ class QuitDialog(wx.Dialog):
 
 
 class ProgressDialog(wx.ProgressDialog):
-    def __init__(self):
-        super(ProgressDialog, self).__init__("Loading", "", 100)
-
+    def __init__(self, cancel=None):
+        """
+        Given a cancel function, the dialog has a button that calls it and
+        leaves the other windows usable while loading.
+        """
+        if cancel is not None:
+            style = wx.PD_AUTO_HIDE | wx.PD_CAN_ABORT
+        else:
+            style = wx.PD_AUTO_HIDE | wx.PD_APP_MODAL
+        super(ProgressDialog, self).__init__("Loading", "", 100, style=style)
+
+        self.cancel = cancel
         self.value = -1
         self._destroyed = False
 
@@ -137,7 +146,7 @@ class ProgressDialog(wx.ProgressDialog):
         if self._is_valid():
             try:
                 self.Show()
-                self.Update(0, message)
+                self._update(0, message)
             except:
                 pass  # Ignore errors if window is being destroyed
 
@@ -145,10 +154,15 @@ class ProgressDialog(wx.ProgressDialog):
         if self._is_valid():
             try:
                 self.value = max(-1, min(int(count / limit * 100), 100))
-                self.Update(self.value)
+                self._update(self.value)
             except:
                 pass  # Ignore errors if window is being destroyed
 
+    def _update(self, value, message=""):
+        proceed, _ = self.Update(value, message)
+        if not proceed and self.cancel is not None:
+            self.cancel()
+
     def hide(self):
         if self._is_valid():
             try:
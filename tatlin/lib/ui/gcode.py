@@ -86,9 +86,11 @@ class GcodePanel(Panel):
         self.btn_reset_view = wx.Button(self, label="Reset view")
         # Center view
         self.btn_center_view = wx.Button(self, label="Center view")
+        self.btn_fit_layers = wx.Button(self, label="Fit layers")
         
         # Set minimum sizes to prevent GTK allocation errors
-        for btn in [self.btn_zoom_in, self.btn_zoom_out, self.btn_reset_view, self.btn_center_view]:
+        for btn in [self.btn_zoom_in, self.btn_zoom_out, self.btn_reset_view,
+                    self.btn_center_view, self.btn_fit_layers]:
             btn.SetMinSize((100, 30))
 
         # Tooltips show keyboard shortcuts
@@ -96,6 +98,7 @@ class GcodePanel(Panel):
         self.btn_zoom_out.SetToolTip("Zoom out (Ctrl+-)")
         self.btn_reset_view.SetToolTip("Reset view (Ctrl+0)")
         self.btn_center_view.SetToolTip("Center model in the view")
+        self.btn_fit_layers.SetToolTip("Fit the layers shown in the view")
 
         hzoom = wx.BoxSizer(wx.HORIZONTAL)
         hzoom.Add(self.btn_zoom_in, 0, wx.RIGHT | wx.FIXED_MINSIZE, border=5)
@@ -127,6 +130,7 @@ class GcodePanel(Panel):
         hreset.Add(self.btn_reset_view, 0, wx.RIGHT | wx.FIXED_MINSIZE, border=5)
         hreset.Add(self.btn_center_view, 0, wx.FIXED_MINSIZE)
         box_display.Add(hreset, 0, wx.EXPAND | wx.TOP, border=5)
+        box_display.Add(self.btn_fit_layers, 0, wx.TOP | wx.FIXED_MINSIZE, border=5)
 
         sizer_display.Add(box_display, 0, wx.EXPAND | wx.ALL, border=5)
 
@@ -153,6 +157,7 @@ class GcodePanel(Panel):
         self.check_grid.Bind(wx.EVT_CHECKBOX, self.on_grid_toggled)
         self.btn_reset_view.Bind(wx.EVT_BUTTON, self.on_reset_clicked)
         self.btn_center_view.Bind(wx.EVT_BUTTON, self.on_center_clicked)
+        self.btn_fit_layers.Bind(wx.EVT_BUTTON, self.on_fit_clicked)
         self.btn_zoom_in.Bind(wx.EVT_BUTTON, self.on_zoom_in)
         self.btn_zoom_out.Bind(wx.EVT_BUTTON, self.on_zoom_out)
         self.check_3d.Bind(wx.EVT_CHECKBOX, self.on_set_mode)
@@ -350,6 +355,14 @@ class GcodePanel(Panel):
         except Exception:
             pass
 
+    def on_fit_clicked(self, event):
+        """
+        Zoom in on the layers shown, like the top layer when going through
+        the layers one by one in 2D mode.
+        """
+        self.scene.fit_visible_layers()
+        self.scene.invalidate()
+
     def on_zoom_in(self, event):
         """Zoom the scene in by one tick."""
         self.scene.zoom_in()
@@ -385,9 +398,23 @@ class GcodePanel(Panel):
         self.check_grid.SetValue(True)  # check the box
         self.check_3d.SetValue(True)
 
+        self.update_dimensions(width, height, depth)
+
+    def update_dimensions(self, width, height, depth):
         self.label_width_value.SetLabel(format_float(width))
         self.label_height_value.SetLabel(format_float(height))
         self.label_depth_value.SetLabel(format_float(depth))
 
+    def update_layers(self, layers_range_max, layers_value):
+        """
+        Update the layer slider after layers have been added to the model.
+        """
+        if layers_range_max > 1:
+            self.slider_layers.SetRange(1, layers_range_max)
+            self.slider_layers.SetValue(layers_value)
+            if not self.slider_layers.IsShown():
+                self.slider_layers.Show()
+                self.Layout()
+
     def set_3d_view(self, value):
         self.check_3d.SetValue(value)
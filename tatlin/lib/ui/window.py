@@ -39,6 +39,9 @@ class MainWindow(wx.Frame):
         self.recent_files_item = file_menu.Append(
             wx.ID_ANY, "&Recent files", self.recent_files_menu
         )
+        self.item_follow = file_menu.AppendCheckItem(
+            wx.ID_ANY, "&Follow file", "Keep showing Gcode appended to the file"
+        )
         item_save = file_menu.Append(wx.ID_SAVE, "&Save", "Save changes")
         item_save.Enable(False)
         item_save_as = file_menu.Append(
@@ -57,6 +60,7 @@ class MainWindow(wx.Frame):
         self.menubar.Append(help_menu, "&Help")
 
         self.Bind(wx.EVT_MENU, app.on_file_open, item_open)
+        self.Bind(wx.EVT_MENU, app.on_follow_toggled, self.item_follow)
         self.Bind(wx.EVT_MENU, app.on_file_save, item_save)
         self.Bind(wx.EVT_MENU, app.on_file_save_as, item_save_as)
         self.Bind(wx.EVT_MENU, app.on_quit, item_quit)
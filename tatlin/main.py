@@ -21,6 +21,7 @@ import os
 import os.path
 import logging
 import argparse
+import multiprocessing
 from typing import Any
 
 # Suppress GTK warnings that occur during wxPython widget initialization
@@ -46,11 +47,15 @@ try:
 except:
     pass
 
-from tatlin.lib.model import ModelFileError, ModelLoader
+from tatlin.lib import profiling
+from tatlin.lib.model import ModelFileError, ModelLoader, STDIN_PATH
+from tatlin.lib.model.gcode.parser import GcodeParserError
 from tatlin.lib.model.stl.writer import STLModelWriter
+from tatlin.lib.model.worker import LoadWorker
 
 from tatlin.lib.gl.platform import Platform
 from tatlin.lib.gl.scene import Scene
+from tatlin.lib.gl.shaders import RENDERERS
 
 from tatlin.lib.ui.app import BaseApp
 from tatlin.lib.ui.window import MainWindow
@@ -70,7 +75,9 @@ from tatlin.conf.config import Config
 
 class App(BaseApp):
 
-    def __init__(self, file_to_open=None):
+    def __init__(
+        self, file_to_open=None, follow=False, profile_load=None, renderer=None
+    ):
         super(App, self).__init__()
 
         self.window = MainWindow(self)
@@ -94,6 +101,18 @@ class App(BaseApp):
         # Store file to open after window is shown
         self.file_to_open = file_to_open
 
+        # write a report of the time spent loading the file there and quit
+        self.profile_load = profile_load
+
+        # poll the open file for appended gcode
+        self.follow = follow
+        self.window.item_follow.Check(follow)
+        self.follow_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_follow_timer, self.follow_timer)
+
+        # the renderer given on the command line overrides the configured one
+        self.renderer = renderer or self.config.read("ui.renderer")
+
     def init_config(self):
         fname = os.path.expanduser(os.path.join("~", ".tatlin"))
         self.config = Config(fname)
@@ -102,6 +121,10 @@ class App(BaseApp):
         self.panel: Any = None
         self.scene: Any = None
         self.model_loader: Any = None
+        # the file being loaded in the background, and whether a preview of
+        # it is shown
+        self.load_worker: Any = None
+        self.previewing = False
 
     def show_window(self):
         self.window.show_all()
@@ -110,7 +133,13 @@ class App(BaseApp):
         """Start the application event loop."""
         # Open file after window is shown (if provided via command line)
         if self.file_to_open:
-            wx.CallAfter(self.open_and_display_file, os.path.abspath(self.file_to_open))
+            fpath = self.file_to_open
+            if fpath != STDIN_PATH:
+                fpath = os.path.abspath(fpath)
+            if self.profile_load:
+                wx.CallAfter(self.profile_file, fpath)
+            else:
+                wx.CallAfter(self.open_and_display_file, fpath)
         super(App, self).run()
 
     @property
@@ -143,6 +172,38 @@ class App(BaseApp):
                 else:
                     show_again = False
 
+    def on_follow_toggled(self, event=None):
+        self.follow = self.window.item_follow.IsChecked()
+        if not self.follow:
+            self.follow_timer.Stop()
+        elif self.model_loader is not None and self.model_loader.filetype == "gcode":
+            # the file has to be read again to pick up the parser state at
+            # its end
+            self.open_and_display_file(self.model_loader.path)
+
+    def on_follow_timer(self, event=None):
+        """
+        Show gcode appended to the followed file since the last check.
+        """
+        follower = getattr(self.model_loader, "follower", None)
+        if follower is None or self.scene is None:
+            self.follow_timer.Stop()
+            return
+
+        try:
+            data = follower.read()
+        except (IOError, ModelFileError, GcodeParserError) as e:
+            logging.warning("Could not read %s: %s" % (follower.path, e))
+            self.follow_timer.Stop()
+            return
+
+        if data is None:
+            # the file has been truncated or replaced, start over
+            self.follow_timer.Stop()
+            self.open_and_display_file(self.model_loader.path)
+        elif data.num_layers > 0:
+            self.append_to_model(data, follower.position)
+
     def on_file_save(self, event=None):
         """
         Save changes to the same file.
@@ -193,6 +254,7 @@ class App(BaseApp):
             )
 
         if self.save_changes_dialog():
+            self.cancel_loading()
             self.window.quit()
 
     def on_zoom_in(self, event=None):
@@ -250,69 +312,178 @@ class App(BaseApp):
         self.recent_files = self.recent_files[:RECENT_FILE_LIMIT]
         self.window.update_recent_files_menu(self.recent_files)
 
-    def open_and_display_file(self, fpath, ftype=None):
-        self.set_wait_cursor()
-        progress_dialog = ProgressDialog()
-        success = True
+    def profile_file(self, fpath):
+        """
+        Open a file with profiling on, write the profile as JSON and quit.
+        """
+        with profiling.profile() as load_profile:
+            load_profile.info["file"] = fpath
+            success = self.open_and_display_file(fpath, background=False)
+            if success:
+                # vertex buffers are uploaded while drawing the first frame
+                with load_profile.stage("gl.first_frame"):
+                    self.scene.Refresh(False)
+                    self.scene.Update()
+        load_profile.info["success"] = success
+
+        if self.profile_load == "-":
+            load_profile.dump(sys.stdout)
+        else:
+            try:
+                with open(self.profile_load, "w") as f:
+                    load_profile.dump(f)
+            except IOError as e:
+                logging.error("Could not write profile: %s" % e)
+        self.window.quit()
+
+    def open_and_display_file(self, fpath, ftype=None, background=True):
+        """
+        Load a file on a worker thread and show it once it has been loaded,
+        or, for large gcode files, as soon as its first layers have been read
+        and then every following part of it. The scene of the previous file
+        stays until then, and the progress dialog can cancel loading.
+
+        Return false if the file cannot be opened at all. Without background,
+        the file is loaded on the main thread, and the return value tells
+        whether it has been shown.
+        """
+        self.cancel_loading()
+        self.follow_timer.Stop()
 
         try:
-            self.update_recent_files(fpath, ftype)
-            self.scene = Scene(self.window)
-            self.scene.clear()
+            if fpath != STDIN_PATH:
+                self.update_recent_files(fpath, ftype)
+            model_loader = ModelLoader(fpath)
+        except (IOError, ModelFileError) as e:
+            OpenErrorAlert(fpath, e).show()
+            return False
 
-            self.model_loader = ModelLoader(fpath)
+        following = self.follow and fpath != STDIN_PATH
+        if following and model_loader.filetype == "gcode":
+            model_loader.follow = True
 
-            model, Panel = self.model_loader.load(
-                self.config, self.scene, progress_dialog
-            )
+        self.set_wait_cursor()
+        if background:
+            progress_dialog = ProgressDialog(self.cancel_loading)
+            call_after = wx.CallAfter
+        else:
+            progress_dialog = ProgressDialog()
+            call_after = lambda func, *args: func(*args)
+        self.load_worker = LoadWorker(
+            model_loader,
+            self.config,
+            progress_dialog,
+            call_after,
+            on_preview=self.on_model_preview if background else None,
+            on_done=self.on_model_loaded,
+            on_error=self.on_load_error,
+        )
+        if not background:
+            worker = self.load_worker
+            worker.run()
+            return worker.model is not None
+        self.load_worker.start()
+        return True
+
+    def cancel_loading(self):
+        """
+        Stop loading a file in the background, leaving any preview of it.
+        """
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+            self.end_loading()
+
+    def end_loading(self):
+        self.load_worker.progress_dlg.destroy()
+        self.load_worker = None
+        self.previewing = False
+        self.set_normal_cursor()
+
+    def on_model_preview(self, model, data=None):
+        if data is None:
+            self.display_model(self.load_worker.loader, model)
+            self.previewing = True
+        else:
+            self.append_to_model(data, self.model_loader.size)
 
-            # platform needs to be added last to be translucent
-            platform_w = self.config.read("machine.platform_w", float)
-            platform_d = self.config.read("machine.platform_d", float)
-            platform = Platform(platform_w, platform_d)
-            self.scene.add_supporting_actor(platform)
-
-            # update panel to reflect new model properties
-            self.panel = Panel(self.window, self.scene)
-            self.panel.set_initial_values(
-                getattr(model, "max_layers", 0),
-                getattr(model, "max_layers", 0),
-                model.width,
-                model.height,
-                model.depth,
-            )
-            self.panel.connect_handlers()
+    def on_model_loaded(self, model):
+        model_loader = self.load_worker.loader
+        previewing = self.previewing
+        self.end_loading()
+        if not previewing:
+            self.display_model(model_loader, model)
 
-            if hasattr(self.panel, "set_3d_view"):
-                self.panel.set_3d_view(not self.scene.mode_2d)  # type:ignore
+        if getattr(model_loader, "follower", None) is not None:
+            interval = self.config.read("ui.follow_interval", int)
+            self.follow_timer.Start(interval)
 
-            # always start with the same view on the scene
-            self.scene.reset_view(True)
+    def on_load_error(self, error):
+        fpath = self.load_worker.loader.path
+        self.end_loading()
+        OpenErrorAlert(fpath, error).show()
 
-            self.window.set_file_widgets(self.scene, self.panel)
-            self.window.filename = self.model_loader.basename
-            self.window.file_modified = False
-            self.window.menu_enable_file_items(self.model_loader.filetype != "gcode")
-
-            self.window.update_status(
-                format_status(
-                    self.model_loader.basename,
-                    self.model_loader.size,
-                    model.vertex_count,
-                )
-            )
-        except (IOError, ModelFileError) as e:
-            self.set_normal_cursor()
-            error_dialog = OpenErrorAlert(fpath, e)
-            error_dialog.show()
-            success = False
-        finally:
-            progress_dialog.destroy()
-            self.set_normal_cursor()
-        return success
+    def display_model(self, model_loader, model):
+        """
+        Show a model in a new scene.
+        """
+        self.model_loader = model_loader
+        self.scene = Scene(self.window)
+        self.scene.renderer = self.renderer
+        self.scene.clear()
+
+        Panel = model_loader.show(model, self.config, self.scene)
+
+        # platform needs to be added last to be translucent
+        platform_w = self.config.read("machine.platform_w", float)
+        platform_d = self.config.read("machine.platform_d", float)
+        platform = Platform(platform_w, platform_d)
+        self.scene.add_supporting_actor(platform)
+
+        # update panel to reflect new model properties
+        self.panel = Panel(self.window, self.scene)
+        self.panel.set_initial_values(
+            getattr(model, "max_layers", 0),
+            getattr(model, "max_layers", 0),
+            model.width,
+            model.height,
+            model.depth,
+        )
+        self.panel.connect_handlers()
+
+        if hasattr(self.panel, "set_3d_view"):
+            self.panel.set_3d_view(not self.scene.mode_2d)  # type:ignore
+
+        # always start with the same view on the scene
+        self.scene.reset_view(True)
+
+        self.window.set_file_widgets(self.scene, self.panel)
+        self.window.filename = model_loader.basename
+        self.window.file_modified = False
+        self.window.menu_enable_file_items(model_loader.filetype != "gcode")
+        self.window.update_status(
+            format_status(model_loader.basename, model_loader.size, model.vertex_count)
+        )
+
+    def append_to_model(self, data, size):
+        """
+        Show gcode appended to the model, given the size of the file to show
+        in the status bar.
+        """
+        model = self.scene.model
+        model.append_data(data)
+        self.panel.update_layers(model.max_layers, model.num_layers_to_draw)
+        self.panel.update_dimensions(model.width, model.height, model.depth)
+        self.window.update_status(
+            format_status(self.model_loader.basename, size, model.vertex_count)
+        )
+        self.scene.invalidate()
 
 
 def run():
+    # large gcode files are parsed in worker processes, which frozen
+    # executables have to dispatch before doing anything else
+    multiprocessing.freeze_support()
+
     parser = argparse.ArgumentParser(
         description='Tatlin - STL and GCode viewer',
         formatter_class=argparse.RawDescriptionHelpFormatter
@@ -320,7 +491,24 @@ def run():
     parser.add_argument(
         'file',
         nargs='?',
-        help='GCode or STL file to open'
+        help='GCode or STL file to open; "-" reads GCode from standard input'
+    )
+    parser.add_argument(
+        '-f', '--follow',
+        action='store_true',
+        help='Keep showing GCode appended to the file, like tail -f'
+    )
+    parser.add_argument(
+        '--profile-load',
+        metavar='PATH',
+        help='Time every stage of loading the file, write the timings to PATH '
+        'as JSON ("-" for standard output) and quit'
+    )
+    parser.add_argument(
+        '--renderer',
+        choices=RENDERERS,
+        help='Draw models with shaders when the graphics driver supports them '
+        '(auto), always try to (shader), or never (legacy)'
     )
     parser.add_argument(
         '-v', '--verbose',
@@ -343,7 +531,10 @@ def run():
         force=True,
     )
 
-    app = App(args.file)
+    if args.profile_load and not args.file:
+        parser.error("--profile-load needs a file to open")
+
+    app = App(args.file, args.follow, args.profile_load, args.renderer)
     app.show_window()
     app.run()
 
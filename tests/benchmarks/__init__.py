@@ -0,0 +1,12 @@
+"""
+Benchmarks of the parsers and models on a synthetic corpus.
+
+Generate the corpus, run the benchmarks and save the results as a baseline:
+
+    $ python -m tests.benchmarks --size 1M run -o baseline.json
+
+then, after a change, run them again and compare with the baseline, which
+exits with status 1 if any benchmark got slower by more than the threshold:
+
+    $ python -m tests.benchmarks --size 1M run --compare baseline.json
+"""
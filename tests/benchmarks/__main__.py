@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Command line interface of the benchmarks, see python -m tests.benchmarks -h.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from . import bench, corpus
+
+
+def default_corpus_dir():
+    return os.path.join(tempfile.gettempdir(), "tatlin-bench")
+
+
+def cmd_generate(args):
+    count = corpus.parse_size(args.size)
+    for kind in args.kinds or corpus.GCODE_FLAVORS + corpus.STL_FORMATS:
+        print(corpus.ensure(args.corpus, kind, count, args.seed))
+    return 0
+
+
+def cmd_run(args):
+    results = bench.run(
+        args.corpus,
+        args.size,
+        args.seed,
+        args.benchmarks,
+        args.repeat,
+        args.warmup,
+        log=print,
+    )
+    if args.output:
+        _write(args.output, results)
+
+    if args.compare:
+        return _compare(_read(args.compare), results, args.threshold)
+    return 0
+
+
+def cmd_compare(args):
+    return _compare(_read(args.baseline), _read(args.results), args.threshold)
+
+
+def _compare(baseline, results, threshold):
+    reasons = bench.comparable(baseline, results)
+    if reasons:
+        print("Results are not comparable with the baseline:", file=sys.stderr)
+        for reason in reasons:
+            print("  " + reason, file=sys.stderr)
+        return 2
+
+    rows = bench.compare(baseline, results, threshold)
+    print(bench.format_comparison(rows))
+    regressions = [row for row in rows if row[4] == "regression"]
+    if regressions:
+        print(
+            "%d of %d benchmarks regressed by more than %.0f%%"
+            % (len(regressions), len(rows), threshold * 100)
+        )
+        return 1
+    return 0
+
+
+def _read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.benchmarks",
+        description="Benchmarks of the gcode and STL parsers and models",
+    )
+    parser.add_argument(
+        "--corpus",
+        default=default_corpus_dir(),
+        help="directory of generated files (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--size",
+        default="100k",
+        help="moves or facets per file, one of %s or a number (default: "
+        "%%(default)s)" % ", ".join(corpus.SIZES),
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="generate corpus files")
+    generate.add_argument(
+        "kinds",
+        nargs="*",
+        help="gcode flavors and STL formats to generate, of %s (default: all)"
+        % ", ".join(corpus.GCODE_FLAVORS + corpus.STL_FORMATS),
+    )
+    generate.set_defaults(func=cmd_generate)
+
+    run = commands.add_parser("run", help="run benchmarks")
+    run.add_argument(
+        "benchmarks",
+        nargs="*",
+        help="prefixes of the benchmarks to run, like gcode.parse or stl. "
+        "(default: all of %s)" % ", ".join(bench.BENCHMARKS),
+    )
+    run.add_argument("-n", "--repeat", type=int, default=5)
+    run.add_argument("--warmup", type=int, default=1)
+    run.add_argument("-o", "--output", help="save the results as JSON")
+    run.add_argument("--compare", metavar="BASELINE", help="compare with a baseline")
+    run.add_argument("--threshold", type=float, default=bench.DEFAULT_THRESHOLD)
+    run.set_defaults(func=cmd_run)
+
+    compare = commands.add_parser("compare", help="compare results with a baseline")
+    compare.add_argument("baseline")
+    compare.add_argument("results")
+    compare.add_argument("--threshold", type=float, default=bench.DEFAULT_THRESHOLD)
+    compare.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    # the draw benchmarks render offscreen, without a display
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+    sys.exit(main())
@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Timed benchmarks of the parsers and models, and comparison of their results
+against a baseline.
+
+Every benchmark has a setup step, which is not timed, and a step that is
+timed a number of times after a warm-up run. The median of the timed runs is
+what gets compared, since it is the least sensitive to an occasional slow run.
+
+The resident memory of the process is reported along with the times: its
+peak during the timed runs, and what is left after them. Both include the
+state of the setup step and anything a run keeps in it, and are only
+available on Linux.
+
+The draw benchmarks render a frame of a model with each renderer into an
+offscreen surface, and also report how many GL calls drawing the model takes.
+They need a GL context through EGL, which Mesa provides without a GPU, and
+are skipped where there is none.
+"""
+
+from collections import OrderedDict
+import gc
+import io
+import os
+import platform
+import statistics
+import time
+
+import numpy
+
+from . import corpus
+
+
+RESULTS_VERSION = 1
+
+# a benchmark has regressed if its median is this much slower than the
+# baseline
+DEFAULT_THRESHOLD = 0.1
+
+# size of the frames of the draw benchmarks
+DRAW_WIDTH = 640
+DRAW_HEIGHT = 480
+
+
+class Unavailable(Exception):
+    """
+    Raised by the setup of a benchmark that cannot run on this machine.
+    """
+
+
+class Benchmark(object):
+    """
+    A named benchmark of one step on the files of some kinds of the corpus.
+    """
+
+    def __init__(self, name, kinds, setup, run, counters=None):
+        self.name = name
+        self.kinds = kinds
+        self.setup = setup  # path -> state for run
+        self.run = run  # state -> number of items processed
+        self.counters = counters  # state -> dict of results, not timed
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _gcode_lex_setup(path):
+    return _read(path).decode("utf-8")
+
+
+def _gcode_lex(text):
+    from tatlin.lib.model.gcode.parser import GcodeLexer
+
+    lexer = GcodeLexer()
+    lexer.load(text)
+    count = 0
+    for _ in lexer.scan():
+        count += 1
+    return count
+
+
+def _gcode_bulk_lex(data):
+    from tatlin.lib.model.gcode.parser import GcodeBulkLexer
+
+    lexer = GcodeBulkLexer()
+    lexer.load(data)
+    count = 0
+    for chunk in lexer.scan_chunks():
+        count += len(chunk)
+    return count
+
+
+def _gcode_parse(data):
+    from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser
+
+    parser = GcodeParser(GcodeBulkLexer())
+    parser.load(data)
+    return parser.parse().num_movements
+
+
+def _gcode_model_setup(path):
+    from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser
+
+    parser = GcodeParser(GcodeBulkLexer())
+    parser.load(_read(path))
+    return parser.parse()
+
+
+def _gcode_model(table):
+    from tatlin.lib.gl.gcodemodel import GcodeModel
+
+    model = GcodeModel()
+    model.load_data(table)
+    return table.num_movements
+
+
+def _gcode_load_setup(path):
+    return {"data": _read(path), "model": None}
+
+
+def _gcode_load(state):
+    from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser
+    from tatlin.lib.gl.gcodemodel import GcodeModel
+
+    # like the loader, keep only the model, until the next run
+    state["model"] = None
+    parser = GcodeParser(GcodeBulkLexer())
+    parser.load(state["data"])
+    model = GcodeModel()
+    model.load_data(parser.parse())
+    state["model"] = model
+    return model.movements.num_movements
+
+
+def _stl_ascii_parse(data):
+    from tatlin.lib.model.stl.parser import StlAsciiParser
+
+    parser = StlAsciiParser()
+    parser.load(io.BytesIO(data))
+    vertices, _ = parser.parse()
+    return len(vertices) // 3
+
+
+def _stl_binary_parse(data):
+    from tatlin.lib.model.stl.parser import StlBinaryParser
+
+    parser = StlBinaryParser()
+    parser.load(io.BytesIO(data))
+    vertices, _ = parser.parse()
+    return len(vertices) // 3
+
+
+def _stl_model_setup(path):
+    from tatlin.lib.model.stl.parser import StlParser
+
+    with open(path, "rb") as f:
+        parser = StlParser(f)
+        parser.load(f)
+        return parser.parse()
+
+
+def _stl_model(data):
+    from tatlin.lib.gl.stlmodel import StlModel
+
+    model = StlModel()
+    model.load_data(data)
+    return model.vertex_count // 3
+
+
+_context = []
+
+
+def _gl_context():
+    """
+    Return the GL context of the draw benchmarks, created once.
+    """
+    from ..headless import ContextUnavailable, HeadlessContext
+
+    if not _context:
+        try:
+            _context.append(HeadlessContext(DRAW_WIDTH, DRAW_HEIGHT))
+        except ContextUnavailable as e:
+            _context.append(e)
+    if isinstance(_context[0], Exception):
+        raise Unavailable("no GL context: %s" % _context[0])
+    return _context[0]
+
+
+def _draw_setup(load, use_shaders):
+    def setup(path):
+        _gl_context()
+        from OpenGL.GL import glBlendFunc, glEnable, glViewport
+        from OpenGL.GL import GL_BLEND, GL_CULL_FACE, GL_DEPTH_TEST
+        from OpenGL.GL import GL_ONE_MINUS_SRC_ALPHA, GL_SRC_ALPHA
+        from tatlin.lib.gl.shaders import shaders_supported
+        from tatlin.lib.gl.views import View3D
+
+        if use_shaders and not shaders_supported():
+            raise Unavailable("shaders are not supported")
+
+        # like Scene.init
+        glViewport(0, 0, DRAW_WIDTH, DRAW_HEIGHT)
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_CULL_FACE)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        model = load(path)
+        model.use_shaders = use_shaders
+        model.init()
+        return {"model": model, "view": View3D()}
+
+    return setup
+
+
+def _draw(state):
+    from OpenGL.GL import glClear, glFinish
+    from OpenGL.GL import GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT
+
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    view = state["view"]
+    view.begin(DRAW_WIDTH, DRAW_HEIGHT)
+    try:
+        view.display_transform()
+        # gcode models are looked at from below their layers, so that all but
+        # the first are drawn in reverse order
+        state["model"].display(eye_height=0)
+    finally:
+        view.end()
+    glFinish()
+    return state["model"].vertex_count
+
+
+def _draw_counters(state):
+    from tatlin.lib.gl import buffers, gcodemodel, shaders, stlmodel
+    from ..headless import GLCallCounter
+
+    with GLCallCounter(buffers, gcodemodel, shaders, stlmodel) as counter:
+        _draw(state)
+    return {"gl_calls": counter.calls}
+
+
+def _gcode_draw_model(path):
+    table = _gcode_model_setup(path)
+    from tatlin.lib.gl.gcodemodel import GcodeModel
+
+    model = GcodeModel()
+    model.load_data(table)
+    return model
+
+
+def _stl_draw_model(path):
+    from tatlin.lib.gl.stlmodel import StlModel
+
+    model = StlModel()
+    model.load_data(_stl_model_setup(path))
+    return model
+
+
+BENCHMARKS = OrderedDict(
+    (benchmark.name, benchmark)
+    for benchmark in [
+        Benchmark("gcode.lex", corpus.GCODE_FLAVORS, _gcode_lex_setup, _gcode_lex),
+        Benchmark("gcode.bulk_lex", corpus.GCODE_FLAVORS, _read, _gcode_bulk_lex),
+        Benchmark("gcode.parse", corpus.GCODE_FLAVORS, _read, _gcode_parse),
+        Benchmark(
+            "gcode.load_data", corpus.GCODE_FLAVORS, _gcode_model_setup, _gcode_model
+        ),
+        Benchmark("gcode.load", corpus.GCODE_FLAVORS, _gcode_load_setup, _gcode_load),
+        Benchmark("stl.ascii_parse", ("ascii",), _read, _stl_ascii_parse),
+        Benchmark("stl.binary_parse", ("binary",), _read, _stl_binary_parse),
+        Benchmark("stl.load_data", corpus.STL_FORMATS, _stl_model_setup, _stl_model),
+    ]
+    + [
+        Benchmark(
+            "%s.draw_%s" % (name, renderer),
+            kinds,
+            _draw_setup(load, renderer == "shader"),
+            _draw,
+            _draw_counters,
+        )
+        for name, kinds, load in (
+            ("gcode", corpus.GCODE_FLAVORS, _gcode_draw_model),
+            ("stl", ("binary",), _stl_draw_model),
+        )
+        for renderer in ("legacy", "shader")
+    ]
+)
+
+
+def select(patterns=None):
+    """
+    Return the benchmarks whose names start with any of the patterns, or all
+    of them.
+    """
+    if not patterns:
+        return list(BENCHMARKS.values())
+    return [
+        benchmark
+        for name, benchmark in BENCHMARKS.items()
+        if any(name.startswith(pattern) for pattern in patterns)
+    ]
+
+
+def time_benchmark(benchmark, path, repeat=5, warmup=1):
+    """
+    Time a benchmark on a file and return its statistics.
+    """
+    state = benchmark.setup(path)
+    for _ in range(warmup):
+        benchmark.run(state)
+
+    gc.collect()
+    reset_peak_rss()
+    times = []
+    items = 0
+    for _ in range(repeat):
+        # collect garbage of earlier runs outside of the timed part
+        gc.collect()
+        t_start = time.perf_counter()
+        items = benchmark.run(state)
+        times.append(time.perf_counter() - t_start)
+    gc.collect()
+    rss, peak = memory_usage()
+    # counted on a run like the timed ones, after them
+    counters = benchmark.counters(state) if benchmark.counters is not None else {}
+
+    median = statistics.median(times)
+    return OrderedDict(
+        [
+            ("file", os.path.basename(path)),
+            ("bytes", os.path.getsize(path)),
+            ("items", items),
+            ("repeat", repeat),
+            ("min", min(times)),
+            ("median", median),
+            ("mean", statistics.mean(times)),
+            ("stdev", statistics.stdev(times) if len(times) > 1 else 0.0),
+            ("items_per_second", items / median if median > 0 else None),
+            ("peak_rss", peak),
+            ("rss", rss),
+        ]
+        + list(counters.items())
+    )
+
+
+def reset_peak_rss():
+    """
+    Start measuring the peak resident memory of the process from now on.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def memory_usage():
+    """
+    Return the resident memory of the process and its peak, in bytes, or
+    None for either if it cannot be told.
+    """
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    usage[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        pass
+    return usage.get("VmRSS"), usage.get("VmHWM")
+
+
+def run(directory, size, seed=0, patterns=None, repeat=5, warmup=1, log=None):
+    """
+    Run the selected benchmarks on corpus files of a size, generating them in
+    directory as needed, and return the results.
+    """
+    count = corpus.parse_size(size)
+    results = OrderedDict()
+    for benchmark in select(patterns):
+        for kind in benchmark.kinds:
+            path = corpus.ensure(directory, kind, count, seed)
+            key = "%s[%s]" % (benchmark.name, kind)
+            try:
+                results[key] = time_benchmark(benchmark, path, repeat, warmup)
+            except Unavailable as e:
+                if log is not None:
+                    log("%-32s skipped, %s" % (key, e))
+                continue
+            if log is not None:
+                log(format_result(key, results[key]))
+
+    return OrderedDict(
+        [
+            ("version", RESULTS_VERSION),
+            ("generator_version", corpus.GENERATOR_VERSION),
+            ("size", count),
+            ("seed", seed),
+            ("machine", machine_info()),
+            ("results", results),
+        ]
+    )
+
+
+def machine_info():
+    return OrderedDict(
+        [
+            ("python", platform.python_version()),
+            ("implementation", platform.python_implementation()),
+            ("numpy", numpy.__version__),
+            ("platform", platform.platform()),
+            ("processor", platform.processor() or platform.machine()),
+            ("cpu_count", os.cpu_count()),
+        ]
+    )
+
+
+def format_result(key, result):
+    rate = result["items_per_second"]
+    peak = result.get("peak_rss")
+    line = "%-32s median %8.4fs  min %8.4fs  %12s items/s  peak %8s MB" % (
+        key,
+        result["median"],
+        result["min"],
+        "%.0f" % rate if rate is not None else "-",
+        "%.1f" % (peak / 2**20) if peak is not None else "-",
+    )
+    if "gl_calls" in result:
+        line += "  %d GL calls" % result["gl_calls"]
+    return line
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results against a baseline and return a list of (key, baseline
+    median, current median, relative change, status) for benchmarks present
+    in both, where status is "regression", "improvement" or "ok".
+    """
+    rows = []
+    for key, result in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+        change = result["median"] / base["median"] - 1 if base["median"] > 0 else 0.0
+        if change > threshold:
+            status = "regression"
+        elif change < -threshold:
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append((key, base["median"], result["median"], change, status))
+    return rows
+
+
+def comparable(baseline, current):
+    """
+    Return a list of reasons why results cannot be compared with a baseline,
+    empty if they can.
+    """
+    reasons = []
+    for field in ("generator_version", "size", "seed"):
+        expected, actual = baseline.get(field), current.get(field)
+        if expected != actual:
+            reasons.append("%s differs: %r != %r" % (field, expected, actual))
+    return reasons
+
+
+def format_comparison(rows):
+    lines = []
+    for key, base, median, change, status in rows:
+        flag = status.upper() if status != "ok" else ""
+        lines.append(
+            "%-32s %8.4fs -> %8.4fs  %+7.1f%%  %s"
+            % (key, base, median, change * 100, flag)
+        )
+    return "\n".join(line.rstrip() for line in lines)
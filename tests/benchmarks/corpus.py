@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2024 Denis Kobozev
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+Deterministic synthetic gcode and STL files for benchmarks.
+
+The same flavor, size and seed always give the same bytes, on any machine:
+numbers come from numpy's legacy RandomState, whose streams never change, and
+are written with fixed precision. Files are written a layer or a batch of
+facets at a time, so even the largest sizes don't have to fit in memory.
+"""
+
+import os
+import struct
+
+import numpy
+
+
+# bump whenever the output for a given flavor, size and seed changes, so that
+# stale files in a corpus directory are not reused
+GENERATOR_VERSION = 1
+
+GCODE_FLAVORS = ("skeinforge", "slic3r", "cnc")
+STL_FORMATS = ("ascii", "binary")
+
+# named sizes, in moves for gcode and in facets for STL
+SIZES = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1M": 1_000_000,
+    "10M": 10_000_000,
+    "50M": 50_000_000,
+}
+
+MOVES_PER_LAYER = 2000
+FACETS_PER_BATCH = 100_000
+
+
+def parse_size(size):
+    """
+    Return the number of moves or facets for a named size like "1M", or for
+    a plain number.
+    """
+    if size in SIZES:
+        return SIZES[size]
+    count = int(size)
+    if count < 1:
+        raise ValueError("size must be positive: %r" % size)
+    return count
+
+
+def corpus_path(directory, kind, count, seed=0):
+    """
+    Return where the file of a flavor or STL format, size and seed is kept in
+    a corpus directory.
+    """
+    ext = "stl" if kind in STL_FORMATS else "gcode"
+    name = "%s-%d-s%d-v%d.%s" % (kind, count, seed, GENERATOR_VERSION, ext)
+    return os.path.join(directory, name)
+
+
+def ensure(directory, kind, count, seed=0):
+    """
+    Return the path of a corpus file, generating it first if it is missing.
+    """
+    path = corpus_path(directory, kind, count, seed)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            if kind in STL_FORMATS:
+                generate_stl(f, kind, count, seed)
+            else:
+                generate_gcode(f, kind, count, seed)
+        os.replace(tmp_path, path)
+    return path
+
+
+# ----------------------------------------------------------------------------
+# GCODE
+# ----------------------------------------------------------------------------
+
+
+def generate_gcode(f, flavor, moves, seed=0):
+    """
+    Write gcode of a flavor with the given number of moves to a binary file.
+    """
+    try:
+        layer_writer = {
+            "skeinforge": _skeinforge_layer,
+            "slic3r": _slic3r_layer,
+            "cnc": _cnc_layer,
+        }[flavor]
+    except KeyError:
+        raise ValueError("unknown gcode flavor: %r" % flavor)
+
+    rng = numpy.random.RandomState(seed)
+    f.write(_GCODE_HEADERS[flavor].encode("ascii"))
+
+    layer_idx = 0
+    e = 0.0
+    written = 0
+    while written < moves:
+        count = min(MOVES_PER_LAYER, moves - written)
+        lines, e = layer_writer(rng, layer_idx, count, e)
+        f.write(("\n".join(lines) + "\n").encode("ascii"))
+        written += count
+        layer_idx += 1
+
+    f.write(_GCODE_FOOTERS[flavor].encode("ascii"))
+
+
+_GCODE_HEADERS = {
+    "skeinforge": (
+        "(<creation> skeinforge </creation>)\n"
+        "(<version> 10.11.05 </version>)\n"
+        "(<layerThickness> 0.36 </layerThickness>)\n"
+        "G21 (set units to mm)\n"
+        "G90 (set positioning to absolute)\n"
+        "M104 S205 T0 (set extruder temperature)\n"
+        "G92 X0 Y0 Z0\n"
+    ),
+    "slic3r": (
+        "; generated by Slic3r 1.3.0 on 2024-01-01 at 00:00:00\n"
+        "; layer_height = 0.2\n"
+        "G90 ; use absolute coordinates\n"
+        "G21 ; set units to millimeters\n"
+        "G28 ; home all axes\n"
+        "M82 ; use absolute distances for extrusion\n"
+        "G92 E0 ; reset extrusion distance\n"
+    ),
+    "cnc": (
+        "(generated for benchmarks)\n"
+        "G21\n"
+        "G90\n"
+        "G17\n"
+        "M3 S12000\n"
+        "G0 Z5\n"
+    ),
+}
+
+_GCODE_FOOTERS = {
+    "skeinforge": "M103\nM104 S0\n(</extrusion>)\n",
+    "slic3r": "M104 S0 ; turn off temperature\nG28 X0 ; home X axis\nM84\n",
+    "cnc": "G0 Z5\nM5\nM30\n",
+}
+
+
+def _path(rng, count, lower=-60.0, upper=60.0):
+    """
+    Return count points of a random walk with short steps, like the paths of
+    a slicer, confined to a square.
+    """
+    steps = rng.normal(0, 2.0, (count, 2))
+    start = rng.uniform(lower / 2, upper / 2, 2)
+    points = start + numpy.cumsum(steps, 0)
+    # fold the walk back into the square
+    span = upper - lower
+    points = numpy.abs((points - lower) % (2 * span) - span)
+    return points + lower
+
+
+def _skeinforge_layer(rng, layer_idx, count, e):
+    z = 0.36 * (layer_idx + 1)
+    points = _path(rng, count)
+    lines = ["(<layer> %.3f )" % z]
+    pos = 0
+    part = 0
+    while pos < count:
+        size = min(int(rng.randint(20, 200)), count - pos)
+        kind = part % 3
+        if kind == 0:
+            lines.append("(<loop> outer )")
+        elif kind == 1:
+            lines.append("(<perimeter> outer )")
+        lines.append("M101")
+        lines.extend(
+            "G1 X%.3f Y%.3f Z%.3f F1920.0" % (x, y, z)
+            for x, y in points[pos : pos + size].tolist()
+        )
+        lines.append("M103")
+        if kind == 0:
+            lines.append("(</loop>)")
+        elif kind == 1:
+            lines.append("(</perimeter>)")
+        pos += size
+        part += 1
+    lines.append("(</layer>)")
+    return lines, e
+
+
+_SLIC3R_KINDS = ("perimeter", "infill")
+
+
+def _slic3r_layer(rng, layer_idx, count, e):
+    z = 0.2 * (layer_idx + 1)
+    points = _path(rng, count)
+    lines = ["G1 Z%.3f F7800.000 ; move to next layer" % z]
+    if layer_idx % 10 == 0:
+        lines.append("G92 E0 ; reset extrusion distance")
+        e = 0.0
+    pos = 0
+    part = 0
+    while pos < count:
+        size = min(int(rng.randint(20, 200)), count - pos)
+        kinds = ("skirt", "perimeter", "infill") if layer_idx == 0 else _SLIC3R_KINDS
+        comment = kinds[part % len(kinds)]
+        x, y = points[pos]
+        lines.append("G1 X%.3f Y%.3f F7800.000 ; move to %s" % (x, y, comment))
+        pos += 1
+        size -= 1
+        amounts = e + numpy.cumsum(rng.uniform(0.01, 0.1, size))
+        lines.extend(
+            "G1 X%.3f Y%.3f E%.5f ; %s" % (x, y, amount, comment)
+            for (x, y), amount in zip(
+                points[pos : pos + size].tolist(), amounts.tolist()
+            )
+        )
+        if size > 0:
+            e = float(amounts[-1])
+        pos += size
+        part += 1
+    return lines, e
+
+
+def _cnc_layer(rng, layer_idx, count, e):
+    # every pass cuts a little deeper, with plunges, arcs and rapid moves
+    depth = -0.5 * (layer_idx + 1)
+    points = _path(rng, count)
+    lines = []
+    pos = 0
+    while pos < count:
+        size = min(int(rng.randint(20, 200)), count - pos)
+        x, y = points[pos]
+        lines.append("G0 Z5.000")
+        lines.append("G0 X%.3f Y%.3f" % (x, y))
+        lines.append("G1 Z%.3f F300" % depth)
+        pos += 1
+        size -= 1
+        arcs = rng.random_sample(size) < 0.1
+        for (x, y), arc in zip(points[pos : pos + size].tolist(), arcs.tolist()):
+            if arc:
+                lines.append("G2 X%.3f Y%.3f I%.3f J%.3f F1200" % (x, y, 1.5, -1.5))
+            else:
+                lines.append("G1 X%.3f Y%.3f F1200" % (x, y))
+        pos += size
+    return lines, e
+
+
+# ----------------------------------------------------------------------------
+# STL
+# ----------------------------------------------------------------------------
+
+
+_FACET_DTYPE = numpy.dtype(
+    [("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attributes", "<u2")]
+)
+
+
+def generate_stl(f, fmt, facets, seed=0):
+    """
+    Write an ASCII or binary STL file with the given number of facets to a
+    binary file.
+    """
+    if fmt not in STL_FORMATS:
+        raise ValueError("unknown STL format: %r" % fmt)
+
+    rng = numpy.random.RandomState(seed)
+    if fmt == "binary":
+        f.write(b"synthetic benchmark model".ljust(80, b" "))
+        f.write(struct.pack("<I", facets))
+    else:
+        f.write(b"solid benchmark\n")
+
+    written = 0
+    while written < facets:
+        count = min(FACETS_PER_BATCH, facets - written)
+        normals, vertices = _facets(rng, count)
+        if fmt == "binary":
+            records = numpy.zeros(count, _FACET_DTYPE)
+            records["normal"] = normals
+            records["vertices"] = vertices
+            f.write(records.tobytes())
+        else:
+            f.write(_ascii_facets(normals, vertices).encode("ascii"))
+        written += count
+
+    if fmt == "ascii":
+        f.write(b"endsolid benchmark\n")
+
+
+def _facets(rng, count):
+    """
+    Return normals and vertices of small triangles scattered over a sphere.
+    """
+    centers = rng.normal(0, 1, (count, 3))
+    centers *= 40 / numpy.linalg.norm(centers, axis=1, keepdims=True)
+    vertices = centers[:, None, :] + rng.uniform(-1, 1, (count, 3, 3))
+    normals = numpy.cross(
+        vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0]
+    )
+    lengths = numpy.linalg.norm(normals, axis=1, keepdims=True)
+    normals /= numpy.where(lengths > 0, lengths, 1)
+    return normals.astype("<f4"), vertices.astype("<f4")
+
+
+def _ascii_facets(normals, vertices):
+    template = (
+        "  facet normal %e %e %e\n"
+        "    outer loop\n"
+        "      vertex %e %e %e\n"
+        "      vertex %e %e %e\n"
+        "      vertex %e %e %e\n"
+        "    endloop\n"
+        "  endfacet\n"
+    )
+    values = numpy.concatenate((normals, vertices.reshape(-1, 9)), 1).tolist()
+    return "".join(template % tuple(row) for row in values)
@@ -0,0 +1,105 @@
+import io
+import os
+import struct
+import tempfile
+import unittest
+
+from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser
+from tatlin.lib.model.stl.parser import StlAsciiParser, StlBinaryParser
+
+from . import bench, corpus
+
+
+class CorpusTest(unittest.TestCase):
+    def gcode(self, flavor, moves, seed=0):
+        f = io.BytesIO()
+        corpus.generate_gcode(f, flavor, moves, seed)
+        return f.getvalue()
+
+    def stl(self, fmt, facets, seed=0):
+        f = io.BytesIO()
+        corpus.generate_stl(f, fmt, facets, seed)
+        return f.getvalue()
+
+    def test_deterministic(self):
+        for flavor in corpus.GCODE_FLAVORS:
+            self.assertEqual(self.gcode(flavor, 3000), self.gcode(flavor, 3000))
+            self.assertNotEqual(self.gcode(flavor, 3000), self.gcode(flavor, 3000, 1))
+        for fmt in corpus.STL_FORMATS:
+            self.assertEqual(self.stl(fmt, 500), self.stl(fmt, 500))
+
+    def test_gcode(self):
+        for flavor in corpus.GCODE_FLAVORS:
+            parser = GcodeParser(GcodeBulkLexer())
+            parser.load(self.gcode(flavor, 5000))
+            table = parser.parse()
+
+            # every move is a movement, except for repeated points; arcs are
+            # cut into more movements
+            self.assertGreater(table.num_movements, 4000, flavor)
+            if flavor != "cnc":
+                # layers only change with extrusion
+                self.assertGreater(table.num_layers, 1, flavor)
+
+    def test_stl(self):
+        data = self.stl("binary", 250)
+        self.assertEqual(len(data), 84 + 50 * 250)
+        self.assertEqual(struct.unpack("<I", data[80:84])[0], 250)
+
+        for fmt, parser in (("ascii", StlAsciiParser()), ("binary", StlBinaryParser())):
+            parser.load(io.BytesIO(self.stl(fmt, 250)))
+            vertices, normals = parser.parse()
+            self.assertEqual(len(vertices), 750)
+            self.assertEqual(len(normals), 750)
+
+    def test_sizes(self):
+        self.assertEqual(corpus.parse_size("10k"), 10000)
+        self.assertEqual(corpus.parse_size("50M"), 50000000)
+        self.assertEqual(corpus.parse_size("1234"), 1234)
+        with self.assertRaises(ValueError):
+            corpus.parse_size("0")
+        with self.assertRaises(ValueError):
+            corpus.generate_gcode(io.BytesIO(), "marlin", 10)
+
+
+class BenchTest(unittest.TestCase):
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = bench.run(tmpdir, "2000", patterns=["gcode.parse"], repeat=2)
+            files = sorted(os.listdir(tmpdir))
+
+        self.assertEqual(len(files), len(corpus.GCODE_FLAVORS))
+        self.assertEqual(
+            list(results["results"]),
+            ["gcode.parse[%s]" % flavor for flavor in corpus.GCODE_FLAVORS],
+        )
+        for result in results["results"].values():
+            self.assertEqual(result["repeat"], 2)
+            self.assertLessEqual(result["min"], result["median"])
+            self.assertGreater(result["items_per_second"], 0)
+            if result["peak_rss"] is not None:
+                self.assertGreaterEqual(result["peak_rss"], result["rss"])
+
+    def test_compare(self):
+        def results(medians, size=1000):
+            return {
+                "generator_version": corpus.GENERATOR_VERSION,
+                "size": size,
+                "seed": 0,
+                "results": {key: {"median": m} for key, m in medians.items()},
+            }
+
+        baseline = results({"a": 1.0, "b": 1.0, "c": 1.0})
+        current = results({"a": 1.5, "b": 0.5, "c": 1.05, "d": 1.0})
+        rows = bench.compare(baseline, current, threshold=0.1)
+
+        self.assertEqual(
+            [(key, status) for key, _, _, _, status in rows],
+            [("a", "regression"), ("b", "improvement"), ("c", "ok")],
+        )
+        self.assertEqual(bench.comparable(baseline, current), [])
+        self.assertEqual(len(bench.comparable(baseline, results({}, size=10))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+GL contexts for tests and benchmarks that draw without a display.
+
+Contexts are created through EGL on Mesa's surfaceless platform, which
+renders with llvmpipe when there is no GPU, so PyOpenGL has to use EGL:
+PYOPENGL_PLATFORM=egl must be set before OpenGL is first imported.
+"""
+
+import ctypes
+import functools
+import os
+
+import numpy
+
+
+# EGL_PLATFORM_SURFACELESS_MESA
+SURFACELESS_PLATFORM = 0x31DD
+
+
+class ContextUnavailable(Exception):
+    pass
+
+
+class HeadlessContext(object):
+    """
+    A GL context drawing into an offscreen surface of a size.
+    """
+
+    def __init__(self, width=64, height=64):
+        if os.environ.get("PYOPENGL_PLATFORM") != "egl":
+            raise ContextUnavailable("PYOPENGL_PLATFORM is not egl")
+        try:
+            from OpenGL import EGL
+            from OpenGL.EGL.EXT.platform_base import eglGetPlatformDisplayEXT
+        except ImportError as e:
+            raise ContextUnavailable(str(e))
+
+        self.width = width
+        self.height = height
+        try:
+            display = eglGetPlatformDisplayEXT(
+                SURFACELESS_PLATFORM, EGL.EGL_DEFAULT_DISPLAY, None
+            )
+            major, minor = EGL.EGLint(), EGL.EGLint()
+            if not EGL.eglInitialize(display, ctypes.byref(major), ctypes.byref(minor)):
+                raise ContextUnavailable("could not initialize EGL")
+            EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+
+            attributes = _attributes(
+                EGL.EGL_RENDERABLE_TYPE,
+                EGL.EGL_OPENGL_BIT,
+                EGL.EGL_SURFACE_TYPE,
+                EGL.EGL_PBUFFER_BIT,
+                EGL.EGL_RED_SIZE,
+                8,
+                EGL.EGL_GREEN_SIZE,
+                8,
+                EGL.EGL_BLUE_SIZE,
+                8,
+                EGL.EGL_ALPHA_SIZE,
+                8,
+                EGL.EGL_DEPTH_SIZE,
+                24,
+            )
+            config = EGL.EGLConfig()
+            count = EGL.EGLint()
+            EGL.eglChooseConfig(
+                display, attributes, ctypes.byref(config), 1, ctypes.byref(count)
+            )
+            if count.value < 1:
+                raise ContextUnavailable("no EGL config for OpenGL")
+
+            self.context = EGL.eglCreateContext(
+                display, config, EGL.EGL_NO_CONTEXT, None
+            )
+            size = _attributes(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height)
+            self.surface = EGL.eglCreatePbufferSurface(display, config, size)
+            if not EGL.eglMakeCurrent(
+                display, self.surface, self.surface, self.context
+            ):
+                raise ContextUnavailable("could not make the EGL context current")
+        except EGL.EGLError as e:
+            raise ContextUnavailable(str(e))
+
+        self.egl = EGL
+        self.display = display
+
+    def read_pixels(self):
+        """
+        Return the pixels drawn, as an array of height rows of RGBA bytes.
+        """
+        from OpenGL.GL import glFinish, glReadPixels, GL_RGBA, GL_UNSIGNED_BYTE
+
+        glFinish()
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE)
+        pixels = numpy.frombuffer(data, numpy.uint8)
+        return pixels.reshape(self.height, self.width, 4)
+
+    def destroy(self):
+        EGL = self.egl
+        EGL.eglMakeCurrent(
+            self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT
+        )
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglDestroyContext(self.display, self.context)
+
+
+def _attributes(*values):
+    from OpenGL import EGL
+
+    values = values + (EGL.EGL_NONE,)
+    return (EGL.EGLint * len(values))(*values)
+
+
+class GLCallCounter(object):
+    """
+    Count the GL calls made from modules while it is active.
+
+    The gl* functions imported into the modules are wrapped, and binding or
+    unbinding a vertex buffer object counts as one call as well.
+    """
+
+    def __init__(self, *modules):
+        self.modules = modules
+        self.calls = 0
+        self.counts = {}
+        self._saved = []
+
+    def __enter__(self):
+        from OpenGL.arrays.vbo import VBO
+
+        for module in self.modules:
+            for name, value in list(vars(module).items()):
+                if name.startswith("gl") and callable(value):
+                    self._saved.append((module, name, value))
+                    setattr(module, name, self._wrap(name, value))
+        for name in ("bind", "unbind"):
+            method = getattr(VBO, name)
+            self._saved.append((VBO, name, method))
+            setattr(VBO, name, self._wrap("VBO." + name, method))
+        return self
+
+    def __exit__(self, *exc_info):
+        for owner, name, value in reversed(self._saved):
+            setattr(owner, name, value)
+        self._saved = []
+        return False
+
+    def _wrap(self, name, func):
+        @functools.wraps(func)
+        def counted(*args, **kwargs):
+            self.calls += 1
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+
+        return counted
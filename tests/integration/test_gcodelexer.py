@@ -1,5 +1,9 @@
+import math
+import mmap
+import os
+import threading
 import unittest
-from tatlin.lib.model.gcode.parser import GcodeLexer
+from tatlin.lib.model.gcode.parser import GcodeLexer, GcodeBulkLexer
 
 
 class GcodeLexerTest(unittest.TestCase):
@@ -75,5 +79,125 @@ class GcodeLexerTest(unittest.TestCase):
         self.assertEqual(len(result), 3)
 
 
+class GcodeBulkLexerTest(unittest.TestCase):
+    def setUp(self):
+        self.lexer = GcodeBulkLexer()
+
+    def compare_scan(self, gcode):
+        line_lexer = GcodeLexer()
+        line_lexer.load(gcode)
+        self.lexer.load(gcode)
+        self.assertEqual(list(self.lexer.scan()), list(line_lexer.scan()))
+
+    def test_same_as_line_lexer(self):
+        gcode = "\n".join(
+            [
+                "G1 X1 Y2\r",
+                "G1 X X5 ; first occurrence wins",
+                "",
+                "   ",
+                ";only a comment",
+                "(paren) ; semicolon",
+                "G162 Z F500 (home Z axis maximum)",
+                "M117 Printing stuff now...",
+                "G1 X1.2.3 Y4",
+                "G1 Xinf",
+                "G92 A0",
+                "G1 x10 X2 X3",
+                "\tG1\tX-.5\rG1 Y+1e2",
+                "G1 X\u00e91",
+                "G1 X1 ; \u00fc",
+                "G1Z3 E5",
+                " T0",
+            ]
+        )
+        self.compare_scan(gcode)
+
+    def test_files(self):
+        for fname in [
+            "tests/fixtures/gcode/slic3r.gcode",
+            "tests/fixtures/gcode/top.gcode",
+        ]:
+            with open(fname, "r") as f:
+                self.compare_scan(f.read())
+
+    def test_small_blocks(self):
+        with open("tests/fixtures/gcode/top.gcode", "r") as f:
+            gcode = f.read()
+        self.lexer.block_size = 100
+        self.compare_scan(gcode)
+
+    def test_file_input(self):
+        fname = "tests/fixtures/gcode/slic3r.gcode"
+        with open(fname, "rb") as f:
+            self.lexer.load(f)
+            result = list(self.lexer.scan_chunks())
+        self.assertEqual(self.lexer.bytes_read, self.lexer.size)
+        self.assertEqual(sum(len(chunk) for chunk in result), 3800)
+
+    def test_mmap_input(self):
+        fname = "tests/fixtures/gcode/top.gcode"
+        with open(fname, "r") as f:
+            expected = f.read()
+
+        with open(fname, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.lexer.block_size = 4096
+        self.lexer.load(buf)
+        chunks = list(self.lexer.scan_chunks())
+        self.assertTrue(all(isinstance(chunk.data, memoryview) for chunk in chunks))
+
+        line_lexer = GcodeLexer()
+        line_lexer.load(expected)
+        self.assertEqual(list(self.lexer.scan()), list(line_lexer.scan()))
+
+    def test_pipe_input(self):
+        with open("tests/fixtures/gcode/slic3r.gcode", "rb") as f:
+            data = f.read()
+
+        read_fd, write_fd = os.pipe()
+
+        def write():
+            with open(write_fd, "wb") as pipe:
+                pipe.write(data)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        with open(read_fd, "rb") as pipe:
+            self.lexer.load(pipe)
+            result = list(self.lexer.scan_chunks())
+        writer.join()
+
+        self.assertEqual(self.lexer.bytes_read, len(data))
+        self.assertEqual(sum(len(chunk) for chunk in result), 3800)
+
+    def test_columns(self):
+        self.lexer.load(
+            "G1 X81.430 Y77.020 E1.08502 ; skirt\nM101\n; end\nG2 X1 I-2.5 J0.5\n"
+        )
+        (chunk,) = list(self.lexer.scan_chunks())
+
+        self.assertEqual(len(chunk), 4)
+        self.assertEqual(
+            [chunk.command(row) for row in range(4)], ["G1", "M101", "", "G2"]
+        )
+        self.assertEqual(chunk.comments(), ["; skirt", "", "; end", ""])
+
+        x, y, z, e, f, i, j, k, r = chunk.values[0]
+        self.assertEqual((x, y, e), (81.43, 77.02, 1.08502))
+        self.assertTrue(math.isnan(z) and math.isnan(f))
+        self.assertEqual(chunk.values[3, [0, 5, 6]].tolist(), [1, -2.5, 0.5])
+        self.assertEqual(
+            chunk.present.tolist(),
+            [
+                [True, True, False, True, False] + [False] * 4,
+                [False] * 9,
+                [False] * 9,
+                [True] + [False] * 4 + [True, True, False, False],
+            ],
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+from tatlin.lib.model.gcode import parallel
+from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser
+
+
+def _values(layers):
+    return [
+        [(tuple(m.v), float(m.delta_e), float(m.feedrate), m.flags) for m in layer]
+        for layer in layers
+    ]
+
+
+@unittest.skipUnless(parallel.shared_memory, "requires shared memory")
+class GcodeParallelParserTest(unittest.TestCase):
+    def parse_serial(self, fname):
+        parser = GcodeParser(GcodeBulkLexer())
+        with open(fname, "rb") as f:
+            parser.load(f)
+            return parser.parse()
+
+    def parse_parallel(self, fname, pieces):
+        parser = parallel.GcodeParallelParser(fname, workers=2, pieces=pieces)
+        parser.checkpoint_every = 16
+        return parser.parse()
+
+    def assertSameAsSerial(self, fname, pieces=4):
+        expected = self.parse_serial(fname)
+        result = self.parse_parallel(fname, pieces)
+        self.assertEqual(_values(result), _values(expected))
+
+    def test_files(self):
+        for fname in ("top.gcode", "slic3r.gcode"):
+            self.assertSameAsSerial(os.path.join("tests/fixtures/gcode", fname))
+
+    def test_state_across_pieces(self):
+        # modal commands are spread over the file, so pieces start in all
+        # kinds of states
+        lines = ["G21", "G92 X10 Y-5"]
+        for layer in range(40):
+            lines.append("G1 Z%.2f F1200" % (0.3 * (layer + 1)))
+            if layer % 10 == 3:
+                lines.append("G91")
+                lines.extend("G1 X0.5 Y0.25 E0.1" for _ in range(20))
+                lines.append("G90")
+            if layer % 10 == 7:
+                lines.append("G92 X0 Y0 E0")
+            if layer == 25:
+                lines.append("G20 ; inches from here on")
+            lines.extend(
+                "G1 X%d Y%d E%.1f ; perimeter" % (i % 17, i % 13, i * 0.5)
+                for i in range(30)
+            )
+            lines.append("M103")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, "state.gcode")
+            with open(fname, "w") as f:
+                f.write("\n".join(lines))
+
+            for pieces in (2, 7, 25):
+                self.assertSameAsSerial(fname, pieces)
+
+    def test_arcs_across_pieces(self):
+        lines = ["G21", "G92 X10 Y-5"]
+        for layer in range(20):
+            lines.append("G1 Z%.2f F1200" % (0.3 * (layer + 1)))
+            if layer == 8:
+                lines.append("G19")
+            if layer == 9:
+                lines.append("G17")
+            lines.extend(
+                "G%d X%d Y%d I%d J3 E%d" % (2 + i % 2, i % 17, i % 13, 5 - i % 9, i)
+                for i in range(30)
+            )
+            lines.append("G2 X0 Y0 R-20")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, "arcs.gcode")
+            with open(fname, "w") as f:
+                f.write("\n".join(lines))
+
+            for pieces in (2, 7, 25):
+                self.assertSameAsSerial(fname, pieces)
+
+    def test_split(self):
+        data = b"G1 X1\nG1 X2\r\nG1 X3\rG1 X4\n"
+        parser = parallel.GcodeParallelParser(None, pieces=5)
+        pieces = parser.split(data)
+
+        self.assertEqual(pieces[0][0], 0)
+        self.assertEqual(pieces[-1][1], len(data))
+        for (_, end), (start, _) in zip(pieces, pieces[1:]):
+            self.assertEqual(end, start)
+            self.assertIn(data[start - 1 : start], (b"\n", b"\r"))
+
+    def test_flavor_across_pieces(self):
+        # only the first piece holds the header the flavor is detected from
+        lines = [";FLAVOR:Marlin", ";Generated with Cura_SteamEngine 5.0.0", "G21"]
+        types = ("WALL-OUTER", "WALL-INNER", "SKIN", "SKIRT", "FILL")
+        for layer in range(20):
+            lines.append("G1 Z%.2f F1200" % (0.3 * (layer + 1)))
+            for part, kind in enumerate(types):
+                lines.append(";TYPE:%s" % kind)
+                lines.extend(
+                    "G1 X%d Y%d E%d" % (i % 17, i % 13, layer * 100 + part * 20 + i)
+                    for i in range(20)
+                )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, "cura.gcode")
+            with open(fname, "w") as f:
+                f.write("\n".join(lines))
+
+            self.assertEqual(len(set(self.parse_serial(fname).flags.tolist())), 4)
+            for pieces in (2, 7):
+                self.assertSameAsSerial(fname, pieces)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,11 @@
 import array
+import collections
+import tracemalloc
 import unittest
 from tatlin.lib.model.gcode.parser import (
     GcodeParser,
     GcodeLexer,
+    GcodeBulkLexer,
     GcodeParserError,
     Movement,
     ArgsDict,
@@ -29,18 +32,18 @@ class GcodeParserTest(unittest.TestCase):
         self.assertEqual(args["Y"], y)
         self.assertIsNone(args["Z"])
 
-    def test_command_coords(self):
+    def test_command_dst(self):
         xyz = (7.27, 2.67, 0.91)
         x, y, z = xyz
 
         gcode = "G1"
         args = ArgsDict({"X": x, "Y": y, "Z": z})
-        coords = self.parser.command_coords(gcode, args, args)
-        self.assertEqual(coords, xyz)
+        self.parser.update_registers(args)
+        self.assertTrue(self.parser.command_dst(gcode, args))
+        self.assertEqual(tuple(self.parser.dst), xyz)
 
         gcode = ""
-        coords = self.parser.command_coords(gcode, args, args)
-        self.assertIsNone(coords)
+        self.assertFalse(self.parser.command_dst(gcode, args))
 
     def test_set_flags(self):
         commands = (
@@ -73,14 +76,94 @@ class GcodeParserTest(unittest.TestCase):
 
         self.assertEqual(len(result), 1)
         self.assertEqual(len(result[0]), 3)
+        self.assertEqual(result.layer_stops.tolist(), [0, 3])
+        self.assertEqual(result.z.tolist(), [0, 0, 0])
+        self.assertEqual(result.feedrate.tolist(), [12000, 12000, 1482])
 
-    def test_update_args(self):
-        oldargs = ArgsDict({"X": 0, "Y": 0, "Z": 0, "F": 12000, "E": 0})
-        args = self.parser.update_args(oldargs, {"X": 1, "Y": 1})
+    def test_parse_bulk(self):
+        fname = "tests/fixtures/gcode/top.gcode"
+        with open(fname, "r") as f:
+            self.parser.load(f)
+            expected = self.parser.parse()
 
-        self.assertEqual(args["X"], 1)
-        self.assertEqual(args["Y"], 1)
-        self.assertEqual(args["F"], 12000)
+        parser = GcodeParser(GcodeBulkLexer())
+        with open(fname, "rb") as f:
+            parser.load(f)
+            result = parser.parse()
+
+        self.assertEqual(list(map(repr, result)), list(map(repr, expected)))
+
+    def test_parse_continued(self):
+        self.parser.load("G1 X1 Y1 Z0.2 E1\nG1 X2 Y2 E2\n")
+        self.parser.parse()
+
+        # a movement on the same layer, then one on a new layer
+        self.parser.load("G1 X3 Y3 E3\nG1 X4 Y4 Z0.4 E4\n")
+        result = self.parser.parse_continued()
+        self.assertEqual(result.layer_stops.tolist(), [0, 1, 2])
+
+        # the first movement starts a new layer
+        self.parser.load("G1 X5 Y5 Z0.6 E5\n")
+        result = self.parser.parse_continued()
+        self.assertEqual(result.layer_stops.tolist(), [0, 0, 1])
+
+        self.parser.load("; nothing\n")
+        self.assertEqual(self.parser.parse_continued().num_layers, 0)
+
+    def test_state(self):
+        gcode = """
+        G92 X10
+        G91
+        G1 X1 Y2 Z0.3 E1 F1200
+        """
+        self.parser.load(gcode)
+        self.parser.parse()
+        state = self.parser.get_state()
+
+        parser = GcodeParser()
+        parser.set_state(state)
+        self.assertEqual(parser.get_state(), state)
+        self.assertTrue(parser.relative)
+        self.assertEqual(parser.offsets[0], -10)
+
+    def test_update_registers(self):
+        self.parser.registers[4] = 12000
+        self.parser.update_registers({"X": 1, "Y": 1})
+
+        self.assertEqual(self.parser.registers, [1, 1, 0, 0, 12000])
+
+        self.parser.relative = True
+        self.parser.update_registers({"X": 1, "E": 0.5})
+        self.assertEqual(self.parser.registers, [2, 1, 0, 0.5, 12000])
+
+    def test_allocations(self):
+        # moves, extruder commands and comments of all kinds
+        lines = []
+        for idx in range(200):
+            lines.append("G1 X%d Y%d E%d ; perimeter" % (idx % 7, idx % 5, idx))
+            lines.append("G1 X%d Y%d F1200 (move)" % (idx % 3, idx % 11))
+            lines.append("M101" if idx % 2 else "M103")
+            lines.append("(<loop> outer )" if idx % 2 else "(</loop>)")
+        self.lexer.load("\n".join(lines))
+        commands = list(self.lexer.scan())
+        # the flavor remembers the action of every comment it sees
+        for command in commands:
+            self.parser.parse_command(command)
+
+        # consume the commands without any allocations of the loop itself
+        drain = collections.deque(maxlen=0)
+        moves = map(self.parser.parse_command, commands * 10)
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            drain.extend(moves)
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # not even a single block is allocated and freed again
+        self.assertEqual(after, before)
+        self.assertEqual(peak, before)
 
     def test_parse_new_layer_from_z(self):
         gcode = """
@@ -0,0 +1,38 @@
+import unittest
+
+import numpy
+
+from tatlin.lib.gl.buffers import GrowableBuffer
+
+
+class GrowableBufferTest(unittest.TestCase):
+    def test_append(self):
+        data = numpy.arange(6, dtype="f").reshape(-1, 3)
+        buf = GrowableBuffer(data)
+        self.assertIs(buf.array, data)
+
+        buf.append([[6, 7, 8]])
+        self.assertEqual(len(buf), 3)
+        self.assertEqual(buf.data.tolist(), [[0, 1, 2], [3, 4, 5], [6, 7, 8]])
+        self.assertGreaterEqual(len(buf.array), 3)
+
+        capacity = len(buf.array)
+        buf.write(1, [[9, 9, 9]])
+        self.assertEqual(buf.data.tolist(), [[0, 1, 2], [9, 9, 9]])
+        self.assertEqual(len(buf.array), capacity)
+
+    def test_reserve(self):
+        buf = GrowableBuffer(numpy.arange(6, dtype="f").reshape(-1, 3))
+        buf.reserve(10)
+        self.assertEqual(len(buf.array), 10)
+        self.assertEqual(buf.data.tolist(), [[0, 1, 2], [3, 4, 5]])
+
+        array = buf.array
+        buf.append(numpy.ones((8, 3)))
+        buf.reserve(4)
+        self.assertIs(buf.array, array)
+        self.assertEqual(len(buf), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,18 @@
 import array
+import gc
+import itertools
+import math
+import weakref
 
+import numpy
+
+from tatlin.lib import vector
 from tatlin.lib.gl.scene import Scene
-from tatlin.lib.gl.gcodemodel import GcodeModel
+from tatlin.lib.gl.gcodemodel import GcodeModel, LazyGcodeModel
 
-from tatlin.lib.model.gcode.parser import Movement
+from tatlin.lib.model.gcode.index import GcodeLayerReader, build_index
+from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser, Movement
+from tatlin.lib.model.gcode.table import MovementTable
 from tests.guitestcase import GUITestCase
 
 
@@ -11,27 +20,384 @@ class GcodeModelTest(GUITestCase):
     def setUp(self):
         super().setUp()
 
+        self.layers = [
+            [
+                Movement(array.array("f", [0, 0.5, 0]), 0, 0, 0),
+                Movement(array.array("f", [0.5, -0.5, 0]), 0, 0, 0),
+                Movement(
+                    array.array("f", [-0.5, -0.5, 0]),
+                    0,
+                    0,
+                    Movement.FLAG_EXTRUDER_ON | Movement.FLAG_PERIMETER,
+                ),
+            ],
+            [
+                Movement(array.array("f", [0, 0.5, 1.0]), 0, 0, 0),
+                Movement(array.array("f", [0.5, -0.5, 1.0]), 0, 0, 0),
+                Movement(array.array("f", [-0.5, -0.5, 1.0]), 0, 0, 0),
+            ],
+        ]
         self.model = GcodeModel()
-        self.model.load_data(
+        self.model.load_data(self.layers)
+
+    def test_append_data(self):
+        table = MovementTable.from_layers(self.layers)
+        model = GcodeModel()
+        model.load_data(
+            MovementTable(
+                table.vertices[:2], table.delta_e[:2], table.feedrate[:2],
+                table.flags[:2], [0, 2],
+            )
+        )
+        model.append_data(
+            MovementTable(
+                table.vertices[2:], table.delta_e[2:], table.feedrate[2:],
+                table.flags[2:], [0, 1, 4],
+            )
+        )
+
+        self.assertEqual(model.max_layers, self.model.max_layers)
+        self.assertEqual(model.layer_stops, self.model.layer_stops)
+        self.assertEqual(model.vertices.tolist(), self.model.vertices.tolist())
+        self.assertEqual(model.colors.tolist(), self.model.colors.tolist())
+        for idx in range(model.max_layers):
+            for array, expected in zip(
+                model.layer_arrows(idx), self.model.layer_arrows(idx)
+            ):
+                self.assertEqual(array.tolist(), expected.tolist())
+
+    def test_lazy(self):
+        with open("tests/fixtures/gcode/top.gcode", "rb") as f:
+            data = f.read()
+        parser = GcodeParser(GcodeBulkLexer())
+        parser.load(data)
+        model = GcodeModel()
+        model.load_data(parser.parse())
+
+        lazy = LazyGcodeModel()
+        lazy.window = 3
+        lazy.load_index(GcodeLayerReader(data, build_index(data)))
+        self.assertEqual(lazy.max_layers, model.max_layers)
+        self.assertEqual(len(lazy.layer_stops), len(model.layer_stops))
+
+        for number in (model.max_layers, 1, 10):
+            lazy.num_layers_to_draw = number
+            stops, lazy_stops = model.layer_stops, lazy.layer_stops
+            self.assertEqual(
+                lazy.vertices[lazy_stops[number - 1] : lazy_stops[number]].tolist(),
+                model.vertices[stops[number - 1] : stops[number]].tolist(),
+            )
+
+        # layers below the window are not drawn
+        self.assertEqual(lazy.layer_stops[:8], [0] * 8)
+
+    def test_arrows(self):
+        # arrows point along movements, and sit at their ends
+        for points in ([[0, 0, 0], [1, 0, 0]], [[1, 1, 2], [1, 3, 2]]):
+            points = numpy.array(points, "f")
+            arrows = self.model._arrows(points[:1], points[1:])
+            delta = points[1] - points[0]
+            angle = math.degrees(math.atan2(delta[1], -delta[0]))
+            expected = vector.rotate(GcodeModel.arrow, angle, 0, 0, 1) + points[1]
+            self.assertTrue(numpy.allclose(arrows, expected, atol=1e-6))
+
+        # arrows and markers of a layer; the first layer is entered at its
+        # first movement
+        points = MovementTable.from_layers(self.layers).vertices
+        arrows, kinds, markers = self.model.layer_arrows(1)
+        lines = self.model._arrows(points[2:5], points[3:6])
+        self.assertEqual(arrows.tolist(), lines.tolist())
+        self.assertEqual(kinds.tolist(), [GcodeModel.TRAVEL] * 9)
+        self.assertEqual(
+            markers[:3].tolist(), (GcodeModel.layer_entry_marker + points[2]).tolist()
+        )
+        self.assertEqual(
+            markers[3:].tolist(), (GcodeModel.layer_exit_marker + points[5]).tolist()
+        )
+        _, _, markers = self.model.layer_arrows(0)
+        self.assertEqual(
+            markers[:3].tolist(), (GcodeModel.layer_entry_marker + points[1]).tolist()
+        )
+
+    def test_released(self):
+        # only the attributes of movements are kept, not the table
+        table = MovementTable.from_layers(self.layers)
+        table_ref = weakref.ref(table)
+        model = GcodeModel()
+        model.load_data(table)
+        del table
+        gc.collect()
+        self.assertIsNone(table_ref())
+
+        movements = model.movements
+        self.assertEqual(movements.num_movements, 5)
+        self.assertEqual(movements.z.tolist(), [0.0, 0.0, 1.0, 1.0, 1.0])
+        flags = Movement.FLAG_EXTRUDER_ON | Movement.FLAG_PERIMETER
+        self.assertEqual(movements.flags.tolist()[1], flags)
+        self.assertEqual(
+            model.movement_kinds(movements, 0).tolist(),
+            [GcodeModel.EXTRUSION, GcodeModel.PERIMETER] + [GcodeModel.TRAVEL] * 3,
+        )
+        self.assertEqual(model.layer_heights, self.model.layer_heights)
+
+    def test_arrow_cache(self):
+        model = GcodeModel()
+        model.arrow_cache_size = 4
+        model.arrow_prefetch = 1
+        points = [[x, 0, z] for z in range(10) for x in range(3)]
+        model.load_data(
+            MovementTable(points, [0] * 30, [0] * 30, [0] * 30, list(range(0, 31, 3)))
+        )
+        # the top layer and the one below it are ready
+        self.assertEqual(list(model.arrow_buffers), [8, 9])
+
+        model.num_layers_to_draw = 5
+        self.assertEqual(list(model.arrow_buffers), [9, 3, 5, 4])
+        self.assertEqual(len(model.stale_buffers), 3)
+
+        buffers = model.arrow_buffers[5]
+        model.num_layers_to_draw = 6
+        self.assertIs(model.arrow_buffers[5], buffers)
+        self.assertEqual(list(model.arrow_buffers), [3, 4, 6, 5])
+
+    def test_strips(self):
+        # a vertex for every movement, and another where a layer or a run of
+        # movements of one kind starts
+        model = self.model
+        points = MovementTable.from_layers(self.layers).vertices
+        self.assertEqual(model.layer_stops, [0, 4, 8])
+        self.assertEqual(
+            model.vertices.tolist(), points[[0, 1, 1, 2, 2, 3, 4, 5]].tolist()
+        )
+        self.assertEqual(
+            model.kinds.tolist(),
+            [GcodeModel.EXTRUSION] * 2
+            + [GcodeModel.PERIMETER] * 2
+            + [GcodeModel.TRAVEL] * 4,
+        )
+
+        # appended movements continue the last run if they are of its kind
+        points = [[1.0, 1.0, 1.0], [1.0, 1.0, 2.0]]
+        model.append_data(MovementTable(points, [0, 0], [0, 0], [0, 0], [0, 1, 2]))
+        self.assertEqual(model.layer_stops, [0, 4, 9, 11])
+        self.assertEqual(model.vertices[8:].tolist(), [points[0]] * 2 + [points[1]])
+        self.assertEqual(model.kinds[8:].tolist(), [GcodeModel.TRAVEL] * 3)
+
+    def test_details(self):
+        # two turns of a circle in a layer each, with a run of perimeter in
+        # the middle of every layer
+        count = 4001
+        angles = numpy.linspace(0, 4 * math.pi, count)
+        points = numpy.c_[
+            20 * numpy.cos(angles), 20 * numpy.sin(angles), (angles > 2 * math.pi)
+        ]
+        flags = numpy.full(count, Movement.FLAG_EXTRUDER_ON)
+        flags[900:1100] |= Movement.FLAG_PERIMETER
+        flags[2900:3100] |= Movement.FLAG_PERIMETER
+        model = GcodeModel()
+        model.load_data(
+            MovementTable(points, [1] * count, [0] * count, flags, [0, 2001, count])
+        )
+
+        def runs(kinds):
+            return [int(kind) for kind, _ in itertools.groupby(kinds)]
+
+        self.assertEqual(model.detail_level(), 0)
+        self.assertEqual(model.detail_level(10000.0), 0)
+        # levels are only made as they are needed
+        self.assertEqual(len(model.details), 1)
+
+        self.assertEqual(model.detail_level(0.01), model.detail_levels)
+        errors = [0.0]
+        counts = [model.vertex_count]
+        for detail in model.details:
+            errors.append(detail.detail_error)
+            counts.append(detail.vertex_count)
+            # layers start and end at the same points, and keep their runs
+            for stop, model_stop in zip(detail.layer_stops, model.layer_stops):
+                self.assertEqual(
+                    detail.vertex_buffer.data[stop - 1 : stop + 1].tolist(),
+                    model.vertices[model_stop - 1 : model_stop + 1].tolist(),
+                )
+            self.assertEqual(runs(detail.vertex_kind_buffer.data), runs(model.kinds))
+
+            # no vertex dropped is farther than the error from the lines
+            vertices = detail.vertex_buffer.data.astype(numpy.float64)
+            for point in model.vertices[::7]:
+                starts, ends = vertices[:-1], vertices[1:]
+                lines = ends - starts
+                lengths = numpy.maximum((lines**2).sum(axis=1), 1e-12)
+                t = numpy.clip(((point - starts) * lines).sum(axis=1) / lengths, 0, 1)
+                closest = starts + t[:, numpy.newaxis] * lines
+                distance = numpy.linalg.norm(point - closest, axis=1).min()
+                self.assertLessEqual(distance, detail.detail_error + 1e-5)
+        self.assertEqual(errors, sorted(errors))
+        for count, coarser in zip(counts, counts[1:]):
+            self.assertLess(coarser, count / 2)
+
+        # the finest level whose error is small enough on the screen
+        scale = model.detail_pixels / errors[2]
+        self.assertEqual(model.detail_level(scale), 2)
+        self.assertEqual(model.detail_level(scale * 1.01), 1)
+        # coarser levels while the view moves, and no more vertices than
+        # allowed if a level has few enough
+        self.assertEqual(model.detail_level(scale, interacting=True), 4)
+        self.assertEqual(model.detail_level(100000.0, interacting=True), 0)
+        model.interaction_vertices = counts[3] - 1
+        self.assertEqual(model.detail_level(100000.0, interacting=True), 4)
+
+        # levels are made again when the model grows
+        details = list(model.details)
+        model.append_data(
+            MovementTable([[0, 0, 2], [1, 0, 2]], [1, 1], [0, 0], [0, 0], [0, 2])
+        )
+        self.assertEqual(model.details, [])
+        self.assertEqual(model.stale_buffers[-len(details) :], details)
+
+        # levels stop once they would keep most vertices; the travels of the
+        # second layer are all that can go
+        model = GcodeModel()
+        model.load_data(self.layers)
+        self.assertEqual(model.detail_level(0.01, interacting=True), 1)
+        self.assertEqual(model.details[0].vertex_count, 6)
+        self.assertIsNone(model.details[1])
+
+    def test_chunks(self):
+        # a zigzag in every layer, across a square from -1 to 1
+        count = 1200
+        x = numpy.tile(numpy.linspace(-1, 1, 40), 30)
+        y = numpy.repeat(numpy.linspace(-1, 1, 30), 40)
+        z = numpy.repeat([0.0, 0.1, 0.2], 400)
+        flags = numpy.full(count, Movement.FLAG_EXTRUDER_ON)
+        flags[500:520] = 0
+        table = MovementTable(
+            numpy.c_[x, y, z], [1] * count, [0] * count, flags, [0, 400, 900, count]
+        )
+        model = GcodeModel()
+        model.chunk_size = 100
+        model.load_data(table)
+        chunks = model.chunks
+        vertices = model.vertices
+
+        # chunks of a layer follow each other, and their boxes enclose their
+        # vertices and the first vertex of the next one
+        for layer in range(model.max_layers):
+            start, end = model.layer_stops[layer : layer + 2]
+            rows = numpy.flatnonzero(chunks.layers == layer)
+            self.assertEqual(
+                chunks.starts[rows].tolist(), list(range(start, end - 1, 100))
+            )
+            self.assertEqual(chunks.ends[rows[-1]], end)
+        for start, end, lower, upper in zip(
+            chunks.starts, chunks.ends, chunks.lower, chunks.upper
+        ):
+            self.assertEqual(lower.tolist(), vertices[start:end].min(axis=0).tolist())
+            self.assertEqual(upper.tolist(), vertices[start:end].max(axis=0).tolist())
+
+        box = model.bounding_box
+        self.assertEqual(box.lower_corner.tolist(), vertices.min(axis=0).tolist())
+        self.assertEqual(box.upper_corner.tolist(), vertices.max(axis=0).tolist())
+        box = model.layers_bounding_box(1, 2)
+        layer = vertices[model.layer_stops[1] : model.layer_stops[2]]
+        self.assertEqual(box.lower_corner.tolist(), layer.min(axis=0).tolist())
+        self.assertEqual(box.upper_corner.tolist(), layer.max(axis=0).tolist())
+        self.assertIsNone(model.layers_bounding_box(3, 3))
+
+        # appended layers only split the last layer again
+        appended = GcodeModel()
+        appended.chunk_size = 100
+        for rows, stops, load in (
+            (slice(0, 700), [0, 400, 700], appended.load_data),
+            (slice(700, count), [0, 200, 500], appended.append_data),
+        ):
+            load(
+                MovementTable(
+                    table.vertices[rows],
+                    table.delta_e[rows],
+                    table.feedrate[rows],
+                    table.flags[rows],
+                    stops,
+                )
+            )
+        for name in ("layers", "starts", "ends", "lower", "upper"):
+            self.assertEqual(
+                getattr(appended.chunks, name).tolist(),
+                getattr(chunks, name).tolist(),
+            )
+
+        # with an identity view, vertices are in clip coordinates; only the
+        # chunks of the bottom of the square are left when it is moved up,
+        # and the ranges drawn skip the others
+        visible = chunks.visible(numpy.identity(4), (0.0, 1.5, 0.0))
+        self.assertTrue(visible[chunks.upper[:, 1] < -0.5].all())
+        self.assertFalse(visible[chunks.lower[:, 1] > -0.5].any())
+        visible = chunks.visible(numpy.identity(4), scale=(1.0, 1.0, 0.0))
+        self.assertTrue(visible.all())
+
+        visible = numpy.ones(len(chunks), bool)
+        visible[[1, 2, 6]] = False
+        firsts, counts = chunks.cull(
+            numpy.array([400, 0], numpy.int32),
+            numpy.array([model.vertex_count - 400, 400], numpy.int32),
+            visible,
+        )
+        # chunks 0 to 3 are those of the first layer
+        self.assertEqual(firsts.tolist(), [400, chunks.starts[7], 0, 300])
+        self.assertEqual(
+            counts.tolist(),
             [
-                [
-                    Movement(array.array("f", [0, 0.5, 0]), 0, 0, 0),
-                    Movement(array.array("f", [0.5, -0.5, 0]), 0, 0, 0),
-                    Movement(
-                        array.array("f", [-0.5, -0.5, 0]),
-                        0,
-                        0,
-                        Movement.FLAG_EXTRUDER_ON | Movement.FLAG_PERIMETER,
-                    ),
-                ],
-                [
-                    Movement(array.array("f", [0, 0.5, 1.0]), 0, 0, 0),
-                    Movement(array.array("f", [0.5, -0.5, 1.0]), 0, 0, 0),
-                    Movement(array.array("f", [-0.5, -0.5, 1.0]), 0, 0, 0),
-                ],
-            ]
+                chunks.ends[5] - 400,
+                model.vertex_count - chunks.starts[7],
+                chunks.ends[0],
+                100,
+            ],
         )
 
+    def test_palette(self):
+        model = self.model
+        perimeter = model.palette[model.PERIMETER]
+        self.assertEqual(model.colors[2].tolist(), perimeter.tolist())
+
+        # hiding travels only changes the palette
+        kinds = model.vertex_kind_buffer.array
+        model.palette_changed = False
+        model.travels_enabled = False
+        model.update_colors()
+        self.assertTrue(model.palette_changed)
+        self.assertIs(model.vertex_kind_buffer.array, kinds)
+        self.assertEqual(model.colors[4:, 3].tolist(), [0.0] * 4)
+
+        model.set_color(model.EXTRUSION, (0.0, 0.0, 1.0, 1.0))
+        self.assertEqual(model.colors[0].tolist(), [0.0, 0.0, 1.0, 1.0])
+
+    def test_movement_ranges(self):
+        model = self.model
+        model.layer_stops = [0, 4, 4, 10, 16]  # the second layer is empty
+        model.layer_heights = [0.0, 1.0, 2.0, 3.0]
+        model.num_layers_to_draw = 4
+
+        def ranges(**kwargs):
+            firsts, counts = model._movement_ranges(**kwargs)
+            self.assertEqual(firsts.dtype, numpy.int32)
+            self.assertEqual(counts.dtype, numpy.int32)
+            return list(zip(firsts.tolist(), counts.tolist()))
+
+        # layers below the eye are drawn at once, those above it top to bottom
+        self.assertEqual(ranges(eye_height=10.0), [(0, 16)])
+        self.assertEqual(ranges(eye_height=2.5), [(0, 10), (10, 6)])
+        self.assertEqual(ranges(eye_height=-1.0), [(0, 4), (10, 6), (4, 6)])
+        self.assertEqual(ranges(mode_ortho=True, elevation=10.0), [(0, 16)])
+        self.assertEqual(
+            ranges(mode_ortho=True, elevation=-10.0), [(10, 6), (4, 6), (0, 4)]
+        )
+        self.assertEqual(ranges(mode_2d=True), [(10, 6)])
+
+        model.num_layers_to_draw = 2
+        self.assertEqual(ranges(mode_2d=True), [])
+        self.assertEqual(ranges(eye_height=-1.0), [(0, 4)])
+        model.num_layers_to_draw = 0
+        self.assertEqual(ranges(eye_height=-1.0), [])
+
     def test_display(self):
         scene = Scene(self.frame)
         scene.add_model(self.model)
@@ -68,6 +68,28 @@ class SceneTest(GUITestCase):
 
         self.scene.view_model_center()
 
+    def test_fit_visible_layers(self):
+        model = Mock(offset_x=0.0, offset_y=0.0, offset_z=0.0, num_layers_to_draw=3)
+        model.layers_bounding_box.return_value = BoundingBox((4, 6, 2), (2, 2, 0))
+        self.scene.model = model
+
+        # nothing is fitted before the scene is first drawn
+        self.scene.fit_visible_layers()
+        model.layers_bounding_box.assert_not_called()
+
+        self.scene.viewport = (400, 300)
+        self.scene.fit_visible_layers()
+        model.layers_bounding_box.assert_called_with(0, 3)
+
+        # only the top layer drawn is shown in 2d mode
+        self.scene.mode_2d = True
+        self.scene.fit_visible_layers()
+        model.layers_bounding_box.assert_called_with(2, 3)
+        view = self.scene.current_view
+        self.assertAlmostEqual(view.zoom_factor, 300 * 0.9 / 24**0.5)
+        self.assertAlmostEqual(view.x, -3 * view.zoom_factor)
+        self.assertAlmostEqual(view.y, -4 * view.zoom_factor)
+
     def test_change_num_layers(self):
         self.scene.model = Mock()
         self.scene.change_num_layers(1)
@@ -0,0 +1,292 @@
+import os
+import unittest
+
+import numpy
+
+from tatlin.lib.model.gcode.parser import Movement
+from tatlin.lib.model.gcode.table import MovementTable
+from tatlin.lib.gl import buffers, gcodemodel, shaders, stlmodel
+from tatlin.lib.gl.gcodemodel import GcodeModel
+from tatlin.lib.gl.stlmodel import StlModel
+from tatlin.lib.model.stl.parser import StlParser
+
+from tests.headless import ContextUnavailable, GLCallCounter, HeadlessContext
+
+from OpenGL.GL import *  # type:ignore
+from OpenGL.GLU import *  # type:ignore
+
+
+SIZE = 64
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "..", "..", "fixtures")
+
+
+class ShaderRendererTest(unittest.TestCase):
+    """
+    Draw models with both renderers into an offscreen surface, which takes
+    PYOPENGL_PLATFORM=egl and Mesa, and compare the pixels.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        try:
+            cls.context = HeadlessContext(SIZE, SIZE)
+        except ContextUnavailable as e:
+            raise unittest.SkipTest("no headless GL context: %s" % e)
+        if not shaders.shaders_supported():
+            cls.context.destroy()
+            raise unittest.SkipTest("shaders are not supported")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.context.destroy()
+
+    def setUp(self):
+        # like Scene.init
+        glViewport(0, 0, SIZE, SIZE)
+        glEnable(GL_COLOR_MATERIAL)
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_LEQUAL)
+        glEnable(GL_CULL_FACE)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        self.models = []
+
+    def tearDown(self):
+        # delete buffers while the context is current
+        for model in self.models:
+            if isinstance(model, GcodeModel):
+                model.vertex_buffer.delete()
+                model.vertex_kind_buffer.delete()
+                for detail in model.details:
+                    if detail is not None:
+                        detail.delete()
+            else:
+                model.vertex_buffer.delete()
+                model.normal_buffer.delete()
+        self.models = []
+
+    def gcode_model(self, layers=3):
+        # a square in every layer, one pixel smaller than the one below, with
+        # a travel to it and sides of every kind
+        points = [[8.5, 8.5, 0.0]]
+        flags = [0]
+        for layer in range(layers):
+            low, high, z = 8.5 + layer, 55.5 - layer, layer + 0.5
+            points += [[low, low, z], [high, low, z], [high, high, z]]
+            points += [[low, high, z], [low, low, z]]
+            flags += [0, Movement.FLAG_EXTRUDER_ON, Movement.FLAG_PERIMETER]
+            flags += [Movement.FLAG_PERIMETER | Movement.FLAG_PERIMETER_OUTER]
+            flags += [Movement.FLAG_LOOP]
+        flags = [flag | Movement.FLAG_EXTRUDER_ON if flag else 0 for flag in flags]
+        count = len(points)
+        stops = [0] + list(range(6, count + 1, 5))
+        model = GcodeModel()
+        model.load_data(MovementTable(points, [0] * count, [0] * count, flags, stops))
+        model.init()
+        self.models.append(model)
+        return model
+
+    def stl_model(self):
+        path = os.path.join(FIXTURES, "stl", "cube-bin.stl")
+        with open(path, "rb") as f:
+            parser = StlParser(f)
+            parser.load(f)
+            data = parser.parse()
+        model = StlModel()
+        model.load_data(data)
+        model.init()
+        self.models.append(model)
+        return model
+
+    def draw(self, model, use_shaders, perspective=False, **kwargs):
+        """
+        Draw a frame of a model and return its pixels and the GL calls it
+        took.
+        """
+        model.use_shaders = use_shaders
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glMatrixMode(GL_PROJECTION)
+        glLoadIdentity()
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        if perspective:
+            glMatrixMode(GL_PROJECTION)
+            gluPerspective(45.0, 1.0, 1.0, 1000.0)
+            glMatrixMode(GL_MODELVIEW)
+            glTranslate(0.0, 0.0, -50.0)
+            glRotate(-60.0, 1.0, 0.0, 0.0)
+            glRotate(30.0, 0.0, 0.0, 1.0)
+        else:
+            glOrtho(0, SIZE, 0, SIZE, -100, 100)
+
+        with GLCallCounter(buffers, gcodemodel, shaders, stlmodel) as counter:
+            model.display(**kwargs)
+        self.assertEqual(glGetError(), GL_NO_ERROR)
+        return self.context.read_pixels().astype(int), counter.calls
+
+    def assertSameFrames(self, model, **kwargs):
+        # the first frames upload the buffers
+        self.draw(model, False, **kwargs)
+        legacy, legacy_calls = self.draw(model, False, **kwargs)
+        self.draw(model, True, **kwargs)
+        shaded, shaded_calls = self.draw(model, True, **kwargs)
+
+        self.assertGreater(numpy.count_nonzero(legacy.any(axis=2)), 0)
+        self.assertLessEqual(numpy.abs(legacy - shaded).max(), 1)
+        self.assertLess(shaded_calls, legacy_calls)
+        return legacy, shaded
+
+    def test_renderer(self):
+        self.assertGreaterEqual(shaders.glsl_version(), shaders.GLSL_VERSION)
+        self.assertTrue(shaders.use_shaders("auto"))
+        self.assertTrue(shaders.use_shaders("shader"))
+        self.assertFalse(shaders.use_shaders("legacy"))
+        with self.assertLogs(level="WARNING"):
+            self.assertTrue(shaders.use_shaders("vulkan"))
+
+    def test_gcode(self):
+        model = self.gcode_model()
+        for kwargs in (
+            {"eye_height": 10.0},
+            {"eye_height": -10.0},
+            {"mode_ortho": True, "elevation": 10.0},
+            {"mode_ortho": True, "elevation": -10.0},
+            {"mode_2d": True, "mode_ortho": True},
+        ):
+            self.assertSameFrames(model, **kwargs)
+
+        # the offset and the palette are uniforms
+        model.offset_x = 2.0
+        model.travels_enabled = False
+        model.update_colors()
+        model.set_color(model.PERIMETER, (0.0, 0.0, 1.0, 1.0))
+        legacy, shaded = self.assertSameFrames(model, eye_height=10.0)
+        self.assertEqual(shaded[30, 55 + 2].tolist(), [0, 0, 255, 255])
+
+        model.arrows_enabled = False
+        self.assertSameFrames(model, eye_height=10.0)
+
+    def test_gcode_draw_calls(self):
+        # layers seen from below are drawn in reverse order, in as many calls
+        # as the rest
+        for use_shaders in (False, True):
+            calls = set()
+            for layers in (2, 12):
+                model = self.gcode_model(layers)
+                for kwargs in (
+                    {"eye_height": 100.0},
+                    {"eye_height": -10.0},
+                    {"mode_ortho": True, "elevation": -10.0},
+                ):
+                    self.draw(model, use_shaders, **kwargs)
+                    calls.add(self.draw(model, use_shaders, **kwargs)[1])
+            self.assertEqual(len(calls), 1)
+
+    def test_gcode_append(self):
+        model = self.gcode_model(layers=1)
+        before, _ = self.draw(model, True)
+        model.append_data(
+            MovementTable(
+                [[20.5, 20.5, 0.5], [40.5, 20.5, 0.5]],
+                [0, 1],
+                [0, 0],
+                [0, Movement.FLAG_EXTRUDER_ON],
+                [0, 2],
+            )
+        )
+        after, _ = self.draw(model, True)
+        self.assertFalse(before[20, 30].any())
+        self.assertEqual(after[20, 30].tolist(), [153, 0, 0, 92])
+
+    def test_gcode_details(self):
+        # a fine circle, drawn at a coarser level of detail when its vertices
+        # are too close together on the screen
+        count = 2001
+        angles = numpy.linspace(0, 2 * numpy.pi, count)
+        points = numpy.c_[
+            32 + 20 * numpy.cos(angles), 32 + 20 * numpy.sin(angles), [0.5] * count
+        ]
+        flags = [Movement.FLAG_EXTRUDER_ON] * count
+        model = GcodeModel()
+        model.load_data(
+            MovementTable(points, [1] * count, [0] * count, flags, [0, count])
+        )
+        model.init()
+        self.models.append(model)
+
+        # blending makes overlapping lines of the full model darker, and lines
+        # that are off by a fraction of a pixel can light the pixel next to
+        # it, but there are as many pixels drawn, and all near the circle
+        full = self.draw(model, True)[0].any(axis=2)
+        near = full.copy()
+        for axis in (0, 1):
+            for shift in (-1, 1):
+                near |= numpy.roll(full, shift, axis)
+        for use_shaders in (False, True):
+            coarse = self.draw(model, use_shaders, pixel_scale=1.0)[0].any(axis=2)
+            self.assertLessEqual(abs(int(coarse.sum()) - int(full.sum())), 4)
+            self.assertFalse((coarse & ~near).any())
+        self.assertGreater(model.detail_level(1.0), 1)
+        self.assertLess(
+            model._detail(model.detail_level(1.0)).vertex_count, count / 10
+        )
+
+    def test_gcode_culling(self):
+        # a zigzag reaching far out of view, drawn with and without chunks
+        # out of view left out
+        x = numpy.tile([-200.5, 200.5], 100)
+        y = numpy.arange(200) - 60.5
+        points = numpy.c_[x, y, [0.5] * 200]
+        flags = [Movement.FLAG_EXTRUDER_ON] * 200
+        table = MovementTable(points, [1] * 200, [0] * 200, flags, [0, 120, 200])
+        frames = []
+        for chunk_size in (4, 1 << 30):
+            model = GcodeModel()
+            model.chunk_size = chunk_size
+            model.load_data(table)
+            model.init()
+            self.models.append(model)
+            for use_shaders in (False, True):
+                self.draw(model, use_shaders)
+                frames.append(self.draw(model, use_shaders)[0])
+                self.assertEqual(frames[-1].tolist(), frames[0].tolist())
+        self.assertGreater(numpy.count_nonzero(frames[0].any(axis=2)), 0)
+
+        # only the lines crossing the view are drawn
+        model = self.models[0]
+        _, view = shaders.view_matrices()
+        firsts, counts = model._visible_ranges(model, view)
+        self.assertLess(counts.sum(), model.vertex_count / 2)
+
+    def test_stl(self):
+        model = self.stl_model()
+        legacy, shaded = self.assertSameFrames(model, perspective=True)
+        # lit facets of different shades
+        self.assertGreater(len(numpy.unique(shaded[..., 0])), 2)
+
+        # a changed model replaces its vertex array
+        vertex_array = model.vertex_array
+        model.scale(2.0)
+        model.init()
+        self.assertEqual(model.stale_arrays, [vertex_array])
+        self.assertSameFrames(model, perspective=True)
+        self.assertEqual(model.stale_arrays, [])
+        self.assertIsNone(vertex_array.vao)
+
+    def test_fallback(self):
+        with self.assertRaises(shaders.ShaderError):
+            shaders.Program("#version 330 core\nvoid main() { oops; }", "")
+
+        model = self.gcode_model()
+        legacy, _ = self.draw(model, False)
+        model.fragment_shader = "#version 330 core\nout vec4 color;"
+        with self.assertLogs(level="WARNING"):
+            fallback, _ = self.draw(model, True)
+        self.assertFalse(model.use_shaders)
+        self.assertIsNone(model.program)
+        self.assertEqual(fallback.tolist(), legacy.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
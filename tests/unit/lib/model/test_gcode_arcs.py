@@ -0,0 +1,147 @@
+import unittest
+
+import numpy
+
+from tatlin.lib.model.gcode.arcs import arc_kind, tessellate
+from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser
+from tatlin.lib.model.gcode.table import MovementTable
+
+
+class ArcTest(unittest.TestCase):
+    def parse(self, gcode, tolerance=None):
+        parser = GcodeParser(GcodeBulkLexer())
+        if tolerance is not None:
+            parser.arc_tolerance = tolerance
+        parser.load(gcode.encode())
+        return parser.parse()
+
+    def assertOnCircle(self, points, center, radius, places=3):
+        distances = numpy.hypot(points[:, 0] - center[0], points[:, 1] - center[1])
+        for distance in distances:
+            self.assertAlmostEqual(distance, radius, places)
+
+    def assertChordsWithin(self, points, center, radius, tolerance):
+        # the middle of every chord is at most tolerance inside the circle
+        middles = (points[1:] + points[:-1]) / 2
+        distances = numpy.hypot(middles[:, 0] - center[0], middles[:, 1] - center[1])
+        self.assertLessEqual(float((radius - distances).max()), tolerance + 1e-5)
+
+    def test_quarter_circle(self):
+        result = self.parse("G1 X10 Y0 Z0.2\nG3 X0 Y10 I-10 J0 E1\n")
+        points = result.vertices[1:]
+
+        self.assertGreater(len(points), 8)
+        self.assertOnCircle(points, (0, 0), 10)
+        self.assertChordsWithin(result.vertices, (0, 0), 10, 0.01)
+        self.assertEqual(points[-1].tolist(), [0, 10, numpy.float32(0.2)])
+        # counterclockwise, through the first quadrant
+        self.assertTrue((points[:, 0] >= -1e-4).all() and (points[:, 1] >= 0).all())
+        self.assertAlmostEqual(float(result.delta_e[1:].sum()), 1, 5)
+
+    def test_clockwise(self):
+        # the same endpoints the long way round
+        result = self.parse("G1 X10 Y0\nG2 X0 Y10 I-10 J0\n")
+        points = result.vertices[1:]
+
+        self.assertOnCircle(points, (0, 0), 10)
+        self.assertLess(float(points[:, 0].min()), -9.9)
+        self.assertLess(float(points[:, 1].min()), -9.9)
+
+    def test_radius(self):
+        result = self.parse("G1 X0 Y0\nG3 X1 Y1 R1\n")
+        self.assertOnCircle(result.vertices, (0, 1), 1)
+
+        # a negative radius takes the longer arc
+        result = self.parse("G1 X0 Y0\nG3 X1 Y1 R-1\n")
+        self.assertOnCircle(result.vertices, (1, 0), 1)
+        self.assertGreater(float(result.vertices[:, 0].max()), 1.9)
+
+    def test_full_circle(self):
+        counts = []
+        for radius in (1, 10, 100):
+            result = self.parse("G1 X%d Y0\nG2 X%d Y0 I%d\n" % (radius, radius, -radius))
+            points = result.vertices[1:]
+            self.assertOnCircle(points, (0, 0), radius, 2)
+            self.assertEqual(points[-1].tolist(), [radius, 0, 0])
+            counts.append(len(points))
+
+        # more segments for larger circles
+        self.assertLess(counts[0], counts[1])
+        self.assertLess(counts[1], counts[2])
+
+    def test_tolerance(self):
+        coarse = self.parse("G1 X10 Y0\nG3 X-10 Y0 I-10\n", tolerance=0.1)
+        fine = self.parse("G1 X10 Y0\nG3 X-10 Y0 I-10\n", tolerance=0.001)
+
+        self.assertLess(coarse.num_movements, fine.num_movements)
+        self.assertChordsWithin(coarse.vertices, (0, 0), 10, 0.1)
+        self.assertChordsWithin(fine.vertices, (0, 0), 10, 0.001)
+
+    def test_planes(self):
+        # a helix around Y in the ZX plane
+        result = self.parse("G1 X10 Y0 Z0\nG18\nG2 X10 Y5 Z0 I-10 K0\n")
+        points = result.vertices[1:]
+
+        distances = numpy.hypot(points[:, 0], points[:, 2])
+        self.assertTrue(numpy.allclose(distances, 10, atol=1e-3))
+        self.assertTrue((numpy.diff(points[:, 1]) > 0).all())
+        middle = points[len(points) // 2]
+        self.assertAlmostEqual(float(middle[1]), 2.5, 1)
+
+        result = self.parse("G19\nG1 X0 Y10 Z0\nG3 Y0 Z10 J-10\n")
+        distances = numpy.hypot(result.vertices[:, 1], result.vertices[:, 2])
+        self.assertTrue(numpy.allclose(distances, 10, atol=1e-3))
+
+    def test_inches(self):
+        result = self.parse("G20\nG1 X1 Y0\nG3 X0 Y1 I-1\n")
+        self.assertOnCircle(result.vertices, (0, 0), 25.4)
+
+    def test_layers(self):
+        result = self.parse(
+            "G1 X10 Y0 Z0.2 E1\nG3 X0 Y10 I-10 E2\n"
+            "G1 X10 Y0 Z0.4 E3\nG3 X0 Y10 I-10 E4\nG1 X0 Y0 E5\n"
+        )
+        lines = self.parse(
+            "G1 X10 Y0 Z0.2 E1\nG1 X0 Y10 E2\n"
+            "G1 X10 Y0 Z0.4 E3\nG1 X0 Y10 E4\nG1 X0 Y0 E5\n"
+        )
+        stops = result.layer_stops.tolist()
+
+        # the same layers as with straight lines, which end where the arcs do
+        self.assertEqual(len(stops), len(lines.layer_stops))
+        self.assertEqual(stops[-1], result.num_movements)
+        for stop, line_stop in zip(stops[1:], lines.layer_stops[1:]):
+            self.assertEqual(
+                result.vertices[stop - 1].tolist(), lines.vertices[line_stop - 1].tolist()
+            )
+
+    def test_tessellate(self):
+        table = MovementTable(
+            [[0, 10, 0], [-10, 0, 0], [0, 0, 0]], [1, 3, 0], [60] * 3, [0, 1, 2], [0, 3]
+        )
+        arcs = [[1, 0, -10, arc_kind(0, False)]]
+        result = tessellate(table, arcs, start_point=None, tolerance=0.05)
+
+        self.assertEqual(result.vertices[0].tolist(), [0, 10, 0])
+        self.assertEqual(result.vertices[-1].tolist(), [0, 0, 0])
+        self.assertEqual(result.vertices[-2].tolist(), [-10, 0, 0])
+        self.assertOnCircle(result.vertices[:-1], (0, 0), 10)
+        self.assertEqual(result.layer_stops.tolist(), [0, result.num_movements])
+        self.assertEqual(set(result.flags[1:-1].tolist()), {1})
+        self.assertAlmostEqual(float(result.delta_e.sum()), 4, 5)
+
+        # no arcs, nothing to do
+        self.assertIs(tessellate(table, []), table)
+
+    def test_start_point(self):
+        table = MovementTable([[0, 10, 0]], [0], [60], [0], [0, 1])
+        result = tessellate(table, [[0, -10, 0, arc_kind(0, True)]], (10, 0, 0))
+
+        self.assertOnCircle(result.vertices, (0, 0), 10)
+        # clockwise from (10, 0) to (0, 10) goes through (0, -10)
+        self.assertLess(float(result.vertices[:, 1].min()), -9.9)
+        self.assertLess(float(result.vertices[0, 1]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy
+
+from tatlin.lib.model.gcode import cache
+from tatlin.lib.model.gcode.cache import GcodeCache
+
+
+class GcodeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = GcodeCache(os.path.join(self.tmpdir, "cache"))
+        self.path = self.write("model.gcode", b"G1 X1 Y1\n")
+        self.arrays = {
+            "vertices": numpy.arange(12, dtype="f").reshape(-1, 3),
+            "flags": numpy.array([1, 2, 3], numpy.uint8),
+            "layer_stops": numpy.array([0, 3], numpy.int64),
+            "empty": numpy.empty((0, 4), "f"),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def assertArrays(self, arrays):
+        self.assertEqual(sorted(arrays), sorted(self.arrays))
+        for name, array in self.arrays.items():
+            self.assertEqual(arrays[name].dtype, array.dtype)
+            self.assertEqual(arrays[name].shape, array.shape)
+            self.assertEqual(arrays[name].tolist(), array.tolist())
+
+    def test_store(self):
+        self.assertIsNone(self.cache.load(self.path))
+        self.cache.store(self.path, self.arrays)
+
+        arrays = self.cache.load(self.path)
+        self.assertArrays(arrays)
+        self.assertFalse(arrays["vertices"].flags.writeable)
+
+    def test_modified(self):
+        self.cache.store(self.path, self.arrays)
+        os.utime(self.path, ns=(0, 0))
+        self.assertIsNone(self.cache.load(self.path))
+
+    def test_variant(self):
+        # models loaded with other settings are other entries
+        self.cache.store(self.path, self.arrays)
+        self.cache.variant = "coalesce=0.01"
+        self.assertIsNone(self.cache.load(self.path))
+        self.cache.store(self.path, self.arrays)
+        self.assertArrays(self.cache.load(self.path))
+
+    def test_version(self):
+        self.cache.store(self.path, self.arrays)
+        entry = self.cache.entry_path(self.cache.key(self.path))
+        with open(entry, "r+b") as f:
+            f.seek(8)
+            f.write(struct.pack("<I", cache.FORMAT_VERSION + 1))
+
+        self.assertIsNone(self.cache.load(self.path))
+        self.assertFalse(os.path.exists(entry))
+
+    def test_hash(self):
+        self.cache.use_hash = True
+        self.cache.store(self.path, self.arrays)
+
+        # a copy somewhere else has the same contents
+        self.assertArrays(self.cache.load(self.write("copy.gcode", b"G1 X1 Y1\n")))
+        self.assertIsNone(self.cache.load(self.write("other.gcode", b"G1 X2 Y1\n")))
+
+    def test_evict(self):
+        paths = [self.write("%d.gcode" % i, b"G1 X%d\n" % i) for i in range(4)]
+        for idx, path in enumerate(paths):
+            self.cache.store(path, self.arrays)
+            entry = self.cache.entry_path(self.cache.key(path))
+            os.utime(entry, (idx, idx))
+        entry_size = os.path.getsize(entry)
+
+        # using the first entry makes the second the least recently used
+        self.cache.load(paths[0])
+        self.cache.max_size = entry_size * 3
+        self.cache.evict()
+
+        self.assertIsNotNone(self.cache.load(paths[0]))
+        self.assertIsNone(self.cache.load(paths[1]))
+        self.assertIsNotNone(self.cache.load(paths[2]))
+        self.assertIsNotNone(self.cache.load(paths[3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import math
+import unittest
+
+import numpy
+
+from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser, Movement
+from tatlin.lib.model.gcode.coalesce import coalesce
+from tatlin.lib.model.gcode.table import MovementTable
+
+
+class CoalesceTest(unittest.TestCase):
+    def spiral(self, count=1001, stops=None):
+        # a vase mode turn around a circle, slowly rising, then a straight line
+        angles = numpy.linspace(0, 2 * math.pi, count)
+        turn = numpy.c_[
+            20 * numpy.cos(angles), 20 * numpy.sin(angles), numpy.linspace(0, 0.2, count)
+        ]
+        line = numpy.c_[numpy.linspace(20, 100, 101), numpy.zeros(101), [0.2] * 101]
+        vertices = numpy.vstack([turn, line])
+        num = len(vertices)
+        flags = [Movement.FLAG_EXTRUDER_ON] * num
+        stops = stops or [0, num]
+        return MovementTable(vertices, [0.01] * num, [1800] * num, flags, stops)
+
+    def assertWithin(self, table, coalesced, tolerance):
+        # every point dropped is within tolerance of the movement replacing it
+        points = table.vertices.astype(numpy.float64)
+        kept = coalesced.vertices.astype(numpy.float64)
+        end = 0
+        for idx, point in enumerate(points):
+            if end < len(kept) and (point == kept[end]).all():
+                end += 1
+                continue
+            start, stop = kept[end - 1], kept[end]
+            line = stop - start
+            t = numpy.clip(numpy.dot(point - start, line) / numpy.dot(line, line), 0, 1)
+            distance = numpy.linalg.norm(point - start - t * line)
+            self.assertLessEqual(distance, tolerance + 1e-6, "point %d" % idx)
+        self.assertEqual(end, len(kept))
+
+    def test_spiral(self):
+        table = self.spiral()
+        for tolerance in (0.001, 0.01, 0.1):
+            coalesced = coalesce(table, tolerance)
+            self.assertLess(coalesced.num_movements, table.num_movements / 2)
+            self.assertWithin(table, coalesced, tolerance)
+            self.assertEqual(coalesced.vertices[0].tolist(), table.vertices[0].tolist())
+            self.assertEqual(
+                coalesced.vertices[-1].tolist(), table.vertices[-1].tolist()
+            )
+            self.assertAlmostEqual(
+                float(coalesced.delta_e.sum()), float(table.delta_e.sum()), 4
+            )
+
+        # the straight line becomes a single movement
+        coalesced = coalesce(table, 0.01)
+        self.assertEqual(int((coalesced.vertices[:, 0] > 20).sum()), 1)
+
+    def test_layers(self):
+        table = self.spiral(stops=[0, 500, 1102])
+        coalesced = coalesce(table, 0.01)
+        self.assertEqual(coalesced.num_layers, 2)
+        # the last movement of the first layer is kept
+        first = coalesced.layer_stops[1]
+        self.assertEqual(
+            coalesced.vertices[first - 1].tolist(), table.vertices[499].tolist()
+        )
+        self.assertWithin(table, coalesced, 0.01)
+
+    def test_alike(self):
+        # movements of other flags, feedrates or that do not extrude are kept
+        table = self.spiral(count=5)
+        table.flags[50] = 0
+        table.feedrate[70] = 3000
+        table.delta_e[90] = 0
+        coalesced = coalesce(table, 0.01)
+        lines = coalesced.vertices[:, 0] > 20
+        self.assertEqual(coalesced.flags[lines].tolist().count(0), 1)
+        self.assertEqual(coalesced.feedrate[lines].tolist().count(3000), 1)
+        self.assertEqual(coalesced.delta_e[lines].tolist().count(0), 1)
+        self.assertWithin(table, coalesced, 0.01)
+
+    def test_parsed(self):
+        # a zigzag does not collapse into a straight line
+        parser = GcodeParser(GcodeBulkLexer())
+        parser.load(b"G1 X0 Y0 Z0.2\nG1 X10 Y0 E1\nG1 X5 Y0 E2\nG1 X20 Y0 E3\n")
+        table = parser.parse()
+        coalesced = coalesce(table, 0.01)
+        self.assertEqual(coalesced.vertices.tolist(), table.vertices.tolist())
+
+        self.assertIs(coalesce(table, 0), table)
+        self.assertIs(coalesce(table, None), table)
+
+
+if __name__ == "__main__":
+    unittest.main()
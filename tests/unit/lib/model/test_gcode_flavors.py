@@ -0,0 +1,160 @@
+import unittest
+
+from tatlin.lib.model.gcode import flavors
+from tatlin.lib.model.gcode.flavors import detect_flavor, get_flavor
+from tatlin.lib.model.gcode.parser import (
+    ArgsDict,
+    GcodeBulkLexer,
+    GcodeLexer,
+    GcodeParser,
+    Movement,
+)
+
+OUTER = Movement.FLAG_PERIMETER | Movement.FLAG_PERIMETER_OUTER
+INNER = Movement.FLAG_PERIMETER
+LOOP = Movement.FLAG_LOOP
+
+
+class FlavorTest(unittest.TestCase):
+    def flags(self, flavor, commands, flags=0):
+        parser = GcodeParser(flavor=flavor)
+        parser.flags = flags
+        for line in commands:
+            parser.set_flags(GcodeLexer().scan_line(line))
+        return parser.flags
+
+    def test_detect(self):
+        headers = {
+            "skeinforge": "(This file has been sliced using Skeinforge 35)\n",
+            "slic3r": "; generated by Slic3r 1.3.0 on 2024-01-01 at 00:00:00\n",
+            "prusaslicer": "; generated by PrusaSlicer 2.6.0+linux-x64 on 2024\n",
+            "cura": ";FLAVOR:Marlin\n;TIME:6666\n",
+            "simplify3d": "; G-Code generated by Simplify3D(R) Version 4.1.2\n",
+            "klipper": "EXCLUDE_OBJECT_DEFINE NAME=cube CENTER=0,0\nG28\n",
+            "cnc": "(drill)\nG21\nG90\nM3 S12000\nG0 Z5\n",
+        }
+        for name, header in headers.items():
+            self.assertEqual(detect_flavor(header).name, name)
+            self.assertEqual(detect_flavor(header.encode()).name, name)
+
+        self.assertIs(detect_flavor(b"G28\nG1 X1 E1\n"), flavors.DEFAULT_FLAVOR)
+        self.assertIs(detect_flavor(b"M300 S440\nM30\n"), flavors.DEFAULT_FLAVOR)
+        # the first slicer named wins
+        header = "; SuperSlicer, a fork of Slic3r"
+        self.assertEqual(detect_flavor(header).name, "prusaslicer")
+
+    def test_get_flavor(self):
+        self.assertIs(get_flavor("cura"), flavors.CURA)
+        with self.assertRaises(ValueError):
+            get_flavor("marlin")
+        with self.assertRaises(ValueError):
+            GcodeParser(flavor="marlin")
+
+    def test_skeinforge(self):
+        flags = self.flags(
+            "skeinforge",
+            ["(<perimeter> outer )", "(<loop> outer )", "(</loop>)", "M101"],
+        )
+        self.assertEqual(flags, OUTER | Movement.FLAG_EXTRUDER_ON)
+        self.assertEqual(self.flags("skeinforge", ["(<perimeter> inner )"]), INNER)
+        self.assertEqual(self.flags("skeinforge", ["(</perimeter>)"], OUTER), 0)
+        self.assertEqual(self.flags("skeinforge", ["G20"]), Movement.FLAG_INCHES)
+
+    def test_slic3r(self):
+        self.assertEqual(self.flags("slic3r", ["G1 ; perimeter"]), OUTER)
+        flags = self.flags("slic3r", ["G1 ; perimeter", "G1 ; skirt"])
+        self.assertEqual(flags, OUTER | LOOP)
+        # lines without markers reset the flags, commands included
+        self.assertEqual(self.flags("slic3r", ["G1 ; perimeter", "G1 ; infill"]), 0)
+        self.assertEqual(self.flags("slic3r", ["M101"], LOOP), 0)
+
+    def test_features(self):
+        cases = {
+            "prusaslicer": (
+                ";TYPE:External perimeter",
+                ";TYPE:Perimeter",
+                ";TYPE:Skirt/Brim",
+                ";TYPE:Solid infill",
+            ),
+            "cura": (
+                ";TYPE:WALL-OUTER",
+                ";TYPE:WALL-INNER",
+                ";TYPE:SKIRT",
+                ";TYPE:FILL",
+            ),
+            "simplify3d": (
+                "; feature outer perimeter",
+                "; feature inner perimeter",
+                "; feature skirt",
+                "; feature infill",
+            ),
+            "klipper": (
+                ";TYPE:Outer wall",
+                ";TYPE:Inner wall",
+                ";TYPE:Brim",
+                ";TYPE:Support",
+            ),
+        }
+        extruder_on = Movement.FLAG_EXTRUDER_ON
+        for name, (outer, inner, skirt, other) in cases.items():
+            # features last until the next one, and leave other flags alone
+            flags = self.flags(name, [outer, "G1 X1", "M101"])
+            self.assertEqual(flags, OUTER | extruder_on, name)
+            self.assertEqual(self.flags(name, [outer, inner]), INNER, name)
+            self.assertEqual(self.flags(name, [inner, skirt]), LOOP, name)
+            flags = self.flags(name, [skirt, other], extruder_on)
+            self.assertEqual(flags, extruder_on, name)
+
+    def test_cnc(self):
+        flags = self.flags("cnc", ["M3 (<perimeter> outer )", "G1 (<loop>)"])
+        self.assertEqual(flags, Movement.FLAG_EXTRUDER_ON)
+        self.assertEqual(self.flags("cnc", ["M05"], Movement.FLAG_EXTRUDER_ON), 0)
+
+    def test_layer_marker(self):
+        parser = GcodeParser(flavor="skeinforge")
+        parser.set_flags(("", ArgsDict(), "(</layer>)"))
+        self.assertTrue(parser.new_layer)
+
+        parser = GcodeParser(flavor="cura")
+        parser.set_flags(("", ArgsDict(), "(</layer>)"))
+        self.assertFalse(parser.new_layer)
+
+    def test_cached_actions(self):
+        flavor = flavors.Flavor("test", [("marked", flavors.action(add=LOOP))])
+        flavor.max_cached = 2
+        for idx in range(5):
+            self.assertIsNone(flavor.action("G1", "; comment %d" % idx))
+            self.assertLessEqual(len(flavor._comment_actions), 2)
+        self.assertEqual(flavor.action("G1", "; marked")[1], LOOP)
+        self.assertEqual(flavor.action("G1", "; marked")[1], LOOP)
+
+    def test_parser_detects(self):
+        gcode = ";FLAVOR:Marlin\nG1 X1 Y1\n;TYPE:WALL-OUTER\nG1 X2 Y2 E1\n"
+        for lexer in (GcodeLexer(), GcodeBulkLexer()):
+            parser = GcodeParser(lexer)
+            self.assertIs(parser.flavor, flavors.DEFAULT_FLAVOR)
+            parser.load(gcode)
+            table = parser.parse()
+            self.assertIs(parser.flavor, flavors.CURA)
+            self.assertEqual(table.flags.tolist()[-1], OUTER)
+
+        # a flavor that is given is never detected
+        parser = GcodeParser(GcodeBulkLexer(), flavor="cnc")
+        parser.load(gcode)
+        self.assertEqual(parser.parse().flags.tolist()[-1], 0)
+
+    def test_state(self):
+        parser = GcodeParser(flavor="simplify3d")
+        state = parser.get_state()
+        self.assertEqual(state[5], "simplify3d")
+
+        other = GcodeParser(GcodeBulkLexer())
+        other.set_state(state)
+        other.load("; generated by Slic3r\n; feature skirt\nG1 X1\nG1 X2\n")
+        other.parse_continued()
+        self.assertIs(other.flavor, flavors.SIMPLIFY3D)
+        self.assertEqual(other.flags, LOOP)
+
+
+if __name__ == "__main__":
+    unittest.main()
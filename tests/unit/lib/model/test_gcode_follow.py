@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from tatlin.lib.model.gcode.follow import GcodeFollower
+from tatlin.lib.model.gcode.parser import GcodeBulkLexer, GcodeParser
+from tatlin.lib.model.gcode.table import MovementTable
+
+
+class GcodeFollowerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "growing.gcode")
+        self.follower = GcodeFollower(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data, mode="ab"):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def test_partial_lines(self):
+        self.write(b"G1 X1 Y1 Z0.2 E1\nG1 X2 Y1")
+        table = self.follower.read()
+        self.assertEqual(table.num_movements, 1)
+        self.assertEqual(self.follower.position, 17)
+
+        self.assertEqual(self.follower.read().num_movements, 0)
+
+        self.write(b"2 E2\n")
+        table = self.follower.read()
+        self.assertEqual(table.vertices.tolist(), [[2, 12, numpy.float32(0.2)]])
+        # the layer of the first movement only starts with the second one
+        self.assertEqual(table.layer_stops.tolist(), [0, 0, 1])
+
+    def test_same_as_whole_file(self):
+        with open("tests/fixtures/gcode/top.gcode", "rb") as f:
+            data = f.read()
+        parser = GcodeParser(GcodeBulkLexer())
+        parser.load(data)
+        expected = parser.parse()
+
+        self.write(b"", "wb")
+        table = MovementTable([], [], [], [], [0])
+        for start in range(0, len(data), 7919):
+            self.write(data[start : start + 7919])
+            table.extend(self.follower.read())
+
+        self.assertEqual(table.vertices.tolist(), expected.vertices.tolist())
+        self.assertEqual(table.flags.tolist(), expected.flags.tolist())
+        self.assertEqual(table.layer_stops.tolist(), expected.layer_stops.tolist())
+
+    def test_truncated(self):
+        self.write(b"G1 X1 Y1\nG1 X2 Y2\n")
+        self.follower.read()
+        self.write(b"G1 X1 Y1\n", "wb")
+        self.assertIsNone(self.follower.read())
+
+    def test_replaced(self):
+        self.write(b"G1 X1 Y1\n")
+        self.follower.read()
+        os.rename(self.path, self.path + ".old")
+        self.write(b"G1 X1 Y1\nG1 X2 Y2\n")
+        self.assertIsNone(self.follower.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
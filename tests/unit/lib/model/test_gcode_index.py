@@ -0,0 +1,154 @@
+import unittest
+
+import numpy
+
+from tatlin.lib.model.gcode.index import GcodeIndexer, GcodeLayerReader, build_index
+from tatlin.lib.model.gcode.parser import (
+    GcodeBulkLexer,
+    GcodeParser,
+    GcodeParserError,
+)
+
+
+class GcodeIndexTest(unittest.TestCase):
+    def parse(self, data):
+        parser = GcodeParser(GcodeBulkLexer())
+        parser.load(data)
+        return parser.parse()
+
+    def assertLayers(self, data, min_run=None, arcs=False):
+        expected = self.parse(data)
+        indexer = GcodeIndexer(data)
+        if min_run is not None:
+            indexer.min_run = min_run
+        index = indexer.build()
+        self.assertEqual(index.num_layers, expected.num_layers)
+
+        reader = GcodeLayerReader(data, index)
+        for idx in range(index.num_layers):
+            layer = reader.layer(idx)
+            rows = expected.layer_slice(idx)
+            self.assertEqual(layer.vertices.tolist(), expected.vertices[rows].tolist())
+            self.assertEqual(layer.flags.tolist(), expected.flags[rows].tolist())
+            self.assertEqual(layer.delta_e.tolist(), expected.delta_e[rows].tolist())
+            self.assertAlmostEqual(
+                index.heights[idx], float(expected.vertices[max(rows.start, 1), 2]), 5
+            )
+        if arcs:
+            # the box is around the whole circles of arcs
+            self.assertTrue((index.lower <= expected.vertices.min(0) + 1e-4).all())
+            self.assertTrue((index.upper >= expected.vertices.max(0) - 1e-4).all())
+            return
+        self.assertTrue(
+            numpy.allclose(index.lower, expected.vertices.min(0), atol=1e-4)
+        )
+        self.assertTrue(
+            numpy.allclose(index.upper, expected.vertices.max(0), atol=1e-4)
+        )
+
+    def test_files(self):
+        for fname in ("top.gcode", "slic3r.gcode"):
+            with open("tests/fixtures/gcode/" + fname, "rb") as f:
+                data = f.read()
+            # runs of moves with array operations, and through the parser
+            self.assertLayers(data)
+            self.assertLayers(data, min_run=1 << 30)
+
+    def test_state(self):
+        # modal commands between runs of moves
+        lines = ["G21", "G92 X10 Y-5"]
+        for layer in range(30):
+            lines.append("G1 Z%.2f F1200" % (0.3 * (layer + 1)))
+            if layer % 10 == 3:
+                lines.append("G91")
+                lines.extend("G1 X0.5 Y0.25 E0.1" for _ in range(20))
+                lines.append("G90")
+            if layer % 10 == 7:
+                lines.append("G92 X0 Y0 E0")
+            if layer == 12:
+                lines.append("G20 ; inches")
+            if layer == 15:
+                lines.append("G21")
+            if layer == 20:
+                lines.append("; </layer>")
+            lines.extend(
+                "G1 X%d Y%d E%.1f ; perimeter" % (i % 17, i % 13, i * 0.5)
+                for i in range(100)
+            )
+            lines.append("M103")
+        data = "\n".join(lines).encode()
+
+        self.assertLayers(data)
+        self.assertLayers(data, min_run=1)
+
+    def test_arcs(self):
+        lines = ["G21"]
+        for layer in range(20):
+            lines.append("G1 Z%.2f F1200" % (0.3 * (layer + 1)))
+            lines.append("G1 X20 Y10 E%d" % (layer * 10))
+            if layer == 5:
+                lines.append("G18")
+            if layer == 6:
+                lines.append("G17")
+            lines.extend(
+                "G%d X%d Y%d I%d J%d E%d" % (2 + i % 2, i % 17, i % 13, 5 - i % 9, 3, i)
+                for i in range(100)
+            )
+            lines.append("G3 X%d Y10 R-15 E1" % (layer % 5))
+        data = "\n".join(lines).encode()
+
+        self.assertLayers(data, arcs=True)
+        self.assertLayers(data, min_run=1, arcs=True)
+
+    def test_flavors(self):
+        # flavor markers between runs of moves
+        flavors = (
+            (
+                ";FLAVOR:Marlin\n;Generated with Cura_SteamEngine 5.0.0",
+                (";TYPE:WALL-OUTER", ";TYPE:FILL", ";TYPE:SKIRT"),
+            ),
+            (
+                "; generated by PrusaSlicer 2.6.0",
+                (";TYPE:External perimeter", ";TYPE:Solid infill", ";TYPE:Skirt/Brim"),
+            ),
+            (
+                "; G-Code generated by Simplify3D(R) Version 4.1.2",
+                ("; feature outer perimeter", "; feature infill", "; feature skirt"),
+            ),
+        )
+        for header, markers in flavors:
+            lines = [header, "G21"]
+            for layer in range(10):
+                lines.append("G1 Z%.2f F1200" % (0.3 * (layer + 1)))
+                for part, marker in enumerate(markers):
+                    lines.append(marker)
+                    e = layer * 300 + part * 100
+                    lines.extend(
+                        "G1 X%d Y%d E%d" % (i % 17, i % 13, e + i) for i in range(100)
+                    )
+            data = "\n".join(lines).encode()
+            self.assertEqual(len(set(self.parse(data).flags.tolist())), 3)
+            self.assertLayers(data)
+
+    def test_reader(self):
+        with open("tests/fixtures/gcode/top.gcode", "rb") as f:
+            data = f.read()
+        reader = GcodeLayerReader(data, build_index(data))
+        reader.max_resident = 2
+
+        first = reader.layer(1)
+        self.assertIs(reader.layer(1), first)
+        reader.layer(2)
+        reader.layer(3)
+        self.assertIsNot(reader.layer(1), first)
+
+        self.assertIsNone(reader.start_point(0))
+        self.assertEqual(len(reader.start_point(1)), 3)
+
+    def test_empty(self):
+        with self.assertRaises(GcodeParserError):
+            build_index(b"; nothing to see\nM104 S200\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
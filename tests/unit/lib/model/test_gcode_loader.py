@@ -1,5 +1,11 @@
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 from unittest.mock import Mock, call
+from tatlin.lib.gl.gcodemodel import LazyGcodeModel
+from tatlin.lib.model.baseloader import STDIN_PATH, determine_filetype
 from tatlin.lib.model.gcode.loader import GcodeModelLoader
 
 
@@ -21,4 +27,100 @@ class GcodeModelLoaderTest(unittest.TestCase):
             call("machine.platform_offset_z", float),
         ]
         config.read.return_value = 1
+        loader.use_cache = False
         loader.load(config, Mock(), Mock())
+
+    def test_load_cached(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            settings = {"cache.directory": tmpdir, "cache.max_size": 1}
+            config = Mock()
+            config.read.side_effect = lambda key, conv=None: settings.get(key)
+
+            loader = GcodeModelLoader("tests/fixtures/gcode/top.gcode")
+            model, _ = loader.load(config, Mock(), Mock())
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+            loader = GcodeModelLoader("tests/fixtures/gcode/top.gcode")
+            cached, _ = loader.load(config, Mock(), Mock())
+            self.assertEqual(cached.vertices.tolist(), model.vertices.tolist())
+            self.assertEqual(cached.layer_stops, model.layer_stops)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_load_lazy(self):
+        loader = GcodeModelLoader("tests/fixtures/gcode/top.gcode")
+        loader.lazy_min_size = 0
+        loader.use_cache = False
+
+        config = Mock()
+        config.read.return_value = 1
+        model, _ = loader.load(config, Mock(), Mock())
+
+        self.assertIsInstance(model, LazyGcodeModel)
+        self.assertEqual(model.max_layers, 42)
+        self.assertEqual(model.num_layers_to_draw, 42)
+
+    def test_load_streamed(self):
+        # with the settings left unset
+        config = Mock()
+        config.read.return_value = None
+
+        loader = GcodeModelLoader("tests/fixtures/gcode/top.gcode")
+        loader.use_cache = False
+        model = loader.read(config, Mock())
+
+        shown, appended = [], []
+
+        def preview(model, data=None):
+            # what the main thread does
+            if data is None:
+                shown.append((model.max_layers, model.vertex_buffer.array))
+            else:
+                model.append_data(data)
+                appended.append(data.num_movements)
+
+        loader = GcodeModelLoader("tests/fixtures/gcode/top.gcode")
+        loader.use_cache = False
+        loader.preview_size = 20000
+        streamed = loader.read(config, Mock(), preview)
+
+        # the first layers, then pieces of 40 kB, 80 kB and the remaining 110 kB
+        self.assertEqual(len(shown), 1)
+        self.assertLess(shown[0][0], model.max_layers)
+        self.assertEqual(len(appended), 3)
+        self.assertEqual(streamed.vertices.tolist(), model.vertices.tolist())
+        self.assertEqual(streamed.layer_stops, model.layer_stops)
+        self.assertEqual(streamed.kinds.tolist(), model.kinds.tolist())
+        # room for the whole file has been made up front
+        self.assertIs(streamed.vertex_buffer.array, shown[0][1])
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "requires named pipes")
+    def test_load_fifo(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fifo_path = os.path.join(tmpdir, "top.gcode")
+            os.mkfifo(fifo_path)
+
+            def write():
+                with open(fifo_path, "wb") as fifo:
+                    with open("tests/fixtures/gcode/top.gcode", "rb") as f:
+                        fifo.write(f.read())
+
+            writer = threading.Thread(target=write)
+            writer.start()
+
+            loader = GcodeModelLoader(fifo_path)
+            self.assertIsNone(loader.size)
+
+            config = Mock()
+            config.read.return_value = 1
+            loader.load(config, Mock(), Mock())
+            writer.join()
+
+            self.assertEqual(loader.size, 250980)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_stdin_filetype(self):
+        self.assertEqual(determine_filetype(STDIN_PATH), "gcode")
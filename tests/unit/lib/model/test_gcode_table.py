@@ -0,0 +1,82 @@
+import array
+import unittest
+
+import numpy
+
+from tatlin.lib.model.gcode.parser import Movement
+from tatlin.lib.model.gcode.table import MovementAttributes, MovementTable
+
+
+class MovementTableTest(unittest.TestCase):
+    def setUp(self):
+        self.layers = [
+            [
+                Movement(array.array("f", [0, 0.5, 0]), 0.0, 1200.0, 0),
+                Movement(array.array("f", [0.5, -0.5, 0]), 0.25, 1200.0, 16),
+            ],
+            [Movement(array.array("f", [0, 0.5, 1.0]), -1.0, 600.0, 3)],
+        ]
+        self.table = MovementTable.from_layers(self.layers)
+
+    def test_columns(self):
+        self.assertEqual(self.table.num_movements, 3)
+        self.assertEqual(self.table.num_layers, 2)
+        self.assertEqual(self.table.vertices.shape, (3, 3))
+        self.assertEqual(self.table.vertices.dtype, numpy.float32)
+        self.assertEqual(self.table.flags.dtype, numpy.uint8)
+        self.assertEqual(self.table.layer_stops.tolist(), [0, 2, 3])
+        self.assertEqual(self.table.z.tolist(), [0, 0, 1.0])
+        self.assertEqual(self.table.delta_e.tolist(), [0.0, 0.25, -1.0])
+        self.assertEqual(self.table.layer_slice(1), slice(2, 3))
+
+    def test_layers(self):
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(
+            [list(map(repr, layer)) for layer in self.table],
+            [list(map(repr, layer)) for layer in self.layers],
+        )
+        self.assertEqual(repr(self.table[-1][0]), repr(self.layers[1][0]))
+        with self.assertRaises(IndexError):
+            self.table[2]
+
+    def test_concatenate(self):
+        table = MovementTable.concatenate([self.table, self.table])
+
+        self.assertEqual(table.num_movements, 6)
+        self.assertEqual(table.layer_stops.tolist(), [0, 2, 3, 5, 6])
+        self.assertEqual(table.flags.tolist(), [0, 16, 3, 0, 16, 3])
+
+    def test_extend(self):
+        table = MovementTable.from_layers(self.layers)
+        more = MovementTable(
+            [[1, 1, 1], [2, 2, 2], [3, 3, 3]], [1, 1, 1], [60] * 3, [0] * 3, [0, 1, 3]
+        )
+        table.extend(more)
+
+        # the first layer of the other table continues the last layer
+        self.assertEqual(table.num_movements, 6)
+        self.assertEqual(table.layer_stops.tolist(), [0, 2, 4, 6])
+        self.assertEqual(table.x.tolist(), [0, 0.5, 0, 1, 2, 3])
+
+        table.extend(MovementTable([], [], [], [], [0]))
+        self.assertEqual(table.num_movements, 6)
+
+    def test_attributes(self):
+        movements = MovementAttributes.from_table(self.table, 1)
+        self.assertEqual(movements.num_movements, 2)
+        self.assertEqual(movements.z.tolist(), [0, 1.0])
+        self.assertEqual(movements.flags.tolist(), [16, 3])
+
+        # columns read from the cache are read-only, and copied when they grow
+        z = numpy.array([2.0], numpy.float32)
+        z.flags.writeable = False
+        movements = MovementAttributes([0.5], z, [0])
+        movements.extend(self.table, 1)
+        self.assertEqual(movements.delta_e.tolist(), [0.5, 0.25, -1.0])
+        self.assertEqual(movements.z.tolist(), [2.0, 0, 1.0])
+        self.assertEqual(movements.flags.tolist(), [0, 16, 3])
+        self.assertEqual(z.tolist(), [2.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
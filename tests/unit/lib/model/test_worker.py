@@ -0,0 +1,150 @@
+import unittest
+from unittest.mock import Mock
+
+from tatlin.lib.model.baseloader import ModelFileError
+from tatlin.lib.model.gcode.loader import GcodeModelLoader
+from tatlin.lib.model.worker import LoadWorker
+
+
+class FakeLoader(object):
+    path = "fake.gcode"
+
+    def __init__(self, steps=10, error=None):
+        self.steps = steps
+        self.error = error
+        self.model = Mock()
+        self.preview_model = Mock()
+
+    def read(self, config, progress_dlg, preview=None):
+        progress_dlg.stage("Reading file...")
+        for count in range(1, self.steps + 1):
+            progress_dlg.step(count, self.steps)
+            if count == 1 and preview is not None:
+                preview(self.preview_model)
+        if self.error is not None:
+            raise self.error
+        return self.model
+
+    def store(self, config, model):
+        self.stored = model
+
+
+class LoadWorkerTest(unittest.TestCase):
+    def setUp(self):
+        # calls queued for the main thread
+        self.queue = []
+        self.config = Mock()
+        self.config.read.return_value = None
+
+    def call_after(self, func, *args):
+        self.queue.append((func, args))
+
+    def run_queue(self):
+        while self.queue:
+            func, args = self.queue.pop(0)
+            func(*args)
+
+    def finish(self, worker):
+        # run the queue like the main thread would until the worker is done
+        worker.start()
+        while worker._thread.is_alive():
+            self.run_queue()
+            worker.join(0.01)
+        self.run_queue()
+
+    def worker(self, loader, **callbacks):
+        return LoadWorker(loader, self.config, Mock(), self.call_after, **callbacks)
+
+    def test_done(self):
+        loader = FakeLoader()
+        on_preview, on_done, on_error = Mock(), Mock(), Mock()
+        worker = self.worker(
+            loader, on_preview=on_preview, on_done=on_done, on_error=on_error
+        )
+        self.finish(worker)
+
+        on_preview.assert_called_once_with(loader.preview_model, None)
+        on_done.assert_called_once_with(loader.model)
+        on_error.assert_not_called()
+        self.assertIs(worker.model, loader.model)
+        self.assertIs(loader.stored, loader.model)
+
+        # the stage and the first and last steps, the rest are too close
+        progress_dlg = worker.progress_dlg
+        progress_dlg.stage.assert_called_once_with("Reading file...")
+        self.assertEqual(progress_dlg.step.call_count, 2)
+        progress_dlg.step.assert_called_with(10, 10)
+
+    def test_error(self):
+        error = ModelFileError("Parsing error")
+        on_done, on_error = Mock(), Mock()
+        worker = self.worker(
+            FakeLoader(error=error), on_done=on_done, on_error=on_error
+        )
+        self.finish(worker)
+        on_done.assert_not_called()
+        on_error.assert_called_once_with(error)
+        self.assertIs(worker.error, error)
+
+    def test_cancel(self):
+        on_preview, on_done, on_error = Mock(), Mock(), Mock()
+        worker = self.worker(
+            FakeLoader(), on_preview=on_preview, on_done=on_done, on_error=on_error
+        )
+        worker.cancel()
+        self.finish(worker)
+        self.assertTrue(worker.canceled)
+        self.assertIsNone(worker.model)
+        self.assertIsNone(worker.error)
+        on_error.assert_not_called()
+
+        # calls queued before canceling are dropped, and the worker waiting
+        # for the preview to be shown stops
+        loader = FakeLoader()
+        worker = self.worker(loader, on_preview=on_preview, on_done=on_done)
+        worker.start()
+        while not worker._thread.is_alive() or len(self.queue) < 3:
+            worker.join(0.01)
+        worker.cancel()
+        self.run_queue()
+        worker.join(60)
+        self.assertFalse(worker._thread.is_alive())
+        on_preview.assert_not_called()
+        on_done.assert_not_called()
+        self.assertFalse(hasattr(loader, "stored"))
+
+    def test_thread(self):
+        loader = GcodeModelLoader("tests/fixtures/gcode/top.gcode")
+        loader.use_cache = False
+        on_done = Mock()
+        worker = self.worker(loader, on_done=on_done)
+        worker.start()
+        worker.join(60)
+
+        self.run_queue()
+        on_done.assert_called_once_with(worker.model)
+        self.assertEqual(worker.model.max_layers, 42)
+
+    def test_thread_streamed(self):
+        loader = GcodeModelLoader("tests/fixtures/gcode/top.gcode")
+        loader.use_cache = False
+        loader.preview_size = 20000
+        previews = []
+
+        def on_preview(model, data=None):
+            if data is not None:
+                model.append_data(data)
+            previews.append(model)
+
+        on_done = Mock()
+        worker = self.worker(loader, on_preview=on_preview, on_done=on_done)
+        self.finish(worker)
+
+        # the model shown first is appended to on the main thread
+        self.assertEqual(len(previews), 4)
+        on_done.assert_called_once_with(previews[0])
+        self.assertEqual(previews[0].max_layers, 42)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import io
+import json
+import unittest
+
+from tatlin.lib import profiling
+from tatlin.lib.model.gcode.parser import (
+    GcodeBulkLexer,
+    GcodeParser,
+    ProfiledGcodeParser,
+)
+
+
+class LoadProfileTest(unittest.TestCase):
+    def test_stages(self):
+        load_profile = profiling.LoadProfile()
+        with load_profile.stage("parse.lex"):
+            pass
+        with load_profile.stage("parse.lex"):
+            pass
+        load_profile.add_time("model.colors", 0.5)
+        load_profile.count("lines", 100)
+        load_profile.count("lines", 50)
+        load_profile.stop()
+
+        result = load_profile.as_dict()
+        self.assertEqual(list(result["stages"]), ["parse.lex", "model.colors"])
+        self.assertEqual(result["stages"]["parse.lex"]["calls"], 2)
+        self.assertEqual(result["stages"]["model.colors"]["seconds"], 0.5)
+        self.assertEqual(result["counters"], {"lines": 150})
+        self.assertGreater(result["lines_per_second"], 0)
+        self.assertIsNone(result["bytes_per_second"])
+        self.assertEqual(load_profile.total_time, result["total_seconds"])
+
+        f = io.StringIO()
+        load_profile.dump(f)
+        self.assertEqual(json.loads(f.getvalue())["counters"], {"lines": 150})
+
+    def test_active(self):
+        self.assertIsNone(profiling.active())
+        with profiling.stage("nothing"):
+            profiling.count("nothing")
+
+        with profiling.profile() as load_profile:
+            self.assertIs(profiling.active(), load_profile)
+            with profiling.stage("model.arrows"):
+                profiling.count("vertices", 3)
+
+        self.assertIsNone(profiling.active())
+        self.assertEqual(list(load_profile.times), ["model.arrows"])
+        self.assertEqual(load_profile.counters, {"vertices": 3})
+
+    def test_parser(self):
+        with open("tests/fixtures/gcode/top.gcode", "rb") as f:
+            data = f.read()
+
+        parser = GcodeParser(GcodeBulkLexer())
+        parser.load(data)
+        expected = parser.parse()
+
+        load_profile = profiling.LoadProfile()
+        parser = ProfiledGcodeParser(GcodeBulkLexer(), load_profile)
+        parser.load(data)
+        result = parser.parse()
+
+        self.assertEqual(result.vertices.tolist(), expected.vertices.tolist())
+        self.assertEqual(result.flags.tolist(), expected.flags.tolist())
+        for stage in ("lex", "args", "flags", "movements"):
+            self.assertGreater(load_profile.times["parse." + stage], 0)
+        self.assertEqual(load_profile.counters["bytes"], len(data))
+        self.assertEqual(load_profile.counters["movements"], expected.num_movements)
+        self.assertEqual(
+            load_profile.calls["parse.args"], load_profile.counters["lines"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,6 +36,10 @@ class GcodePanelTest(GUITestCase):
     def test_on_reset_clicked(self):
         self.panel.on_reset_clicked(Mock())
 
+    def test_on_fit_clicked(self):
+        self.panel.on_fit_clicked(Mock())
+        self.mock_scene.fit_visible_layers.assert_called_once_with()
+
     def test_on_set_model_clicked(self):
         mock = Mock()
         mock.GetEventObject.return_value.GetValue.return_value = True